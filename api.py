@@ -0,0 +1,356 @@
+import os
+import sys
+import json
+import argparse
+import threading
+from email.parser import BytesParser
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from tracing import span, get_tracer
+
+MAX_INFLIGHT = int(os.environ.get("PIXELOFF_API_MAX_INFLIGHT", "8"))
+MAX_QUEUED_JOBS = int(os.environ.get("PIXELOFF_API_MAX_QUEUED_JOBS", "32"))
+MAX_UPLOAD_BYTES = int(float(os.environ.get("PIXELOFF_API_MAX_UPLOAD_MB", "25")) * 2**20)
+JOB_WAIT = float(os.environ.get("PIXELOFF_API_JOB_WAIT", "120"))
+STREAM_CHUNK = 256 * 1024
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _flag(value):
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+def _number(params, name, default=None, cast=int, minimum=None):
+    """Numeric parameter from query/body; bad client input is a 400, not a 500."""
+    value = params.get(name)
+    if value is None or value == "": return default
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, f"'{name}' must be a number, got {value!r}")
+    if minimum is not None and number < minimum:
+        raise ApiError(400, f"'{name}' must be at least {minimum}")
+    return number
+
+
+class PixelOffHandler(BaseHTTPRequestHandler):
+    """
+    JSON in, JSON or image bytes out. Heavy endpoints share MAX_INFLIGHT slots;
+    when they are all busy the request is refused with 429 instead of queueing
+    on the socket. 503 means the service is not ready or its queues are full.
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "PixelOff"
+    slots = threading.BoundedSemaphore(MAX_INFLIGHT)
+    inflight = 0
+    _inflight_lock = threading.Lock()
+
+    # --- plumbing ---
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        parsed = urlparse(self.path)
+        self.query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        path = parsed.path.rstrip("/") or "/"
+        route, arg = ROUTES.get((method, path)), None
+        if route is None and method == "GET" and path.startswith("/jobs/"):
+            route, arg = PixelOffHandler.job_status, path[len("/jobs/"):]
+            if arg.endswith("/result"):
+                route, arg = PixelOffHandler.job_result, arg[:-len("/result")]
+
+        with span("api.request", method=method, path=path if arg is None else "/jobs/{id}") as s:
+            try:
+                token = os.environ.get("PIXELOFF_API_TOKEN")
+                if token and self.headers.get("Authorization") != f"Bearer {token}":
+                    raise ApiError(401, "Missing or wrong bearer token")
+                if route is None:
+                    raise ApiError(404, f"No route for {method} {path}")
+                if route in HEAVY:
+                    if not self.slots.acquire(blocking=False):
+                        raise ApiError(429, f"All {MAX_INFLIGHT} processing slots are busy", retry_after=1)
+                    self._count(1)
+                    try:
+                        route(self) if arg is None else route(self, arg)
+                    finally:
+                        self._count(-1)
+                        self.slots.release()
+                else:
+                    route(self) if arg is None else route(self, arg)
+            except ApiError as e:
+                s.set(status=e.status)
+                # The request body may be unread: don't reuse this connection
+                self.close_connection = True
+                self._send_json({"error": str(e)}, e.status, retry_after=e.retry_after)
+            except (BrokenPipeError, ConnectionResetError):
+                s.fail("client disconnected")
+            except Exception as e:
+                s.fail(e)
+                self.close_connection = True
+                self._send_json({"error": f"Internal error: {e}"}, 500)
+
+    @classmethod
+    def _count(cls, delta):
+        with cls._inflight_lock:
+            cls.inflight += delta
+
+    def _body(self):
+        length = _number(self.headers, "Content-Length", 0, minimum=0)
+        if length > MAX_UPLOAD_BYTES:
+            raise ApiError(413, f"Body larger than {MAX_UPLOAD_BYTES // 2**20} MB")
+        return self.rfile.read(length) if length else b""
+
+    def _json_body(self):
+        body = self._body()
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            raise ApiError(400, "Body is not valid JSON")
+        # Query parameters fill in whatever the body leaves out
+        return {**self.query, **data}
+
+    def _send(self, status, content_type, length, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        for name, value in (headers or {}).items():
+            if value is not None: self.send_header(name, str(value))
+        self.end_headers()
+
+    def _send_json(self, payload, status=200, retry_after=None):
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self._send(status, "application/json; charset=utf-8", len(data),
+                   {"Retry-After": retry_after, "Connection": "close" if self.close_connection else None})
+        self.wfile.write(data)
+
+    def _send_bytes(self, data, mime, headers=None):
+        self._send(200, mime, len(data), headers)
+        self.wfile.write(data)
+
+    def _stream_file(self, path, mime, headers=None):
+        """Sends a file in STREAM_CHUNK pieces instead of loading it whole."""
+        self._send(200, mime, os.path.getsize(path), headers)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(STREAM_CHUNK), b""):
+                self.wfile.write(chunk)
+
+    def log_message(self, format, *args):
+        if _flag(os.environ.get("PIXELOFF_API_ACCESS_LOG", "0")):
+            super().log_message(format, *args)
+
+    # --- helpers ---
+    def _require_url(self, params):
+        url = params.get("url")
+        if not url:
+            raise ApiError(400, "'url' is required")
+        return url, _number(params, "img_index", 1, minimum=1)
+
+    def _require_browser(self):
+        from readiness import get_probe
+        readiness = get_probe().refresh().result()
+        if readiness is not None and not readiness["checks"].get("Chromium", {}).get("ok", False):
+            raise ApiError(503, f"Browser not ready: {readiness['checks'].get('Chromium', {}).get('detail', 'unknown')}", retry_after=30)
+
+    def _output_options(self, params):
+        from processor import OUTPUT_FORMATS
+        output_format = params.get("format", "png")
+        if output_format not in OUTPUT_FORMATS:
+            raise ApiError(400, f"format must be one of: {', '.join(OUTPUT_FORMATS)}")
+        return output_format, _flag(params.get("crop", False))
+
+    # --- endpoints ---
+    def health(self):
+        from readiness import get_probe
+        from models import get_warmup
+        self._send_json({
+            "readiness": get_probe().refresh().result(),
+            "models": get_warmup().status(),
+        })
+
+    def ready(self):
+        from readiness import get_probe
+        readiness = get_probe().refresh().result()
+        if readiness is None or not readiness["ready"]:
+            raise ApiError(503, "Not ready" if readiness else "Readiness checks still running", retry_after=5)
+        self._send_json({"ready": True})
+
+    def metrics(self):
+        from jobs import get_executor
+        from session_cache import get_session_cache
+        jobs = get_executor().stats()
+        sessions = get_session_cache().stats()
+        lines = [get_tracer().prometheus_text().rstrip("\n")]
+        lines += [
+            "# HELP pixeloff_api_inflight Requests holding a processing slot.",
+            "# TYPE pixeloff_api_inflight gauge",
+            f"pixeloff_api_inflight {PixelOffHandler.inflight}",
+            "# HELP pixeloff_jobs Background jobs by state.",
+            "# TYPE pixeloff_jobs gauge",
+        ]
+        lines += [f'pixeloff_jobs{{state="{state}"}} {jobs[state]}' for state in ("queued", "running")]
+        lines += [
+            "# HELP pixeloff_jobs_coalesced_total Requests that joined an in-flight job.",
+            "# TYPE pixeloff_jobs_coalesced_total counter",
+            f"pixeloff_jobs_coalesced_total {jobs['coalesced']}",
+            "# HELP pixeloff_model_sessions_bytes Estimated memory held by cached model sessions.",
+            "# TYPE pixeloff_model_sessions_bytes gauge",
+            f"pixeloff_model_sessions_bytes {sessions['bytes']}",
+        ]
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        self._send_bytes(data, "text/plain; version=0.0.4")
+
+    def resolve(self):
+        """POST {url} -> the post's slide URLs."""
+        from downloader import resolve_slides
+        params = self._json_body()
+        url, _ = self._require_url(params)
+        self._require_browser()
+        slides, source, errors = resolve_slides(url, refresh=_flag(params.get("refresh", False)))
+        if not slides:
+            raise ApiError(502, source or "No relay could resolve the post")
+        self._send_json({"slides": slides, "source": source, "errors": errors})
+
+    def download(self):
+        """POST {url, img_index} -> the original image (streamed), or its metadata with meta=1."""
+        from downloader import download_instagram_image
+        params = self._json_body()
+        url, img_index = self._require_url(params)
+        self._require_browser()
+        path, status, errors = download_instagram_image(url, img_index=img_index, refresh=_flag(params.get("refresh", False)))
+        if not path:
+            raise ApiError(502, status or "Download failed")
+        if _flag(params.get("meta", False)):
+            return self._send_json({"path": path, "source": status, "errors": errors})
+        self._stream_file(path, "image/jpeg", {"X-PixelOff-Source": status})
+
+    def remove_bg(self):
+        """
+        POST an image (raw body, or multipart field "image") -> the cutout.
+        Query: model, format (png/webp), crop, max_side, mask_only.
+        """
+        from processor import remove_background_bytes, OUTPUT_FORMATS
+        content_type = self.headers.get("Content-Type", "")
+        body = self._body()
+        if not body:
+            raise ApiError(400, "Empty body: send the image bytes or a multipart 'image' field")
+        if content_type.startswith("multipart/form-data"):
+            message = BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+            parts = [p for p in (message.get_payload() if message.is_multipart() else [])
+                     if p.get_param("name", header="content-disposition") in ("image", "file")]
+            if not parts:
+                raise ApiError(400, "Multipart body has no 'image' field")
+            body = parts[0].get_payload(decode=True)
+
+        output_format, crop = self._output_options(self.query)
+        data, error = remove_background_bytes(
+            body, model_name=self.query.get("model", "isnet-general-use"), output_format=output_format, crop=crop,
+            max_side=_number(self.query, "max_side", minimum=1),
+            mask_only=_flag(self.query.get("mask_only", False)),
+        )
+        if error:
+            raise ApiError(422, f"Background removal failed: {error}")
+        self._send_bytes(data, OUTPUT_FORMATS[output_format][0])
+
+    def pipeline(self):
+        """
+        POST {url, img_index, model, format, crop} -> download + removal as a
+        shared background job. Waits up to `wait` seconds (default JOB_WAIT) and
+        streams the result; 202 with the job id if it is still running.
+        """
+        from jobs import get_executor, submit_pipeline
+        params = self._json_body()
+        url, img_index = self._require_url(params)
+        self._output_options(params)
+        if get_executor().stats()["queued"] >= MAX_QUEUED_JOBS:
+            raise ApiError(503, "Job queue is full", retry_after=5)
+        self._require_browser()
+        try:
+            job = submit_pipeline(url, img_index=img_index, model_name=params.get("model", "isnet-general-use"))
+        except ValueError as e:
+            raise ApiError(400, str(e))
+        if not job.wait(_number(params, "wait", JOB_WAIT, cast=float, minimum=0)):
+            return self._send_json({"job": job.as_dict(), "result_url": f"/jobs/{job.id}/result"}, 202)
+        self._send_job_result(job, params)
+
+    def job_status(self, job_id):
+        from jobs import get_job
+        job = get_job(job_id)
+        if job is None:
+            raise ApiError(404, f"Unknown or expired job: {job_id}")
+        self._send_json(job.as_dict())
+
+    def job_result(self, job_id):
+        from jobs import get_job
+        job = get_job(job_id)
+        if job is None:
+            raise ApiError(404, f"Unknown or expired job: {job_id}")
+        if job.active:
+            raise ApiError(409, f"Job is {job.state}: {job.stage}", retry_after=2)
+        self._send_job_result(job, self.query)
+
+    def _send_job_result(self, job, params):
+        from processor import encode_file
+        result = job.result or {}
+        error = job.error or result.get("error")
+        if error or not result.get("output_path"):
+            raise ApiError(502, error or "Job produced no result")
+        output_format, crop = self._output_options(params)
+        headers = {"X-PixelOff-Source": result.get("source"), "X-PixelOff-Job": job.id}
+        if output_format == "png" and not crop:
+            return self._stream_file(result["output_path"], "image/png", headers)
+        data, mime = encode_file(result["output_path"], output_format, crop)
+        self._send_bytes(data, mime, headers)
+
+
+ROUTES = {
+    ("GET", "/health"): PixelOffHandler.health,
+    ("GET", "/ready"): PixelOffHandler.ready,
+    ("GET", "/metrics"): PixelOffHandler.metrics,
+    ("POST", "/resolve"): PixelOffHandler.resolve,
+    ("POST", "/download"): PixelOffHandler.download,
+    ("POST", "/remove-background"): PixelOffHandler.remove_bg,
+    ("POST", "/pipeline"): PixelOffHandler.pipeline,
+}
+# Endpoints that hold a processing slot (browser or model work)
+HEAVY = {PixelOffHandler.resolve, PixelOffHandler.download, PixelOffHandler.remove_bg, PixelOffHandler.pipeline}
+
+
+def serve(host="127.0.0.1", port=8600):
+    """Starts warm-up (browser probe + model sessions) and serves until interrupted."""
+    from readiness import get_probe
+    from models import get_warmup
+
+    get_probe().refresh()
+    get_warmup().start()
+    server = ThreadingHTTPServer((host, port), PixelOffHandler)
+    server.daemon_threads = True
+    print(f"[API] Listening on http://{host}:{port} ({MAX_INFLIGHT} processing slots)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PixelOff HTTP API (download + background removal).")
+    parser.add_argument("--host", default=os.environ.get("PIXELOFF_API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PIXELOFF_API_PORT", "8600")))
+    args = parser.parse_args()
+    serve(args.host, args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,36 +15,24 @@ st.set_page_config(
 
 
 try:
-    # Robust Dependency Check
+    # 🚀 Fast Cold Start (v5.2): readiness checks run in a background probe, the page renders right away
+    from readiness import get_probe, get_startup_report
+    startup = get_startup_report()
+    script_started = time.perf_counter()
+    probe = get_probe().refresh()
+    # Models are provisioned, loaded and warmed on a background thread (PIXELOFF_WARMUP_MODELS)
+    from models import get_warmup, clear_model_cache
+    get_warmup().start()
+
+    # Robust Dependency Check (cached probe result, no imports or subprocesses here)
     def check_dependencies():
+        readiness = probe.result()
+        if readiness is None:
+            return ["⏳ Checks still running in the background..."]
         results = []
-        # Check rembg/onnx
-        try:
-            import rembg
-            results.append("✅ rembg/onnx: OK")
-        except ImportError:
-            results.append("❌ rembg/onnx: Missing")
-        
-        # Check playwright
-        try:
-            from playwright.sync_api import sync_playwright
-            results.append("✅ Playwright: Installed")
-        except ImportError:
-            results.append("❌ Playwright: Missing")
-            
-        # Check Chromium path (Streamlit Cloud specific)
-        try:
-            import subprocess
-            import sys
-            cmd = [sys.executable, "-m", "playwright", "install", "--dry-run"]
-            res = subprocess.run(cmd, capture_output=True, text=True)
-            if "chromium" in res.stdout.lower():
-                results.append("✅ Browser Path: Confirmed")
-            else:
-                results.append("❓ Browser Path: Not verified")
-        except:
-            pass
-            
+        for name, check in readiness["checks"].items():
+            results.append(f"{'✅' if check['ok'] else '❌'} {name}: {check['detail']} ({check['ms']:.0f}ms)")
+        results.append(f"🕒 Checked {int(time.time() - readiness['checked_at'])}s ago")
         return results
 
     # Sidebar Title
@@ -54,39 +42,12 @@ try:
     model_info_placeholder = st.sidebar.empty()
 
     
-    # Chromium Check (v1.9)
-        # Chromium Check & Auto-Install (v2.0)
-    @st.cache_resource
-    def ensure_chromium_installed():
-        print("Checking/Installing Chromium...")
-        try:
-            from playwright.sync_api import sync_playwright
-            
-            # 1. Try to launch (Fastest check for actual usability)
-            try:
-                with sync_playwright() as p:
-                    p.chromium.launch(headless=True, args=['--no-sandbox', '--disable-setuid-sandbox'])
-                print("✅ Chromium is already installed and working.")
-                return True
-            except Exception as e:
-                print(f"⚠️ Browser launch failed, attempting install... ({e})")
-            
-            # 2. Install if launch failed
-            import subprocess
-            import sys
-            print("Installing Chromium...")
-            cmd = [sys.executable, "-m", "playwright", "install", "chromium"]
-            subprocess.run(cmd, check=True)
-            print("✅ Chromium installation command completed.")
-            return True
-            
-        except Exception as e:
-            print(f"❌ Critical: Chromium install/check failed: {e}")
-            return False
-
-    if not ensure_chromium_installed():
-        st.error("🚨 Critical Dependency Missing: Chromium Browser could not be installed. Check logs.")
-        st.stop()
+    # Chromium Check & Auto-Install (v5.2: background probe, launches/installs off the script thread)
+    readiness = probe.result()
+    if readiness is None:
+        st.sidebar.caption("⏳ Checking browser & model in the background...")
+    elif not readiness["checks"].get("Chromium", {}).get("ok", False):
+        st.sidebar.error("🚨 Chromium Browser is not working. Check logs or use 'Install Playwright Browsers'.")
 
 
     # 📂 Diagnostic Download (Always Visible in v1.8)
@@ -106,15 +67,16 @@ try:
         for res in check_dependencies():
             st.sidebar.write(res)
 
+    delete_model_files = st.sidebar.checkbox("Also delete downloaded model files", help="Models are downloaded again (~170 MB) on next use.")
     if st.sidebar.button("♻️ Clear Model Cache"):
         try:
-            import shutil
-            cache_path = os.path.expanduser("~/.u2net")
-            if os.path.exists(cache_path):
-                shutil.rmtree(cache_path, ignore_errors=False)
-                st.sidebar.success("Cache cleared!")
-            else:
-                st.sidebar.info("Cache already empty.")
+            # Safe clear: running removals finish with their session, new ones reload
+            report = clear_model_cache(delete_files=delete_model_files)
+            get_warmup().start()
+            st.sidebar.success(
+                f"Cache cleared! Sessions dropped: {', '.join(report['sessions_dropped']) or 'none'}"
+                + (f", files deleted: {', '.join(report['files_deleted'])}" if report["files_deleted"] else "")
+            )
         except Exception as e:
             st.sidebar.error(f"Could not clear cache: {e}")
 
@@ -126,6 +88,7 @@ try:
                 cmd = [sys.executable, "-m", "playwright", "install", "chromium"]
                 result = subprocess.run(cmd, capture_output=True, text=True)
                 if result.returncode == 0:
+                    probe.refresh(force=True)
                     st.sidebar.success("Browsers installed successfully!")
                 else:
                     st.sidebar.error("Installation failed.")
@@ -135,27 +98,35 @@ try:
 
     st.sidebar.divider()
 
+    run_benchmark = st.sidebar.checkbox("⚡ Include Performance Benchmark", help="Browser cold/warm start, model load, inference latency and disk speed (up to ~90s).")
     if st.sidebar.button("🚨 Run Full System Test"):
         with st.status("Running Diagnostics...", expanded=True) as status:
             st.write("Initializing diagnostic suite...")
             try:
-                from diagnostic_tool import SystemDiagnostics
-                diag = SystemDiagnostics()
+                diagnostic_tool = startup.timed_import("diagnostic_tool")
+                diag = diagnostic_tool.SystemDiagnostics()
                 
-                st.write("Checking System Resources...")
+                st.write(f"Checking System Resources (all checks in parallel, max {diag.deadline:g}s)...")
                 results = diag.run_all()
+                if run_benchmark:
+                    st.write("Measuring performance...")
+                    results["Performance"] = diag.run_performance()
                 
-                status.update(label="Diagnostics Complete", state="complete", expanded=False)
+                status.update(label=f"Diagnostics Complete ({results['Run Time (ms)'] / 1000:.1f}s)", state="complete", expanded=False)
                 
                 st.subheader("📊 Diagnostic Report")
                 
                 # Check for critical failures
-                browser_status = results.get("Browser Check", {}).get("Launch Test", "")
-                if "❌" in browser_status:
+                browser_ok, browser_status = diagnostic_tool.browser_health(results)
+                if not browser_ok:
                     st.error(f"CRITICAL: Browser Launch Failed! \n{browser_status}")
                 else:
                     st.success("Browser System looks healthy.")
                 
+                if "Performance" in results:
+                    with st.expander("⚡ Performance", expanded=True):
+                        st.json(results.pop("Performance"))
+
                 with st.expander("View Full Report", expanded=True):
                     st.json(results)
                     
@@ -222,43 +193,76 @@ try:
         if not url:
             st.error("Please enter a valid URL.")
         else:
-            with st.status("Starting Virtual Browser...", expanded=True) as status:
-                st.write("🌍 **Spinning up Headless Chrome...**")
-                try:
-                    import importlib
-                    import downloader
-                    importlib.reload(downloader)
-                    from downloader import download_instagram_image
-                    
-                    st.write("🕵️‍♂️ **Browsing Public Viewers (SnapInsta/SaveFree/Picuki)...**")
-                    image_path, caption, logs = download_instagram_image(url, img_index=slide_num)
-                    
-                    if not image_path:
-                        error_msg = caption if caption else "Unknown error"
-                        st.session_state['last_error'] = error_msg
-                        status.update(label="Extraction Failed", state="error", expanded=False)
-                        st.error(f"Download failed: {error_msg}")
-                        
-                        if st.session_state.get('debug_mode') or logs:
-                            with st.expander("Show detailed error logs"):
-                                st.write(error_msg)
-                                if logs:
-                                    st.write("---")
-                                    st.write("Attempt History:")
-                                    for log in logs: st.write(log)
-                    else:
-                        status.update(label="Image Found!", state="complete", expanded=False)
-                        st.success(f"✅ Downloaded via: **{caption}**")
-                        
-                        if logs:
-                            with st.expander("ℹ️ Extraction Details"):
-                                for log in logs: st.code(log, language="text")
-
-                        st.session_state['last_image'] = image_path
-                        st.session_state['last_error'] = ""
-                except Exception as e:
-                    status.update(label="Critical System Error", state="error")
-                    st.error(f"Error: {e}")
+            try:
+                # Background job (v5.3): shared by every session, identical requests join the same job
+                from jobs import submit_pipeline
+                job = submit_pipeline(url, img_index=slide_num, model_name=model_name)
+                st.session_state['job_id'] = job.id
+                st.session_state.pop('job_seen', None)
+                st.session_state.pop('job_report', None)
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+    def show_job():
+        """Polls the current job; the rest of the page stays usable meanwhile."""
+        from jobs import get_job
+        job = get_job(st.session_state.get('job_id'))
+        if job is None:
+            st.session_state['job_seen'] = st.session_state.get('job_id')  # Expired from the job history
+            return
+        if st.session_state.get('job_seen') == job.id:
+            return
+        if job.active:
+            with st.status(f"{job.stage} ({time.time() - job.created:.0f}s)", expanded=True):
+                if job.subscribers > 1:
+                    st.caption(f"👥 Shared with {job.subscribers - 1} other request(s) for the same post.")
+                for line in job.progress: st.write(line)
+            return
+
+        # Finished: hand the result to this session once, then re-run the page to show it
+        st.session_state['job_seen'] = job.id
+        result = job.result or {}
+        error = job.error or result.get("error")
+        st.session_state['job_report'] = (error, result.get("source"), result.get("logs") or [])
+        if result.get("image_path"):
+            # A removal error is shown (and retried) by the result section below
+            st.session_state['last_image'] = result["image_path"]
+            st.session_state['last_error'] = ""
+        else:
+            st.session_state['last_image'] = None
+            st.session_state['last_error'] = error or "Unknown error"
+        st.rerun()
+
+    if st.session_state.get('job_id') and st.session_state.get('job_seen') != st.session_state['job_id']:
+        # Readiness probe (warms the browser pool) runs in the background; jobs wait for browsers themselves
+        readiness = probe.result()
+        if readiness and not readiness["checks"].get("Chromium", {}).get("ok", False):
+            st.warning(f"⚠️ Browser check failed: {readiness['checks'].get('Chromium', {}).get('detail', 'unknown')}")
+        if hasattr(st, "fragment"):
+            st.fragment(run_every=1)(show_job)()
+        else:
+            show_job()
+            if st.session_state.get('job_seen') != st.session_state['job_id']:
+                time.sleep(1)
+                st.rerun()
+
+    job_report = st.session_state.get('job_report')
+    if job_report:
+        error_msg, source, logs = job_report
+        if not st.session_state.get('last_image'):
+            st.error(f"Download failed: {error_msg}")
+            if st.session_state.get('debug_mode') or logs:
+                with st.expander("Show detailed error logs"):
+                    st.write(error_msg)
+                    if logs:
+                        st.write("---")
+                        st.write("Attempt History:")
+                        for log in logs: st.write(log)
+        else:
+            st.success(f"✅ Downloaded via: **{source}**")
+            if logs:
+                with st.expander("ℹ️ Extraction Details"):
+                    for log in logs: st.code(log, language="text")
 
     # Universal Debug Section
     if url:
@@ -277,32 +281,34 @@ try:
                 with st.expander("📸 Visual Debug (Legacy)", expanded=True):
                     st.image(legacy_shot)
 
-        # 429 Guidance with Countdown (v2.1)
+        # 429 Guidance (v5.3): cooldowns come from the shared rate scheduler; the countdown ticks in the browser
         last_err = st.session_state.get('last_error', '')
+        from rate_limiter import get_scheduler
+        cooldowns = get_scheduler().cooldowns()
         
         # Sidebar IP Status Indicator
-        ip_status = "🟢 Healthy" if "429" not in last_err else "🔴 Flagged (429)"
-        st.sidebar.metric("Streamlit IP Status", ip_status, help="Green: Normal IPs. Red: Instagram is rate-limiting this server. Use Crawler Mode or wait.")
-
-        if not st.session_state.get('last_image') and "429" in last_err:
-            import time
-            if 'rate_limit_start' not in st.session_state:
-                st.session_state['rate_limit_start'] = time.time()
-            
-            elapsed = time.time() - st.session_state['rate_limit_start']
-            remaining = int(60 - elapsed)
-            
-            if remaining > 0:
-                st.warning(f"⚠️ **Instagram Rate Limit (429)**. Server block detected. Please wait **{remaining}s** before refreshing (F5).")
-                # Pro Tip for 2.1
-                st.info("💡 **v2.1 Crawler Mode** is now active. If this fails, the IP block is deep. Wait 60s and try a different link.")
-                time.sleep(1)
-                st.rerun()
-            else:
-                st.success("✅ **Cooldown complete!** You can now refresh (F5) and try again.")
-                if st.button("🔄 Try Again Now"):
-                    st.session_state.pop('rate_limit_start', None)
-                    st.rerun()
+        ip_status = "🟢 Healthy" if not cooldowns else f"🔴 Rate limited ({len(cooldowns)})"
+        st.sidebar.metric("Streamlit IP Status", ip_status, help="Green: no relay or CDN is rate-limiting this server. Red: some are cooling down after a 429; other relays are still tried.")
+
+        if not st.session_state.get('last_image') and cooldowns:
+            until = max(c["until"] for c in cooldowns.values())
+            st.warning(
+                "⚠️ **Rate limited (429)**: " + ", ".join(f"{key} ({c['reason']})" for key, c in cooldowns.items())
+                + f". Ready again at **{time.strftime('%H:%M:%S', time.localtime(until))}**; other relays are still tried meanwhile."
+            )
+            import streamlit.components.v1 as components
+            components.html(
+                f"""<div id="cd" style="font-family:sans-serif;color:#a15c00"></div><script>
+                var until = {until * 1000:.0f};
+                function tick() {{
+                    var left = Math.max(0, Math.round((until - Date.now()) / 1000));
+                    document.getElementById("cd").textContent = left > 0 ? "⏳ Cooldown: " + left + "s left" : "✅ Cooldown complete! You can try again now.";
+                    if (left > 0) setTimeout(tick, 1000);
+                }}
+                tick();
+                </script>""",
+                height=30,
+            )
         elif not st.session_state.get('last_image') and last_err:
             st.info("💡 **Tip**: If it keeps failing, try a different slide number or wait a few minutes. Check the 'Troubleshooting' sidebar for more tools.")
 
@@ -319,22 +325,71 @@ try:
         with col2:
             st.subheader("No Background")
             with st.spinner(f"Removing background..."):
+                startup.timed_import("processor")
                 from processor import remove_background
                 processed_path, error = remove_background(image_path, model_name=model_name)
             if processed_path:
+                from processor import encode_file, OUTPUT_FORMATS
+                output_format = st.selectbox("Format", list(OUTPUT_FORMATS), format_func=lambda f: "WebP (lossless, smaller)" if f == "webp" else "PNG")
+                crop = st.checkbox("✂️ Auto-crop to subject", value=False)
+
+                # Encode once per result/format; reruns reuse the bytes instead of reopening the file
+                export_key = (processed_path, os.path.getmtime(processed_path), output_format, crop)
+                if st.session_state.get('export_key') != export_key:
+                    st.session_state['export_data'] = encode_file(processed_path, output_format, crop)
+                    st.session_state['export_key'] = export_key
+                data, mime = st.session_state['export_data']
+
                 # Fixed deprecation warning
-                st.image(processed_path, caption="Result", width="stretch")
-                with open(processed_path, "rb") as file:
-                    st.download_button(
-                        label="⬇️ Download Processed Image",
-                        data=file,
-                        file_name="pixeloff_result.png",
-                        mime="image/png",
-                        type="primary"
-                    )
+                st.image(data, caption=f"Result ({len(data) / 1024:.0f} KB)", width="stretch")
+                st.download_button(
+                    label="⬇️ Download Processed Image",
+                    data=data,
+                    file_name=f"pixeloff_result{OUTPUT_FORMATS[output_format][1]}",
+                    mime=mime,
+                    type="primary"
+                )
             else:
                 st.error(f"Failed: {error}")
 
+    # Model Session Info (shared process-wide caches, survive reruns and sessions)
+    from session_cache import get_session_cache
+    from result_cache import get_result_cache
+    cache_stats = get_session_cache().stats()
+    result_stats = get_result_cache().stats()
+    warmup = get_warmup()
+    if warmup.running:
+        model_info_placeholder.caption("🔥 Warming up: " + ", ".join(f"{name} ({state['state']})" for name, state in warmup.status().items()))
+    elif cache_stats["models"]:
+        model_info_placeholder.caption(
+            f"🧠 Loaded models: {', '.join(cache_stats['models'])} "
+            f"(~{cache_stats['bytes'] / 2**20:.0f}/{cache_stats['max_bytes'] / 2**20:.0f} MB, "
+            f"{cache_stats['hits']} hits, {cache_stats['misses']} loads, {cache_stats['evictions']} evicted)\n\n"
+            f"⚡ Cached results: {result_stats['memory_hits'] + result_stats['disk_hits']} reused, "
+            f"{result_stats['misses']} computed"
+        )
+
+    # ⏱️ Per-stage timings (spans from downloader/processor, aggregated for this process)
+    with st.sidebar.expander("⏱️ Performance Traces"):
+        from tracing import get_tracer
+        tracer = get_tracer()
+        trace_rows = tracer.summary()
+        if trace_rows:
+            st.dataframe(trace_rows, hide_index=True, use_container_width=True)
+            st.download_button("📄 Spans (JSON Lines)", tracer.jsonl(), file_name="pixeloff_spans.jsonl", mime="application/jsonl")
+            st.download_button("📈 Metrics (Prometheus)", tracer.prometheus_text(), file_name="pixeloff_metrics.prom", mime="text/plain")
+        else:
+            st.caption("No spans recorded yet. Download an image to see where the time goes.")
+
+    # 🚀 Startup Report (first run of this process)
+    startup.phases.setdefault("first_script_run", round((time.perf_counter() - script_started) * 1000, 1))
+    startup.mark_first_paint()
+    with st.sidebar.expander("🚀 Startup Report"):
+        st.json(startup.as_dict())
+        readiness = probe.result()
+        if readiness:
+            st.caption(f"Readiness probe: {'ready' if readiness['ready'] else 'not ready'} in {readiness['duration_ms']:.0f}ms")
+
 except Exception as e:
     import traceback
     st.error("🚨 Critical App Error Detected")
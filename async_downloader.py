@@ -0,0 +1,418 @@
+import os
+import asyncio
+import time
+from urllib.parse import urlparse
+
+from browser_pool import LAUNCH_ARGS, DEFAULT_USER_AGENT
+from downloader import (
+    _ensure_dir, _extract_shortcode, _download_file, _download_slide, _recall_slides, _forget_slides, _out_of_range,
+    _parse_sssinstagram, _parse_fastdl, _parse_indown, _parse_savefree, _parse_imginn,
+    RACE_WIDTH, REQUEST_DEADLINE, RELAY_NAMES, RELAY_SLA, StageBudget, relay_url, _rate_limit_watcher,
+    RelayRace, _ordered_relays, _record_attempt,
+)
+from rate_limiter import get_scheduler, parse_retry_after, RATE_LIMIT_STATUSES
+from relay_scoreboard import get_scoreboard
+from download_cache import get_download_cache
+from route_policy import routed_async
+from tracing import span
+
+# --- ASYNC BROWSER POOL ---
+class _AsyncBrowserSlot:
+    """One Chromium in the async pool: lifetime uses, contexts open now, and whether it is draining."""
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.uses = 0
+        self.open = 0
+        self.draining = False  # Worn out or disconnected: no new contexts, replaced once idle
+
+
+class AsyncBrowserPool:
+    """
+    asyncio counterpart of browser_pool.BrowserPool. A few Chromium processes
+    each host at most `contexts_per_browser` concurrent contexts; run() waits
+    for a browser with room. A browser that reaches `max_uses` (or dies) is
+    marked draining: it takes no new contexts and is replaced once its open
+    contexts finish, so recycling also happens under steady load.
+    """
+
+    def __init__(self, browsers=2, contexts_per_browser=4, max_uses=50):
+        self.size = max(1, int(browsers))
+        self.contexts_per_browser = max(1, int(contexts_per_browser))
+        self.max_uses = max(1, int(max_uses))
+        self.launches = 0
+        self.recycles = 0
+        self.jobs_run = 0
+        self._playwright = None
+        self._slots = [None] * self.size  # _AsyncBrowserSlot or None
+        self._next = 0
+        # Created on first use: on Python 3.9 it binds to the loop current at construction
+        self._room = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _pick(self):
+        """Index of a slot that can take a context now (least busy first, round-robin on ties), or None."""
+        best = None
+        for offset in range(self.size):
+            index = (self._next + offset) % self.size
+            slot = self._slots[index]
+            if slot is not None and not slot.draining and not slot.browser.is_connected():
+                slot.draining = True
+            if slot is None or (slot.draining and slot.open == 0):
+                return index  # (Re)launch here
+            if not slot.draining and slot.open < self.contexts_per_browser:
+                if best is None or slot.open < self._slots[best].open:
+                    best = index
+        return best
+
+    async def _acquire(self):
+        from playwright.async_api import async_playwright
+
+        async with self._room:
+            while True:
+                index = self._pick()
+                if index is not None: break
+                await self._room.wait()
+            self._next = (index + 1) % self.size
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            slot = self._slots[index]
+            if slot is None or slot.draining:
+                if slot is not None:
+                    self.recycles += 1
+                    try: await slot.browser.close()
+                    except Exception: pass
+                slot = self._slots[index] = _AsyncBrowserSlot(
+                    await self._playwright.chromium.launch(headless=True, args=LAUNCH_ARGS))
+                self.launches += 1
+            slot.uses += 1
+            slot.open += 1
+            if slot.uses >= self.max_uses:
+                slot.draining = True
+            return slot
+
+    async def _release(self, slot):
+        async with self._room:
+            slot.open -= 1
+            self._room.notify_all()
+
+    async def run(self, fn, **context_options):
+        """Awaits fn(page) inside a fresh context and returns its result."""
+        if self._room is None:
+            self._room = asyncio.Condition()
+        slot = await self._acquire()
+        self.jobs_run += 1
+        options = {"user_agent": DEFAULT_USER_AGENT}
+        options.update(context_options)
+        context = None
+        try:
+            context = await slot.browser.new_context(**options)
+            page = await context.new_page()
+            return await fn(page)
+        finally:
+            if context is not None:
+                try: await context.close()
+                except Exception: pass
+            await self._release(slot)
+
+    def stats(self):
+        return {
+            "browsers": self.size,
+            "contexts_per_browser": self.contexts_per_browser,
+            "jobs": self.jobs_run,
+            "launches": self.launches,
+            "recycles": self.recycles,
+            "open_contexts": [slot.open if slot else 0 for slot in self._slots],
+        }
+
+    async def close(self):
+        for slot in self._slots:
+            if slot is not None:
+                try: await slot.browser.close()
+                except Exception: pass
+        self._slots = [None] * self.size
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+async def _goto(page, relay, url, timeout):
+    """Async counterpart of downloader._goto (429/503 -> rate scheduler cooldown + failed attempt)."""
+    page.on("response", _rate_limit_watcher(relay, url))
+    response = await page.goto(url, wait_until="domcontentloaded", timeout=timeout)
+    if response is not None and response.status in RATE_LIMIT_STATUSES:
+        get_scheduler().penalize(relay, response.status, parse_retry_after(response.headers.get("retry-after")))
+        raise RuntimeError(f"HTTP {response.status} from {relay}")
+    return response
+
+# --- CORE BROWSER ENGINE ---
+async def fetch_rendered_html(pool, url, target_dir, timeout=30000, ready_selector=None, relay=None):
+    """Async fetch_rendered_html: fully rendered HTML (JS executed)."""
+
+    async def _render(page):
+        html_content = ""
+        page_title = "Unknown"
+        error_log = ""
+        budget = StageBudget(timeout / 1000)
+
+        await page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined});")
+        try:
+            await _goto(page, relay or urlparse(url).hostname, url, budget.ms("navigate"))
+
+            # 🖱️ HUMANIZATION: Wiggle Mouse to pass weak CF checks (stepped moves, no sleeps)
+            try:
+                await page.mouse.move(100, 100, steps=5)
+                await page.mouse.move(200, 200, steps=5)
+                await page.evaluate("window.scrollTo(0, 500)")
+            except Exception: pass
+
+            try:
+                if ready_selector: await page.wait_for_selector(ready_selector, timeout=budget.ms("result"))
+                else: await page.wait_for_load_state("networkidle", timeout=budget.ms("result"))
+            except Exception: pass
+
+            budget.ms("extract")
+            page_title = await page.title()
+            await page.screenshot(path=os.path.join(target_dir, "debug_view.png"))
+            html_content = await page.content()
+        except Exception as e:
+            error_log = str(e)
+        return html_content, page_title, error_log
+
+    try:
+        return await pool.run(routed_async(relay or urlparse(url).hostname, _render), viewport={'width': 1920, 'height': 1080}, locale='en-US')
+    except Exception as e:
+        return "", "Unknown", f"Playwright Init Error: {e}"
+
+# --- RELAY METHODS ---
+
+async def _finish(slides, error, target_dir, shortcode, img_index, source_name):
+    # requests is blocking; keep the event loop free during the CDN transfer
+    return await asyncio.to_thread(_download_slide, slides, error, shortcode, target_dir, img_index, source_name)
+
+async def download_via_sssinstagram(pool, original_url, shortcode, target_dir, img_index=1):
+    """Method 1: SSSInstagram (Form)"""
+
+    async def _visit(page):
+        budget = StageBudget()
+        await _goto(page, "sssinstagram", relay_url("sssinstagram"), budget.ms("navigate"))
+        await page.wait_for_selector('input#main_page_text', timeout=budget.ms("navigate"))
+        await page.keyboard.press("Escape")
+
+        await page.fill('input#main_page_text', original_url, timeout=budget.ms("submit"))
+        await page.click('button#submit', timeout=budget.ms("submit"))
+
+        try: await page.wait_for_selector('.download-wrapper, .result-box', timeout=budget.ms("result"))
+        except Exception: return None, f"SSSInstagram: Timeout. Title: '{await page.title()}'"
+
+        budget.ms("extract")
+        slides = _parse_sssinstagram(await page.content())
+        if slides: return slides, None
+        return None, "SSSInstagram: No slides"
+
+    try: slides, error = await pool.run(routed_async("sssinstagram", _visit))
+    except Exception as e: return None, f"SSSInstagram Error: {e}"
+    return await _finish(slides, error, target_dir, shortcode, img_index, "SSSInstagram")
+
+async def download_via_fastdl(pool, original_url, shortcode, target_dir, img_index=1):
+    """Method 2: FastDL (Debug Mode)"""
+
+    async def _visit(page):
+        budget = StageBudget()
+        await _goto(page, "fastdl", relay_url("fastdl"), budget.ms("navigate"))
+        await page.wait_for_selector('input[type="text"]', timeout=budget.ms("navigate"))
+
+        await page.fill('input[type="text"]', original_url, timeout=budget.ms("submit"))
+        await page.keyboard.press("Enter")
+
+        try: await page.wait_for_selector('div.output-list, a[download]', timeout=budget.ms("result"))
+        except Exception: return None, f"FastDL: Timeout. Title: '{await page.title()}'"
+
+        budget.ms("extract")
+        slides, found_links = _parse_fastdl(await page.content())
+        if slides: return slides, None
+
+        debug_info = f"Found {len(found_links)} links, {len(slides)} matched. First 3 found: {found_links[:3]}"
+        return None, f"FastDL: No content. {debug_info}"
+
+    try: slides, error = await pool.run(routed_async("fastdl", _visit))
+    except Exception as e: return None, f"FastDL Error: {e}"
+    return await _finish(slides, error, target_dir, shortcode, img_index, "FastDL")
+
+async def download_via_indown(pool, shortcode, target_dir, img_index, original_url):
+    """Method 3: Indown (Relaxed)"""
+
+    async def _visit(page):
+        budget = StageBudget()
+        await _goto(page, "indown", relay_url("indown"), budget.ms("navigate"))
+        await page.wait_for_selector('input#link', timeout=budget.ms("navigate"))
+        await page.keyboard.press("Escape")
+
+        await page.fill('input#link', original_url, timeout=budget.ms("submit"))
+        await page.click('button[type="submit"]', timeout=budget.ms("submit"))
+
+        try: await page.wait_for_selector('#result', timeout=budget.ms("result"))
+        except Exception: return None, "Indown: Timeout"
+
+        budget.ms("extract")
+        slides = _parse_indown(await page.content())
+        if slides: return slides, None
+        return None, f"Indown: No slides. Found {len(slides)} potential links."
+
+    try: slides, error = await pool.run(routed_async("indown", _visit))
+    except Exception as e: return None, f"Indown Error: {e}"
+    return await _finish(slides, error, target_dir, shortcode, img_index, "Indown")
+
+async def download_via_savefree(pool, original_url, shortcode, target_dir, img_index=1):
+    """Method 3: SaveFree (Backup Form)"""
+
+    async def _visit(page):
+        budget = StageBudget()
+        await _goto(page, "savefree", relay_url("savefree"), budget.ms("navigate"))
+        await page.wait_for_selector('input#input-url', timeout=budget.ms("navigate"))
+
+        await page.fill('input#input-url', original_url, timeout=budget.ms("submit"))
+        await page.click('#btn-submit', timeout=budget.ms("submit"))
+
+        try: await page.wait_for_selector('.download-items', timeout=budget.ms("result"))
+        except Exception:
+            await page.screenshot(path=os.path.join(target_dir, "debug_savefree_fail.png"))
+            return None, "SaveFree: Timeout"
+
+        budget.ms("extract")
+        slides = _parse_savefree(await page.content())
+        if slides: return slides, None
+        return None, "SaveFree: No content found"
+
+    try: slides, error = await pool.run(routed_async("savefree", _visit))
+    except Exception as e: return None, f"SaveFree Error: {e}"
+    return await _finish(slides, error, target_dir, shortcode, img_index, "SaveFree")
+
+async def download_via_imginn(pool, shortcode, target_dir, img_index=1):
+    """Method 4: Imginn (Direct)"""
+    html, title, error = await fetch_rendered_html(pool, relay_url("imginn", shortcode=shortcode), target_dir, timeout=int(RELAY_SLA * 1000),
+                                                   ready_selector='.downloads a.btn-primary, img.img-fluid', relay="imginn")
+    if not html: return None, f"Imginn Browser Error: {error}"
+
+    slides = _parse_imginn(html)
+    if not slides: return None, f"Imginn: Content not found. Title: '{title}'"
+    slides = ["https:" + s if s.startswith("//") else s for s in slides]
+    return await _finish(slides, None, target_dir, shortcode, img_index, "Imginn")
+
+# --- ENTRY POINTS ---
+
+async def download_one(pool, url, target_dir="downloads", img_index=1, race_width=None, deadline=None, refresh=False):
+    """
+    Async download_instagram_image. Races the top `race_width` relays and
+    cancels the losers (their contexts close via pool.run's finally).
+    Returns (path, status, errors) like the sync version.
+    """
+    with span("download", engine="async") as s:
+        path, status, errors = await _download_one(pool, url, target_dir, img_index, race_width, deadline, refresh)
+        s.set(shortcode=_extract_shortcode(url), slide=img_index, status=status)
+        return path, status, errors
+
+async def _download_one(pool, url, target_dir, img_index, race_width, deadline, refresh):
+    shortcode = _extract_shortcode(url)
+    if not shortcode: return None, "Invalid URL", []
+    _ensure_dir(target_dir)
+
+    cache = get_download_cache(target_dir)
+    if refresh:
+        cache.invalidate(shortcode, img_index)
+        _forget_slides(shortcode)
+    cached = cache.get(shortcode, img_index)
+    if cached: return cached["path"], f"Cache: {cached['relay']}", []
+
+    slides, source_name = _recall_slides(shortcode)
+    if slides and len(slides) < img_index:
+        return None, _out_of_range(img_index, slides, source_name), []
+    if slides:
+        path, status = await asyncio.to_thread(_download_file, slides[img_index-1], target_dir, shortcode, img_index, source_name)
+        if path:
+            cache.put(shortcode, img_index, path, status)
+            return os.path.abspath(path), status, []
+        _forget_slides(shortcode)
+
+    relays = {
+        "sssinstagram": lambda: download_via_sssinstagram(pool, url, shortcode, target_dir, img_index),
+        "fastdl": lambda: download_via_fastdl(pool, url, shortcode, target_dir, img_index),
+        "indown": lambda: download_via_indown(pool, shortcode, target_dir, img_index, url),
+        "savefree": lambda: download_via_savefree(pool, url, shortcode, target_dir, img_index),
+        "imginn": lambda: download_via_imginn(pool, shortcode, target_dir, img_index),
+    }
+    scoreboard = get_scoreboard()
+    scheduler = get_scheduler()
+
+    def _scored(key):
+        async def _attempt():
+            delay = scheduler.reserve(key)
+            if delay is None:
+                return None, f"Rate limited: {key} cooling down for {scheduler.cooldown(key):.0f}s"
+            await asyncio.sleep(delay)
+            started = time.monotonic()
+            path, status = await relays[key]()
+            _record_attempt(scoreboard, key, started, path, status)
+            return path, status
+        return _attempt
+
+    race = RelayRace([(_scored(key), RELAY_NAMES[key]) for key in _ordered_relays(relays)],
+                     race_width or RACE_WIDTH, time.monotonic() + (deadline or REQUEST_DEADLINE))
+    _start = lambda factory: asyncio.ensure_future(factory())
+    try:
+        race.launch(_start)
+        while race.running:
+            left = race.left()
+            if left <= 0: break
+            done, _ = await asyncio.wait(list(race.running), timeout=left, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try: path, status = task.result()
+                except Exception as e: path, status = None, f"Error: {e}"
+                if race.settle(task, path, status):
+                    if not path: return None, status, race.errors
+                    cache.put(shortcode, img_index, path, status)
+                    return os.path.abspath(path), status, race.errors
+            race.launch(_start)
+
+        # Tasks cut off by the deadline never report back: score them as timeouts here
+        keys = {display: key for key, display in RELAY_NAMES.items()}
+        for name, started in race.running.values():
+            scoreboard.record(keys[name], False, time.monotonic() - started, "timeout")
+        race.expire()
+        return None, " | ".join(race.errors), race.errors
+    finally:
+        for task in race.running:
+            task.cancel()
+        if race.running:
+            await asyncio.gather(*race.running, return_exceptions=True)
+
+async def download_many(urls, concurrency=8, target_dir="downloads", img_index=1, browsers=2, contexts_per_browser=4, pool=None):
+    """
+    Resolves many posts at once over a few shared browsers.
+    `concurrency` caps posts in flight; results come back in input order.
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = AsyncBrowserPool(browsers=browsers, contexts_per_browser=contexts_per_browser)
+    gate = asyncio.Semaphore(max(1, int(concurrency)))
+
+    async def _one(url):
+        async with gate:
+            try:
+                return await download_one(pool, url, target_dir, img_index)
+            except Exception as e:
+                return None, f"Critical Error: {e}", []
+
+    try:
+        return await asyncio.gather(*[_one(url) for url in urls])
+    finally:
+        if own_pool:
+            await pool.close()
+
+def download_instagram_image(url, target_dir="downloads", img_index=1):
+    """Sync wrapper with the same signature as downloader.download_instagram_image."""
+    return asyncio.run(download_many([url], concurrency=1, target_dir=target_dir, img_index=img_index, browsers=1))[0]
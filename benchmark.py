@@ -0,0 +1,395 @@
+import os
+import io
+import sys
+import json
+import time
+import zlib
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# --- SAMPLE IMAGE CORPUS ---
+CORPUS_SIZES = {
+    "small": (640, 800),
+    "medium": (1080, 1350),
+    "large": (3024, 4032),
+}
+
+def make_sample_image(size, seed=0):
+    """Deterministic photo-like JPEG: gradient backdrop, a subject blob and sensor noise."""
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFilter
+
+    width, height = size
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    backdrop = np.stack([x * 255 // max(1, width), y * 255 // max(1, height), np.full_like(x, 90 + seed * 20 % 120)], axis=-1)
+    img = Image.fromarray(backdrop.astype(np.uint8), "RGB")
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((width * 0.25, height * 0.15, width * 0.75, height * 0.9), fill=(200, 120 + seed % 100, 80))
+    draw.rectangle((width * 0.4, height * 0.05, width * 0.6, height * 0.3), fill=(240, 210, 180))
+    img = img.filter(ImageFilter.GaussianBlur(2))
+    noisy = np.asarray(img, dtype=np.int16) + rng.integers(-8, 9, (height, width, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8)).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+# --- STAND-IN RELAYS AND CDN ---
+# Each page mimics the form and result DOM the relay scraper waits for; results appear after `delay` ms.
+_PAGE = """<!doctype html><html><head><title>{title}</title></head><body>
+{form}
+<div id="out"></div>
+<script>
+var RESULT = {result};
+function showResult() {{ setTimeout(function () {{ document.getElementById('out').innerHTML = RESULT; }}, {delay}); }}
+</script></body></html>"""
+
+RELAY_FORMS = {
+    "sssinstagram": (
+        '<input id="main_page_text" type="text"><button id="submit" onclick="showResult()">Download</button>',
+        '<div class="download-wrapper">{links}</div>', '<a href="{href}">Download</a>',
+    ),
+    "fastdl": (
+        '<form onsubmit="showResult(); return false;"><input type="text" name="url"></form>',
+        '<div class="output-list">{links}</div>', '<a download href="{href}">Download</a>',
+    ),
+    "indown": (
+        '<input id="link" type="text"><button type="submit" onclick="showResult()">Download</button>',
+        '<div id="result">{links}</div>', '<a href="{href}">Download</a>',
+    ),
+    "savefree": (
+        '<input id="input-url" type="text"><button id="btn-submit" onclick="showResult()">Download</button>',
+        '<div class="download-items">{links}</div>', '<div class="download-item"><a class="download-btn" href="{href}">Download</a></div>',
+    ),
+}
+# Relay id -> stand-in path (imginn renders its result server-side)
+RELAY_PATHS = {
+    "sssinstagram": "/sssinstagram/en",
+    "fastdl": "/fastdl/en",
+    "indown": "/indown/",
+    "savefree": "/savefree/en",
+    "imginn": "/imginn/p/{shortcode}/",
+}
+
+
+class StandInServer:
+    """
+    One local HTTP server hosting all relay stand-ins and a fake CDN at
+    /cdn/<size>/<name>.jpg. `failing` relays answer 429 like a rate-limited relay.
+    """
+
+    def __init__(self, image_size="medium", slides=3, delay_ms=300, failing=()):
+        self.image_size = image_size
+        self.slides = slides
+        self.delay_ms = delay_ms
+        self.failing = set(failing)
+        self.corpus = {name: make_sample_image(size, seed) for seed, (name, size) in enumerate(CORPUS_SIZES.items())}
+        self.requests = {}
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="benchmark-standins", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def relay_urls(self):
+        return {relay: self.base_url + path for relay, path in RELAY_PATHS.items()}
+
+    def _links(self, item, shortcode="post"):
+        return "".join(
+            item.format(href=f"{self.base_url}/cdn/{self.image_size}/{shortcode}_{i}.jpg?sig=bench")
+            for i in range(1, self.slides + 1)
+        )
+
+    def render(self, relay, shortcode="post"):
+        if relay == "imginn":
+            time.sleep(self.delay_ms / 1000)
+            links = self._links('<a class="btn btn-primary" href="{href}">Download</a>', shortcode)
+            return f'<!doctype html><html><head><title>imginn</title></head><body><div class="downloads">{links}</div></body></html>'
+        form, wrapper, item = RELAY_FORMS[relay]
+        result = wrapper.format(links=self._links(item, shortcode))
+        return _PAGE.format(title=relay, form=form, result=json.dumps(result), delay=self.delay_ms)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if content_type == "image/jpeg":
+                    self.send_header("ETag", f'"{zlib.crc32(body):x}"')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                parts = path.strip("/").split("/")
+                relay = parts[0]
+                server.requests[relay] = server.requests.get(relay, 0) + 1
+
+                if relay == "cdn" and len(parts) == 3 and parts[1] in server.corpus:
+                    return self._send(200, server.corpus[parts[1]], "image/jpeg")
+                if relay in server.failing:
+                    return self._send(429, b"Too Many Requests", "text/plain")
+                if relay in RELAY_PATHS:
+                    shortcode = parts[2] if relay == "imginn" and len(parts) > 2 else "post"
+                    return self._send(200, server.render(relay, shortcode).encode("utf-8"), "text/html; charset=utf-8")
+                self._send(404, b"Not Found", "text/plain")
+
+        return Handler
+
+
+# --- MEASUREMENT ---
+def _percentile(values, pct):
+    if not values: return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def _latency_summary(seconds):
+    ms = [s * 1000 for s in seconds]
+    return {
+        "count": len(ms),
+        "p50_ms": round(_percentile(ms, 50), 1) if ms else None,
+        "p95_ms": round(_percentile(ms, 95), 1) if ms else None,
+        "mean_ms": round(sum(ms) / len(ms), 1) if ms else None,
+        "max_ms": round(max(ms), 1) if ms else None,
+    }
+
+
+class RssSampler:
+    """Samples RSS of this process plus its children (Chromium, pool workers) and keeps the peak."""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="benchmark-rss", daemon=True)
+
+    def _sample(self):
+        import psutil
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try: total += child.memory_info().rss
+            except psutil.Error: pass
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            try: self.peak_bytes = max(self.peak_bytes, self._sample())
+            except Exception: return
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def peak_mb(self):
+        return round(self.peak_bytes / 2**20, 1)
+
+
+def _short(error):
+    return str(error).splitlines()[0][:200] if error else error
+
+def _browser_stats():
+    from browser_pool import get_pool
+    return get_pool().stats()
+
+def bench_download(iterations, concurrency, target_dir, run_id):
+    """End-to-end download_instagram_image against the stand-ins (cold cache: a new shortcode per call)."""
+    from downloader import download_instagram_image
+
+    def _one(i):
+        started = time.perf_counter()
+        try:
+            result = download_instagram_image(f"https://www.instagram.com/p/BENCH{run_id}x{i}/", target_dir=target_dir)
+            path, status = result[0], result[1]
+        except Exception as e:
+            path, status = None, f"Critical Error: {e}"
+        return time.perf_counter() - started, path, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        results = list(executor.map(_one, range(iterations)))
+    wall = time.perf_counter() - started
+
+    ok = [r for r in results if r[1]]
+    statuses = {}
+    for _, path, status in ok:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        "latency": _latency_summary([r[0] for r in ok]),
+        "throughput_per_s": round(len(ok) / wall, 2) if wall else None,
+        "ok": len(ok),
+        "failed": len(results) - len(ok),
+        "errors": sorted({_short(r[2]) for r in results if not r[1]})[:5],
+        "winners": statuses,
+        "browser": _browser_stats(),
+    }
+
+def bench_relays(iterations, target_dir, run_id):
+    """Each relay resolver on its own, so one relay's regression is not hidden by the race."""
+    import downloader
+
+    resolvers = {
+        "sssinstagram": lambda url, code: downloader.resolve_via_sssinstagram(url),
+        "fastdl": lambda url, code: downloader.resolve_via_fastdl(url),
+        "indown": lambda url, code: downloader.resolve_via_indown(url),
+        "savefree": lambda url, code: downloader.resolve_via_savefree(url, target_dir),
+        "imginn": lambda url, code: downloader.resolve_via_imginn(code, target_dir),
+    }
+    report = {}
+    for relay, resolve in resolvers.items():
+        timings, errors = [], set()
+        for i in range(iterations):
+            shortcode = f"BENCH{run_id}{relay}{i}"
+            started = time.perf_counter()
+            slides, error = resolve(f"https://www.instagram.com/p/{shortcode}/", shortcode)
+            if slides: timings.append(time.perf_counter() - started)
+            else: errors.add(_short(error))
+        report[relay] = {"latency": _latency_summary(timings), "failed": iterations - len(timings), "errors": sorted(errors)[:3]}
+    return report
+
+def bench_removal(server, sizes, iterations, model_name, target_dir):
+    """remove_background per corpus size; the first call (model load + warm-up) is reported apart."""
+    from processor import remove_background
+
+    report = {}
+    for size in sizes:
+        input_path = os.path.join(target_dir, f"corpus_{size}.jpg")
+        with open(input_path, "wb") as f:
+            f.write(server.corpus[size])
+        timings, error = [], None
+        for i in range(iterations + 1):
+            started = time.perf_counter()
+            path, error = remove_background(input_path, model_name=model_name, use_cache=False, use_pool=False)
+            elapsed = time.perf_counter() - started
+            if not path: break
+            if i > 0: timings.append(elapsed)
+            elif "first_call_ms" not in report: report["first_call_ms"] = round(elapsed * 1000, 1)
+        report[size] = {"pixels": CORPUS_SIZES[size][0] * CORPUS_SIZES[size][1], "latency": _latency_summary(timings), "error": _short(error)}
+    return report
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except Exception:
+        return None
+
+def compare(previous, current):
+    """Prints p50/p95 changes between two benchmark JSON reports."""
+    def _rows(report, prefix=""):
+        for key, value in report.items():
+            if isinstance(value, dict) and "p50_ms" in value:
+                yield prefix + key, value
+            elif isinstance(value, dict):
+                yield from _rows(value, f"{prefix}{key}.")
+
+    before = dict(_rows(previous))
+    for name, now in _rows(current):
+        then = before.get(name)
+        if not then or not then.get("p50_ms") or not now.get("p50_ms"): continue
+        change = (now["p50_ms"] - then["p50_ms"]) / then["p50_ms"] * 100
+        print(f"{name:45s} p50 {then['p50_ms']:>9} -> {now['p50_ms']:>9} ms ({change:+.1f}%)   "
+              f"p95 {then['p95_ms']} -> {now['p95_ms']} ms")
+
+
+def run(args):
+    work_dir = tempfile.mkdtemp(prefix="pixeloff-bench-")
+    # Keep the real scoreboard and caches out of the measurement
+    os.environ["PIXELOFF_SCOREBOARD"] = os.path.join(work_dir, "relay_scoreboard.json")
+    # Stand-ins need no politeness pacing (set these explicitly to benchmark with it)
+    for name in ("PIXELOFF_RELAY_RATE", "PIXELOFF_RELAY_BURST", "PIXELOFF_CDN_RATE", "PIXELOFF_CDN_BURST"):
+        os.environ.setdefault(name, "1000")
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        }
+    }
+    run_id = int(time.time())
+    try:
+        with StandInServer(args.image_size, args.slides, args.delay_ms, args.fail_relays.split(",") if args.fail_relays else ()) as server, RssSampler() as rss:
+            for relay, url in server.relay_urls().items():
+                os.environ[f"PIXELOFF_RELAY_URL_{relay.upper()}"] = url
+            print(f"[Bench] Stand-ins at {server.base_url} (work dir {work_dir})")
+
+            if not args.skip_download:
+                print(f"[Bench] Download: {args.iterations} posts, concurrency {args.concurrency}")
+                report["download"] = bench_download(args.iterations, args.concurrency, os.path.join(work_dir, "downloads"), run_id)
+                if args.per_relay:
+                    print("[Bench] Per-relay resolvers")
+                    report["relays"] = bench_relays(max(1, args.iterations // 4), os.path.join(work_dir, "downloads"), run_id)
+            if not args.skip_removal:
+                sizes = [s for s in args.sizes.split(",") if s in CORPUS_SIZES]
+                print(f"[Bench] Background removal: {', '.join(sizes)} x {args.removal_iterations}")
+                report["removal"] = bench_removal(server, sizes, args.removal_iterations, args.model, work_dir)
+            report["requests_served"] = dict(server.requests)
+        report["peak_rss_mb"] = rss.peak_mb
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline PixelOff benchmark against local relay stand-ins.")
+    parser.add_argument("--iterations", type=int, default=20, help="Posts to download")
+    parser.add_argument("--concurrency", type=int, default=2, help="Concurrent downloads")
+    parser.add_argument("--per-relay", action="store_true", help="Also time each relay resolver on its own")
+    parser.add_argument("--image-size", default="medium", choices=list(CORPUS_SIZES), help="Image size served by the fake CDN")
+    parser.add_argument("--slides", type=int, default=3, help="Slides per stand-in post")
+    parser.add_argument("--delay-ms", type=int, default=300, help="Stand-in relay result delay")
+    parser.add_argument("--fail-relays", default="", help="Comma-separated relays that answer 429")
+    parser.add_argument("--sizes", default="small,medium,large", help="Corpus sizes for background removal")
+    parser.add_argument("--removal-iterations", type=int, default=3, help="Timed removals per size (after one warm-up)")
+    parser.add_argument("--model", default="isnet-general-use")
+    parser.add_argument("--skip-download", action="store_true")
+    parser.add_argument("--skip-removal", action="store_true")
+    parser.add_argument("--output", help="Report path (default benchmarks/<commit>-<time>.json)")
+    parser.add_argument("--compare", metavar="FILE", help="Previous report to compare against")
+    args = parser.parse_args()
+
+    report = run(args)
+    output = args.output or os.path.join("benchmarks", f"{report['meta']['commit'] or 'local'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"\n[Bench] Report saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import os
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from tracing import span, bind
+
+# Shared stealth launch flags (v5.1)
+LAUNCH_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-blink-features=AutomationControlled', # 🕵️ Hide automation flag
+    '--disable-infobars',
+    '--window-size=1920,1080'
+]
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
+
+_STOP = object()
+
+
+class PooledBrowser:
+    """
+    One long-lived Chromium process owned by a dedicated worker thread.
+    Playwright's sync API is bound to the thread that started it, so every
+    job submitted to this browser runs on the same thread.
+    """
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.jobs = queue.Queue()
+        self.uses = 0
+        self.launches = 0
+        self.recycles = 0
+        self._playwright = None
+        self._browser = None
+        self._thread = threading.Thread(target=self._loop, name=f"pixeloff-browser-{index}", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, context_options):
+        future = Future()
+        # bind: the job's spans nest under the caller's span on this worker thread
+        self.jobs.put((bind(self._run), fn, context_options, future))
+        return future
+
+    def stop(self, timeout=10):
+        self.jobs.put(_STOP)
+        self._thread.join(timeout)
+
+    # --- Worker thread only below ---
+
+    def _loop(self):
+        while True:
+            job = self.jobs.get()
+            if job is _STOP:
+                self._close()
+                return
+            run, fn, context_options, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(run(fn, context_options))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def _healthy(self):
+        try:
+            return self._browser is not None and self._browser.is_connected()
+        except Exception:
+            return False
+
+    def _launch(self):
+        from playwright.sync_api import sync_playwright
+
+        with span("browser.launch", browser=self.index):
+            if self._playwright is None:
+                self._playwright = sync_playwright().start()
+            self._browser = self._playwright.chromium.launch(headless=True, args=self.pool.launch_args)
+        self.uses = 0
+        self.launches += 1
+        print(f"[BrowserPool] Chromium #{self.index} launched (launch {self.launches})")
+
+    def _recycle(self, reason):
+        print(f"[BrowserPool] Recycling Chromium #{self.index}: {reason}")
+        self.recycles += 1
+        try:
+            if self._browser is not None: self._browser.close()
+        except Exception: pass
+        self._browser = None
+
+    def _run(self, fn, context_options):
+        # Health check: relaunch if the process died since the last job
+        if self._browser is not None and not self._healthy():
+            self._recycle("browser disconnected")
+        if self._browser is None:
+            self._launch()
+
+        options = {"user_agent": DEFAULT_USER_AGENT}
+        options.update(context_options)
+        with span("browser.new_context", browser=self.index):
+            context = self._browser.new_context(**options)
+        try:
+            page = context.new_page()
+            return fn(page)
+        finally:
+            try: context.close()
+            except Exception: pass
+            self.uses += 1
+            if not self._healthy():
+                self._recycle("crashed during job")
+            elif self.uses >= self.pool.max_uses:
+                self._recycle(f"reached {self.uses} uses")
+
+    def _close(self):
+        try:
+            if self._browser is not None: self._browser.close()
+        except Exception: pass
+        try:
+            if self._playwright is not None: self._playwright.stop()
+        except Exception: pass
+        self._browser = None
+        self._playwright = None
+
+
+class BrowserPool:
+    """
+    Keeps `size` warm Chromium processes and hands each job a fresh, isolated
+    BrowserContext. At most `size` contexts are open at once; callers block
+    until a browser is free.
+    """
+
+    def __init__(self, size=1, max_uses=50, launch_args=None):
+        self.size = max(1, int(size))
+        self.max_uses = max(1, int(max_uses))
+        self.launch_args = launch_args or LAUNCH_ARGS
+        self._idle = queue.Queue()
+        self._browsers = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.jobs_run = 0
+
+    def _start(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Browser pool is shut down")
+            if not self._browsers:
+                for i in range(self.size):
+                    browser = PooledBrowser(self, i)
+                    self._browsers.append(browser)
+                    self._idle.put(browser)
+
+    def run(self, fn, timeout=None, cancel=None, **context_options):
+        """
+        Runs fn(page) on a pooled browser inside a new context and returns its result.
+        `timeout` bounds the wait for a free browser (seconds); None waits forever.
+        `cancel` is any object with a `cancelled` property; it aborts the wait.
+        """
+        self._start()
+        with span("browser.acquire", pool_size=self.size):
+            browser = self._acquire(timeout, cancel)
+        try:
+            self.jobs_run += 1
+            return browser.submit(fn, context_options).result()
+        finally:
+            self._idle.put(browser)
+
+    def _acquire(self, timeout, cancel):
+        if cancel is None:
+            try:
+                return self._idle.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No free browser within {timeout}s (pool size {self.size})")
+        
+        # Poll in short slices so a cancelled caller stops queueing for a browser
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if cancel.cancelled:
+                raise RuntimeError("Cancelled while waiting for a browser")
+            wait = 0.25 if end is None else min(0.25, end - time.monotonic())
+            if wait <= 0:
+                raise TimeoutError(f"No free browser within {timeout}s (pool size {self.size})")
+            try:
+                return self._idle.get(timeout=wait)
+            except queue.Empty:
+                continue
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "max_uses": self.max_uses,
+            "idle": self._idle.qsize(),
+            "jobs": self.jobs_run,
+            "launches": sum(b.launches for b in self._browsers),
+            "recycles": sum(b.recycles for b in self._browsers),
+        }
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            browsers, self._browsers = self._browsers, []
+        for browser in browsers:
+            browser.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Process-wide pool, sized from PIXELOFF_BROWSER_POOL_SIZE / PIXELOFF_BROWSER_MAX_USES."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool(
+                size=int(os.environ.get("PIXELOFF_BROWSER_POOL_SIZE", "2")),
+                max_uses=int(os.environ.get("PIXELOFF_BROWSER_MAX_USES", "50")),
+            )
+        return _pool
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+atexit.register(shutdown_pool)
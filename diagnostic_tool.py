@@ -1,25 +1,115 @@
 import os
 import sys
+import glob
+import json
 import shutil
 import socket
-import subprocess
 import requests
 import time
 import psutil
 import platform
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Overall time budget for run_all() / run_performance() (seconds)
+DIAG_DEADLINE = float(os.environ.get("PIXELOFF_DIAG_DEADLINE", "15"))
+PERF_DEADLINE = float(os.environ.get("PIXELOFF_DIAG_PERF_DEADLINE", "90"))
+
+DEFAULT_TARGETS = [
+    ("Google", "https://www.google.com"),
+    ("Instagram", "https://www.instagram.com"),
+    ("PyPI", "https://pypi.org")
+]
+
+# Square sizes for the inference latency benchmark
+INFERENCE_SIZES = (320, 640, 1080, 2048)
+
+
+def _parse_targets(value):
+    """"Name=url,Name=url" (PIXELOFF_DIAG_TARGETS) -> [(name, url)]."""
+    targets = []
+    for item in value.split(","):
+        name, _, url = item.strip().partition("=")
+        if url: targets.append((name.strip(), url.strip()))
+    return targets
+
+def browser_health(results):
+    """
+    (ok, detail) for the "Browser Check" section of run_all(). A check that
+    timed out or errored, or has no ✅ launch test, counts as a failure.
+    """
+    browser = results.get("Browser Check") or {}
+    if browser.get("Error"):
+        return False, browser["Error"]
+    launch = browser.get("Launch Test")
+    if not launch:
+        return False, "No launch test result"
+    return launch.startswith("✅"), launch
+
+def _ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
 
 class SystemDiagnostics:
-    def __init__(self):
+    """
+    Host checks for the "Run Full System Test" button. Checks run concurrently
+    and the whole run is bounded by one deadline; a check still running at the
+    deadline is reported as timed out. Network and browser targets can point at
+    local stand-ins (PIXELOFF_DIAG_TARGETS, PIXELOFF_DIAG_BROWSER_URL).
+    """
+
+    def __init__(self, deadline=None, targets=None, browser_url=None, downloads_dir="downloads"):
         self.results = {}
+        self.deadline = DIAG_DEADLINE if deadline is None else deadline
+        if targets is None:
+            targets = _parse_targets(os.environ.get("PIXELOFF_DIAG_TARGETS", "")) or DEFAULT_TARGETS
+        self.targets = targets
+        self.browser_url = browser_url or os.environ.get("PIXELOFF_DIAG_BROWSER_URL", "https://example.com")
+        self.downloads_dir = downloads_dir
+        self._ends_at = None
+
+    def _remaining(self, cap=None):
+        """Seconds left before the current run's deadline (at least 0.1), optionally capped."""
+        left = max(0.1, self._ends_at - time.monotonic()) if self._ends_at else (cap or self.deadline)
+        return min(left, cap) if cap else left
+
+    def _run_concurrently(self, checks, deadline):
+        """Runs {name: fn} on threads; returns {name: result} with unfinished checks marked as timed out."""
+        self._ends_at = time.monotonic() + deadline
+        executor = ThreadPoolExecutor(max_workers=len(checks), thread_name_prefix="pixeloff-diag")
+        futures = {executor.submit(fn): name for name, fn in checks.items()}
+        done, _ = wait(futures, timeout=deadline)
+        # Stragglers keep running on their daemon threads but nobody waits for them
+        executor.shutdown(wait=False)
 
-    def run_all(self):
-        """Runs all diagnostic checks and returns a dictionary of results."""
-        self.results['System Info'] = self.get_system_info()
-        self.results['Disk Usage'] = self.check_disk_usage()
-        self.results['Memory Usage'] = self.check_memory_usage()
-        self.results['Network Connectivity'] = self.check_network()
-        self.results['Dependencies'] = self.check_dependencies()
-        self.results['Browser Check'] = self.check_browser()
+        results = {}
+        for future, name in futures.items():
+            if future not in done:
+                results[name] = {"Error": f"⏱️ Timed out after {deadline:g}s"}
+            elif future.exception() is not None:
+                results[name] = {"Error": str(future.exception())}
+            else:
+                results[name] = future.result()
+        return {name: results[name] for name in checks}
+
+    def run_all(self, performance=False):
+        """Runs all diagnostic checks concurrently and returns a dictionary of results."""
+        started = time.perf_counter()
+        self.results = self._run_concurrently({
+            'System Info': self.get_system_info,
+            'Disk Usage': self.check_disk_usage,
+            'Memory Usage': self.check_memory_usage,
+            'Network Connectivity': self.check_network,
+            'Dependencies': self.check_dependencies,
+            'Browser Check': self.check_browser,
+        }, self.deadline)
+        self.results['Run Time (ms)'] = _ms(started)
+        if performance:
+            self.results['Performance'] = self.run_performance()
         return self.results
 
     def get_system_info(self):
@@ -29,6 +119,7 @@ class SystemDiagnostics:
                 "Release": platform.release(),
                 "Python Version": sys.version.split()[0],
                 "Processor": platform.processor(),
+                "CPU Cores": os.cpu_count(),
                 "Hostname": socket.gethostname()
             }
         except Exception as e:
@@ -57,62 +148,170 @@ class SystemDiagnostics:
         except Exception as e:
             return {"Error": str(e)}
 
+    def _probe_url(self, url):
+        try:
+            start = time.time()
+            response = requests.get(url, timeout=self._remaining(cap=5))
+            latency = round((time.time() - start) * 1000, 2)
+            return f"✅ (Status: {response.status_code}, {latency}ms)"
+        except Exception as e:
+            return f"❌ Error: {str(e)}"
+
     def check_network(self):
-        targets = [
-            ("Google", "https://www.google.com"),
-            ("Instagram", "https://www.instagram.com"),
-            ("PyPI", "https://pypi.org")
-        ]
-        results = {}
-        for name, url in targets:
-            try:
-                start = time.time()
-                response = requests.get(url, timeout=5)
-                latency = round((time.time() - start) * 1000, 2)
-                results[name] = f"✅ (Status: {response.status_code}, {latency}ms)"
-            except Exception as e:
-                results[name] = f"❌ Error: {str(e)}"
-        return results
+        # All targets at once: the slowest one sets the time, not their sum
+        executor = ThreadPoolExecutor(max_workers=max(1, len(self.targets)))
+        futures = {name: executor.submit(self._probe_url, url) for name, url in self.targets}
+        # Return just before the overall deadline so the targets that did answer are still reported
+        wait(futures.values(), timeout=max(0.1, self._remaining() - 0.25))
+        executor.shutdown(wait=False)
+        return {name: future.result() if future.done() else "⏱️ No answer before the deadline"
+                for name, future in futures.items()}
 
     def check_dependencies(self):
-        pkgs = ["playwright", "rembg", "streamlit", "PIL", "numpy", "requests"]
+        # find_spec locates a package without importing it (importing rembg alone takes seconds)
+        pkgs = ["playwright", "rembg", "onnxruntime", "streamlit", "PIL", "numpy", "requests"]
         results = {}
         for pkg in pkgs:
             try:
-                __import__(pkg)
-                results[pkg] = "✅ Installed"
-            except ImportError:
-                results[pkg] = "❌ Missing"
+                results[pkg] = "✅ Installed" if importlib.util.find_spec(pkg) else "❌ Missing"
             except Exception as e:
                 results[pkg] = f"⚠️ Error: {str(e)}"
         return results
 
     def check_browser(self):
         results = {}
-        
-        # 1. Check if Chromium executable exists (relying on Playwright CLI)
+
+        # 1. Chromium build in Playwright's browser cache (no subprocess)
+        browsers_path = os.environ.get("PLAYWRIGHT_BROWSERS_PATH") or os.path.expanduser("~/.cache/ms-playwright")
+        builds = sorted(glob.glob(os.path.join(browsers_path, "chromium*")))
+        if builds:
+            results["Ref"] = f"✅ Chromium found: {', '.join(os.path.basename(b) for b in builds)}"
+        else:
+            results["Ref"] = f"❓ No Chromium build under {browsers_path}"
+
+        # 2. Load a page on the shared browser pool (the same browsers the downloader uses)
         try:
-            cmd = [sys.executable, "-m", "playwright", "install", "--dry-run"]
-            res = subprocess.run(cmd, capture_output=True, text=True)
-            if "chromium" in res.stdout.lower():
-                results["Ref"] = "✅ Playwright indicates Chromium is present"
-            else:
-                 results["Ref"] = "❓ Playwright did not explicitly confirm Chromium (Dry Run)"
+            from browser_pool import get_pool
+
+            def _load(page):
+                page.goto(self.browser_url, timeout=self._remaining() * 1000)
+                return page.title()
+
+            started = time.perf_counter()
+            title = get_pool().run(_load, timeout=self._remaining())
+            results["Launch Test"] = f"✅ Success! Title: {title} ({_ms(started)}ms)"
         except Exception as e:
-            results["Ref"] = f"❌ CLI Check Failed: {str(e)}"
+            results["Launch Test"] = f"❌ Failed: {str(e).splitlines()[0] if str(e) else type(e).__name__}"
+
+        return results
+
+    # --- PERFORMANCE ---
+    def run_performance(self, deadline=None, model_name="isnet-general-use", sizes=INFERENCE_SIZES):
+        """
+        Browser cold start vs warm context, model load, inference latency per
+        resolution and disk write throughput. Sections run one after another
+        (so they don't skew each other) under one deadline.
+        """
+        deadline = PERF_DEADLINE if deadline is None else deadline
+        sections = {}
 
-        # 2. Try to launch browser
+        def _measure():
+            self._ends_at = time.monotonic() + deadline
+            sections["Disk Write"] = self._guarded(self.bench_disk_write)
+            sections["Browser"] = self._guarded(self.bench_browser)
+            sections["Model"] = self._guarded(lambda: self.bench_model(model_name, sizes))
+
+        self._run_concurrently({"measure": _measure}, deadline)
+        for name in ("Disk Write", "Browser", "Model"):
+            sections.setdefault(name, {"Error": f"⏱️ Timed out after {deadline:g}s"})
+        return sections
+
+    def _guarded(self, fn):
         try:
-            from playwright.sync_api import sync_playwright
-            with sync_playwright() as p:
-                browser = p.chromium.launch(headless=True, args=['--no-sandbox', '--disable-setuid-sandbox'])
-                context = browser.new_context()
-                page = context.new_page()
-                page.goto("https://example.com")
-                title = page.title()
-                browser.close()
-                results["Launch Test"] = f"✅ Success! Title: {title}"
+            return fn()
         except Exception as e:
-            results["Launch Test"] = f"❌ Failed: {str(e)}"
-            
-        return results
+            return {"Error": str(e).splitlines()[0] if str(e) else type(e).__name__}
+
+    def bench_disk_write(self, size_mb=32):
+        """Sequential write + fsync of size_mb into the downloads directory."""
+        os.makedirs(self.downloads_dir, exist_ok=True)
+        path = os.path.join(self.downloads_dir, f".diag_write_{os.getpid()}.tmp")
+        chunk = os.urandom(1 << 20)
+        try:
+            started = time.perf_counter()
+            with open(path, "wb") as f:
+                for _ in range(size_mb):
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            elapsed = time.perf_counter() - started
+        finally:
+            if os.path.exists(path): os.remove(path)
+        return {"Written (MB)": size_mb, "Time (ms)": round(elapsed * 1000, 1), "Throughput (MB/s)": round(size_mb / elapsed, 1)}
+
+    def bench_browser(self, warm_runs=3):
+        """A private Chromium: launch (cold) and first context vs later contexts on the same browser (warm)."""
+        from playwright.sync_api import sync_playwright
+        from browser_pool import LAUNCH_ARGS
+
+        report = {}
+        with sync_playwright() as p:
+            started = time.perf_counter()
+            browser = p.chromium.launch(headless=True, args=LAUNCH_ARGS)
+            report["Cold Launch (ms)"] = _ms(started)
+            try:
+                timings = []
+                for i in range(warm_runs + 1):
+                    started = time.perf_counter()
+                    context = browser.new_context()
+                    page = context.new_page()
+                    page.goto(self.browser_url, timeout=self._remaining() * 1000)
+                    context.close()
+                    if i == 0: report["Cold Context + Page Load (ms)"] = _ms(started)
+                    else: timings.append(_ms(started))
+                report["Warm Context + Page Load (ms)"] = _median(timings)
+            finally:
+                browser.close()
+        report["Target"] = self.browser_url
+        return report
+
+    def bench_model(self, model_name, sizes):
+        """Session load (or the recorded load time if already cached) and single-image latency per size."""
+        from PIL import Image
+        from models import MODEL_FILES, model_path
+        from session_cache import get_session_cache
+        from processor import remove_background_bytes
+
+        report = {"Model": model_name}
+        if model_name in MODEL_FILES and not os.path.exists(model_path(model_name)):
+            # Downloading ~170MB is not a benchmark; provision it first (python models.py provision)
+            report["Error"] = "❌ Model file not downloaded yet"
+            return report
+
+        cache = get_session_cache()
+        cached = model_name in cache.stats()["models"]
+        started = time.perf_counter()
+        session = cache.get(model_name)
+        report["Load (ms)"] = round(cache.stats()["load_seconds"].get(model_name, 0) * 1000, 1) if cached else _ms(started)
+        report["Load"] = "already cached (time of original load)" if cached else "loaded now"
+
+        latency = {}
+        for size in sizes:
+            img = Image.new("RGB", (size, size), (120, 160, 200))
+            started = time.perf_counter()
+            _, error = remove_background_bytes(img, model_name, session=session)
+            latency[f"{size}x{size}"] = f"❌ {error}" if error else _ms(started)
+        report["Inference (ms)"] = latency
+        return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PixelOff system diagnostics.")
+    parser.add_argument("--performance", action="store_true", help="Also run the performance benchmark")
+    parser.add_argument("--deadline", type=float, help=f"Seconds for the checks (default {DIAG_DEADLINE:g})")
+    args = parser.parse_args()
+    print(json.dumps(SystemDiagnostics(deadline=args.deadline).run_all(performance=args.performance), indent=2, ensure_ascii=False))
+    sys.stdout.flush()
+    os._exit(0)  # don't wait for checks that ran past the deadline
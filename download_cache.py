@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+import threading
+
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DownloadCache:
+    """
+    Persistent cache of downloaded slides keyed by (shortcode, img_index).
+
+    Files stay where the downloader writes them; the index next to them
+    records the content hash, size, resolving relay and fetch/access times.
+    Entries expire after `ttl` seconds and the least recently used ones are
+    evicted once cached files exceed `max_bytes`. Hits only bump the access
+    time in memory; it reaches disk with the next put/evict or flush().
+    """
+
+    def __init__(self, root="downloads", ttl=None, max_bytes=None):
+        self.root = root
+        self.ttl = float(ttl if ttl is not None else os.environ.get("PIXELOFF_CACHE_TTL", 24 * 3600))
+        self.max_bytes = int(max_bytes if max_bytes is not None else float(os.environ.get("PIXELOFF_CACHE_MAX_MB", 500)) * 2**20)
+        self.index_path = os.path.join(root, "download_cache.json")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self._dirty = False  # Access times not yet written to the index
+
+    @staticmethod
+    def _key(shortcode, img_index):
+        return f"{shortcode}:{int(img_index)}"
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _save(self):
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = f"{self.index_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, indent=1)
+            os.replace(tmp_path, self.index_path)
+            self._dirty = False
+        except Exception as e:
+            print(f"[Cache] Could not save index: {e}")
+
+    def _drop(self, key, delete_files=True):
+        entry = self._entries.pop(key, None)
+        if entry and delete_files:
+            # Remove the slide and anything derived from it (e.g. *_nobg.png)
+            stem = os.path.splitext(entry["path"])[0]
+            directory = os.path.dirname(entry["path"])
+            try:
+                for filename in os.listdir(directory):
+                    file_path = os.path.join(directory, filename)
+                    if file_path == entry["path"] or file_path.startswith(stem + "_"):
+                        os.unlink(file_path)
+            except OSError:
+                pass
+
+    def get(self, shortcode, img_index):
+        """Returns the cache entry dict (path, sha256, relay, fetched_at...) or None."""
+        key = self._key(shortcode, img_index)
+        with self._lock:
+            entry = self._entries.get(key)
+            valid = (
+                entry is not None
+                and time.time() - entry["fetched_at"] <= self.ttl
+                and os.path.isfile(entry["path"])
+                and os.path.getsize(entry["path"]) == entry["size"]
+            )
+            if not valid:
+                if entry is not None:
+                    self._drop(key)
+                    self._save()
+                self.misses += 1
+                return None
+            entry["last_access"] = time.time()
+            self._dirty = True
+            self.hits += 1
+            return dict(entry)
+
+    def put(self, shortcode, img_index, path, relay):
+        """Indexes a freshly downloaded slide and enforces the disk quota."""
+        entry = {
+            "path": os.path.abspath(path),
+            "sha256": file_sha256(path),
+            "size": os.path.getsize(path),
+            "relay": relay,
+            "fetched_at": time.time(),
+            "last_access": time.time(),
+        }
+        key = self._key(shortcode, img_index)
+        with self._lock:
+            self._entries[key] = entry
+            self._evict(keep=key)
+            self._save()
+        return dict(entry)
+
+    def invalidate(self, shortcode, img_index=None):
+        with self._lock:
+            for key in list(self._entries):
+                code, index = key.rsplit(":", 1)
+                if code == shortcode and (img_index is None or int(index) == int(img_index)):
+                    self._drop(key)
+            self._save()
+
+    def _evict(self, keep=None):
+        now = time.time()
+        for key, entry in list(self._entries.items()):
+            if now - entry["fetched_at"] > self.ttl and key != keep:
+                self._drop(key)
+                self.evictions += 1
+        total = sum(e["size"] for e in self._entries.values())
+        for key, entry in sorted(self._entries.items(), key=lambda kv: kv[1]["last_access"]):
+            if total <= self.max_bytes: break
+            if key == keep: continue
+            total -= entry["size"]
+            self._drop(key)
+            self.evictions += 1
+
+    def flush(self):
+        """Writes pending access times to the index."""
+        with self._lock:
+            if self._dirty: self._save()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(e["size"] for e in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_download_cache(root="downloads"):
+    """One cache per download root, shared across the process."""
+    root = os.path.abspath(root)
+    with _caches_lock:
+        if root not in _caches:
+            _caches[root] = DownloadCache(root)
+        return _caches[root]
+
+def flush_download_caches():
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.flush()
+
+atexit.register(flush_download_caches)
@@ -4,7 +4,17 @@ import re
 import json
 import time
 import random
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from bs4 import BeautifulSoup
+from browser_pool import get_pool
+from relay_scoreboard import get_scoreboard, classify_failure
+from download_cache import get_download_cache
+from transfer import fetch_to_file, fetch_bytes, get_executor
+from route_policy import routed, RELAY_ALLOWLISTS
+from rate_limiter import get_scheduler, parse_retry_after, RATE_LIMIT_STATUSES
+from tracing import span, traced, annotate, bind
 
 # Helper: Clean URLs to remove query params/resizing
 def _clean_instagram_url(url):
@@ -13,13 +23,9 @@ def _clean_instagram_url(url):
 def _ensure_dir(path):
     os.makedirs(path, exist_ok=True)
 
-def _clean_dir(path):
-    if os.path.exists(path):
-        for filename in os.listdir(path):
-            file_path = os.path.join(path, filename)
-            try:
-                if os.path.isfile(file_path): os.unlink(file_path)
-            except: pass
+def _extract_shortcode(url):
+    m = re.search(r'instagram\.com/(?:[^/]+/)?(?:p|reel)/([^/?#]+)', url)
+    return m.group(1) if m else None
 
 def _shortcode_to_mediaid(shortcode):
     alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
@@ -28,316 +34,747 @@ def _shortcode_to_mediaid(shortcode):
         media_id = media_id * 64 + alphabet.index(char)
     return media_id
 
+# --- CANCELLATION ---
+class RelayCancelled(Exception):
+    pass
+
+class RelayCancel:
+    """Cooperative cancel flag + absolute deadline shared by relay attempts of one request."""
+    def __init__(self, deadline=None):
+        self.deadline = deadline  # time.monotonic() value, or None
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        if self._event.is_set(): return True
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    @property
+    def superseded(self):
+        """True if cancel() was called (lost a race), as opposed to running out of time."""
+        return self._event.is_set()
+
+    def check(self):
+        if self.cancelled: raise RelayCancelled("Relay cancelled")
+
+# --- LATENCY BUDGETS ---
+# One relay attempt gets RELAY_SLA seconds (capped by the request deadline);
+# each stage may use its share, and time a stage leaves unspent rolls forward.
+RELAY_SLA = float(os.environ.get("PIXELOFF_RELAY_SLA", "25"))
+STAGE_SHARES = (("navigate", 0.35), ("submit", 0.15), ("result", 0.4), ("extract", 0.1))
+
+class StageBudget:
+    """Per-stage deadlines (navigate, submit, result, extract) carved out of one SLA."""
+    def __init__(self, total_s=None, cancel=None, shares=STAGE_SHARES):
+        self.total = total_s if total_s is not None else RELAY_SLA
+        self.cancel = cancel
+        self.started = time.monotonic()
+        self.marks = []  # (stage, monotonic start)
+        self._ends = {}
+        cumulative = 0.0
+        for stage, share in shares:
+            cumulative += share
+            self._ends[stage] = self.started + self.total * cumulative
+
+    def ms(self, stage):
+        """Timeout in ms for `stage`: its budget end, or the request deadline if sooner."""
+        now = time.monotonic()
+        if not self.marks or self.marks[-1][0] != stage:
+            self.marks.append((stage, now))
+        end = self._ends[stage]
+        if self.cancel is not None and self.cancel.deadline is not None:
+            end = min(end, self.cancel.deadline)
+        return max(1, int((end - now) * 1000))
+
+    def spent(self):
+        """Seconds spent per stage so far."""
+        out = {}
+        points = self.marks + [("", time.monotonic())]
+        for (stage, start), (_, end) in zip(points, points[1:]):
+            out[stage] = round(out.get(stage, 0) + end - start, 3)
+        return out
+
+def _check(cancel):
+    if cancel: cancel.check()
+
+def _wait_for_selector(page, selector, timeout, cancel=None):
+    """wait_for_selector in short slices so a cancelled relay gives its page back quickly."""
+    with span("page.wait_for_selector", selector=selector):
+        return _wait_sliced(page, selector, timeout, cancel)
+
+def _wait_sliced(page, selector, timeout, cancel):
+    if cancel is None:
+        return page.wait_for_selector(selector, timeout=timeout)
+    from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+    end = time.monotonic() + timeout / 1000
+    while True:
+        cancel.check()
+        left = int((end - time.monotonic()) * 1000)
+        if left <= 0: raise TimeoutError(f"Timeout {timeout}ms waiting for {selector}")
+        try:
+            return page.wait_for_selector(selector, timeout=min(250, left))
+        except PlaywrightTimeoutError:
+            # Only a slice running out is retried; a closed page or failed navigation surfaces at once
+            if time.monotonic() >= end: raise
+
+def _rate_limit_watcher(relay, url):
+    """page "response" listener: a 429/503 from the relay's own XHRs starts its cooldown too."""
+    hosts = RELAY_ALLOWLISTS.get(relay, ()) + (urlparse(url).hostname or "",)
+    def _on_response(response):
+        try:
+            if response.status not in RATE_LIMIT_STATUSES or response.request.is_navigation_request(): return
+            host = urlparse(response.url).hostname or ""
+            if any(host == h or host.endswith("." + h) for h in hosts):
+                get_scheduler().penalize(relay, response.status, parse_retry_after(response.headers.get("retry-after")))
+        except Exception: pass
+    return _on_response
+
+def _goto(page, relay, url, timeout):
+    """page.goto that reports 429/503 answers to the rate scheduler and fails the attempt on them."""
+    page.on("response", _rate_limit_watcher(relay, url))
+    with span("page.goto", relay=relay):
+        response = page.goto(url, wait_until="domcontentloaded", timeout=timeout)
+    if response is not None and response.status in RATE_LIMIT_STATUSES:
+        get_scheduler().penalize(relay, response.status, parse_retry_after(response.headers.get("retry-after")))
+        raise RuntimeError(f"HTTP {response.status} from {relay}")
+    return response
+
 # --- CORE BROWSER ENGINE ---
-def fetch_rendered_html(url, target_dir, timeout=30000):
-    """Uses Playwright to fetch fully rendered HTML (JS executed)."""
-    from playwright.sync_api import sync_playwright
+def fetch_rendered_html(url, target_dir, timeout=30000, cancel=None, ready_selector=None, relay=None):
+    """
+    Uses a pooled Playwright browser to fetch fully rendered HTML (JS executed).
+    timeout: overall budget in ms. ready_selector: wait for it instead of network idle.
+    relay: route policy (allowlist) to apply; defaults to the URL's host.
+    """
     
-    html_content = ""
-    page_title = "Unknown"
-    error_log = ""
-    
-    try:
-        with sync_playwright() as p:
-            # Launch options for stealth (v5.1)
-            browser = p.chromium.launch(
-                headless=True,
-                args=[
-                    '--no-sandbox', 
-                    '--disable-setuid-sandbox',
-                    '--disable-blink-features=AutomationControlled', # 🕵️ Hide automation flag
-                    '--disable-infobars',
-                    '--window-size=1920,1080'
-                ]
-            )
+    def _render(page):
+        html_content = ""
+        page_title = "Unknown"
+        error_log = ""
+        budget = StageBudget(timeout / 1000, cancel)
+        
+        # 🕵️ Script Injection to hide "navigator.webdriver"
+        page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined});")
+        
+        try:
+            _goto(page, relay or urlparse(url).hostname, url, budget.ms("navigate"))
             
-            # Context with real-user fingerprint
-            context = browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",
-                viewport={'width': 1920, 'height': 1080},
-                locale='en-US'
-            )
+            # 🖱️ HUMANIZATION: Wiggle Mouse to pass weak CF checks (stepped moves, no sleeps)
+            try:
+                page.mouse.move(100, 100, steps=5)
+                page.mouse.move(200, 200, steps=5)
+                page.evaluate("window.scrollTo(0, 500)")
+            except: pass
+
+            # Wait for the content itself, or for redirects/navigations to settle
+            try:
+                if ready_selector: _wait_for_selector(page, ready_selector, budget.ms("result"), cancel)
+                else: page.wait_for_load_state("networkidle", timeout=budget.ms("result"))
+            except RelayCancelled: raise
+            except: pass
             
-            page = context.new_page()
+            # Capture Info
+            budget.ms("extract")
+            page_title = page.title()
             
-            # 🕵️ Script Injection to hide "navigator.webdriver"
-            page.add_init_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined});")
+            # 📸 DEBUG: Take Screenshot
+            debug_path = os.path.join(target_dir, "debug_view.png")
+            page.screenshot(path=debug_path)
             
-            try:
-                page.goto(url, wait_until="domcontentloaded", timeout=timeout)
-                
-                # 🖱️ HUMANIZATION: Wiggle Mouse to pass weak CF checks
-                try:
-                    page.mouse.move(100, 100)
-                    time.sleep(0.2)
-                    page.mouse.move(200, 200)
-                    time.sleep(0.2)
-                    page.evaluate("window.scrollTo(0, 500)")
-                except: pass
-
-                time.sleep(3) 
-
-                # Handle Redirects/Navigations (Fix Execution Context Error)
-                try:
-                    page.wait_for_load_state("networkidle", timeout=5000)
-                except: pass
-                
-                # Capture Info
-                page_title = page.title()
-                
-                # 📸 DEBUG: Take Screenshot
-                debug_path = os.path.join(target_dir, "debug_view.png")
-                page.screenshot(path=debug_path)
-                
-                html_content = page.content()
-            except Exception as e:
-                error_log = str(e)
-            finally:
-                browser.close()
-                
+            html_content = page.content()
+        except Exception as e:
+            error_log = str(e)
+        return html_content, page_title, error_log
+    
+    try:
+        # Context with real-user fingerprint
+        return get_pool().run(routed(relay or urlparse(url).hostname, _render), cancel=cancel, viewport={'width': 1920, 'height': 1080}, locale='en-US')
     except Exception as e:
-        error_log = f"Playwright Init Error: {e}"
+        return "", "Unknown", f"Playwright Init Error: {e}"
 
-    return html_content, page_title, error_log
+# --- RESULT PARSERS (shared by the sync and async engines) ---
 
-# --- RELAY METHODS ---
+@traced("parse", relay="sssinstagram")
+def _parse_sssinstagram(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    slides = []
+    for a in soup.select('.download-wrapper a, a.download-button'):
+        href = a.get('href')
+        if href: slides.append(href)
+    return slides
 
-# --- RELAY METHODS ---
+@traced("parse", relay="fastdl")
+def _parse_fastdl(html):
+    """Returns (slides, found_links); found_links feeds the debug message."""
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # Debugging Logic
+    found_links = [a.get('href') for a in soup.select('a[href]')]
+    
+    slides = []
+    for a in soup.select('a[href*="googlevideo"], a[href*="cdninstagram"], a[download], a.button--filled'):
+        href = a.get('href')
+        if href and "fastdl" not in href and "javascript" not in href:
+            slides.append(href)
+    return slides, found_links
+
+@traced("parse", relay="indown")
+def _parse_indown(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    slides = []
+    # Relaxed: Any link inside #result
+    for a in soup.select('div#result a[href]'):
+        href = a.get('href')
+        if href and "javascript" not in href and len(href) > 20:
+            slides.append(href)
+    return slides
+
+@traced("parse", relay="savefree")
+def _parse_savefree(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    slides = []
+    items = soup.select('.download-item')
+    for item in items:
+        a = item.select_one('a.download-btn')
+        if a: slides.append(a.get('href'))
+    return slides
+
+@traced("parse", relay="imginn")
+def _parse_imginn(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    slides = []
+    
+    downloads = soup.select('.downloads a.btn-primary')
+    if downloads:
+        slides = [a.get('href') for a in downloads if a.get('href')]
+    
+    if not slides:
+        imgs = soup.select('img.img-fluid')
+        slides = [img.get('src') for img in imgs if img.get('src')]
+    return slides
+
+# --- SLIDE LIST MEMO ---
+# Relay CDN links are signed and expire, so the memo is deliberately short-lived.
+SLIDE_MEMO_TTL = float(os.environ.get("PIXELOFF_SLIDE_TTL", "300"))
+_slide_memo = {}  # shortcode -> (expires, slides, source_name)
+_slide_memo_lock = threading.Lock()
+
+def _remember_slides(shortcode, slides, source_name):
+    with _slide_memo_lock:
+        _slide_memo[shortcode] = (time.monotonic() + SLIDE_MEMO_TTL, list(slides), source_name)
+
+def _recall_slides(shortcode):
+    """Returns (slides, source_name) for a recently resolved post, or (None, None)."""
+    with _slide_memo_lock:
+        memo = _slide_memo.get(shortcode)
+        if memo and memo[0] > time.monotonic():
+            return memo[1], memo[2]
+        _slide_memo.pop(shortcode, None)
+        return None, None
+
+def _forget_slides(shortcode):
+    with _slide_memo_lock:
+        _slide_memo.pop(shortcode, None)
+
+# Status prefix for a slide index past the end of the post. Not a relay failure:
+# the scoreboard ignores it and the relay chain stops at the first one.
+OUT_OF_RANGE = "Index out of range"
+
+def _out_of_range(img_index, slides, source_name):
+    return f"{OUT_OF_RANGE}: slide {img_index} requested, post has {len(slides)} ({source_name})"
+
+def _is_out_of_range(status):
+    return bool(status) and str(status).startswith(OUT_OF_RANGE)
+
+def _download_slide(slides, error, shortcode, target_dir, img_index, source_name, cancel=None):
+    """Memoizes a resolved slide list, then downloads slides[img_index-1]."""
+    if not slides: return None, error
+    _remember_slides(shortcode, slides, source_name)
+    if len(slides) < img_index:
+        return None, _out_of_range(img_index, slides, source_name)
+    if cancel and cancel.cancelled: return None, "Cancelled before download"
+    return _download_file(slides[img_index-1], target_dir, shortcode, img_index, source_name)
 
 # --- RELAY METHODS ---
+# resolve_via_* return (slides, error) with the post's full ordered slide URL list;
+# download_via_* resolve and then download one slide.
+
+# Relay entry pages. PIXELOFF_RELAY_URL_<RELAY> points one at a stand-in (e.g. the benchmark servers).
+RELAY_URLS = {
+    "sssinstagram": "https://sssinstagram.com/en",
+    "fastdl": "https://fastdl.app/en",
+    "indown": "https://indown.io/",
+    "savefree": "https://savefree.app/en",
+    "imginn": "https://imginn.com/p/{shortcode}/",
+}
+
+def relay_url(relay, **fields):
+    return os.environ.get(f"PIXELOFF_RELAY_URL_{relay.upper()}", RELAY_URLS[relay]).format(**fields)
 
-def download_via_sssinstagram(original_url, shortcode, target_dir, img_index=1):
+def resolve_via_sssinstagram(original_url, cancel=None):
     """Method 1: SSSInstagram (Form)"""
-    from playwright.sync_api import sync_playwright
     
-    try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True, args=['--no-sandbox', '--disable-blink-features=AutomationControlled'])
-            page = browser.new_page()
-            
-            try:
-                page.goto("https://sssinstagram.com/en", timeout=30000)
-                page.wait_for_load_state("domcontentloaded")
-                
-                # Close cookies/popups if any (Press Escape)
-                page.keyboard.press("Escape")
-                
-                page.fill('input#main_page_text', original_url)
-                page.click('button#submit')
-                
-                # Wait for result
-                try: page.wait_for_selector('.download-wrapper, .result-box', timeout=20000)
-                except: return None, f"SSSInstagram: Timeout. Title: '{page.title()}'"
-                
-                html = page.content()
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                slides = []
-                for a in soup.select('.download-wrapper a, a.download-button'):
-                    href = a.get('href')
-                    if href: slides.append(href)
-                
-                if slides and len(slides) >= img_index:
-                    return _download_file(slides[img_index-1], target_dir, shortcode, img_index, "SSSInstagram")
-                    
-                return None, "SSSInstagram: No slides"
-            finally:
-                browser.close()
+    def _visit(page):
+        budget = StageBudget(cancel=cancel)
+        _check(cancel)
+        _goto(page, "sssinstagram", relay_url("sssinstagram"), budget.ms("navigate"))
+        _wait_for_selector(page, 'input#main_page_text', budget.ms("navigate"), cancel)
+        
+        # Close cookies/popups if any (Press Escape)
+        page.keyboard.press("Escape")
+        
+        page.fill('input#main_page_text', original_url, timeout=budget.ms("submit"))
+        page.click('button#submit', timeout=budget.ms("submit"))
+        
+        # Wait for result
+        try: _wait_for_selector(page, '.download-wrapper, .result-box', budget.ms("result"), cancel)
+        except: return None, f"SSSInstagram: Timeout. Title: '{page.title()}'"
+        
+        budget.ms("extract")
+        slides = _parse_sssinstagram(page.content())
+        if slides: return slides, None
+        return None, "SSSInstagram: No slides"
+    
+    try: return get_pool().run(routed("sssinstagram", _visit), cancel=cancel)
     except Exception as e: return None, f"SSSInstagram Error: {e}"
 
-def download_via_fastdl(original_url, shortcode, target_dir, img_index=1):
+def download_via_sssinstagram(original_url, shortcode, target_dir, img_index=1, cancel=None):
+    slides, error = resolve_via_sssinstagram(original_url, cancel)
+    return _download_slide(slides, error, shortcode, target_dir, img_index, "SSSInstagram", cancel)
+
+def resolve_via_fastdl(original_url, cancel=None):
     """Method 2: FastDL (Debug Mode)"""
-    from playwright.sync_api import sync_playwright
     
-    try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True, args=['--no-sandbox', '--disable-blink-features=AutomationControlled'])
-            page = browser.new_page()
-            
-            try:
-                page.goto("https://fastdl.app/en", timeout=30000)
-                page.wait_for_load_state("networkidle")
-                
-                page.fill('input[type="text"]', original_url)
-                page.keyboard.press("Enter")
-                
-                # Wait for ANY link to appear in the output area
-                try: page.wait_for_selector('div.output-list, a[download]', timeout=20000)
-                except: return None, f"FastDL: Timeout. Title: '{page.title()}'"
-                
-                html = page.content()
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                # Debugging Logic
-                found_links = [a.get('href') for a in soup.select('a[href]')]
-                
-                slides = []
-                for a in soup.select('a[href*="googlevideo"], a[href*="cdninstagram"], a[download], a.button--filled'):
-                    href = a.get('href')
-                    if href and "fastdl" not in href and "javascript" not in href:
-                        slides.append(href)
-                
-                if slides and len(slides) >= img_index:
-                    return _download_file(slides[img_index-1], target_dir, shortcode, img_index, "FastDL")
-                
-                # Return debug info
-                debug_info = f"Found {len(found_links)} links, {len(slides)} matched. First 3 found: {found_links[:3]}"
-                return None, f"FastDL: No content. {debug_info}"
-
-            finally:
-                browser.close()
+    def _visit(page):
+        budget = StageBudget(cancel=cancel)
+        _check(cancel)
+        _goto(page, "fastdl", relay_url("fastdl"), budget.ms("navigate"))
+        # The form is usable as soon as the input renders; no need for network idle
+        _wait_for_selector(page, 'input[type="text"]', budget.ms("navigate"), cancel)
+        
+        page.fill('input[type="text"]', original_url, timeout=budget.ms("submit"))
+        page.keyboard.press("Enter")
+        
+        # Wait for ANY link to appear in the output area
+        try: _wait_for_selector(page, 'div.output-list, a[download]', budget.ms("result"), cancel)
+        except: return None, f"FastDL: Timeout. Title: '{page.title()}'"
+        
+        budget.ms("extract")
+        slides, found_links = _parse_fastdl(page.content())
+        if slides: return slides, None
+        
+        # Return debug info
+        debug_info = f"Found {len(found_links)} links, {len(slides)} matched. First 3 found: {found_links[:3]}"
+        return None, f"FastDL: No content. {debug_info}"
+    
+    try: return get_pool().run(routed("fastdl", _visit), cancel=cancel)
     except Exception as e: return None, f"FastDL Error: {e}"
 
-def download_via_indown(shortcode, target_dir, img_index, original_url):
+def download_via_fastdl(original_url, shortcode, target_dir, img_index=1, cancel=None):
+    slides, error = resolve_via_fastdl(original_url, cancel)
+    return _download_slide(slides, error, shortcode, target_dir, img_index, "FastDL", cancel)
+
+def resolve_via_indown(original_url, cancel=None):
     """Method 3: Indown (Relaxed)"""
-    from playwright.sync_api import sync_playwright
-    try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True, args=['--no-sandbox'])
-            page = browser.new_page()
-            try:
-                page.goto("https://indown.io/", timeout=30000)
-                # Close potential popup
-                time.sleep(1)
-                page.keyboard.press("Escape")
-                
-                page.fill('input#link', original_url)
-                page.click('button[type="submit"]')
-                
-                try: page.wait_for_selector('#result', timeout=20000)
-                except: return None, "Indown: Timeout"
-                
-                html = page.content()
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                slides = []
-                # Relaxed: Any link inside #result
-                for a in soup.select('div#result a[href]'):
-                    href = a.get('href')
-                    if href and "javascript" not in href and len(href) > 20:
-                        slides.append(href)
-                
-                if slides and len(slides) >= img_index:
-                    return _download_file(slides[img_index-1], target_dir, shortcode, img_index, "Indown")
-                return None, f"Indown: No slides. Found {len(slides)} potential links."
-            finally:
-                browser.close()
+    
+    def _visit(page):
+        budget = StageBudget(cancel=cancel)
+        _check(cancel)
+        _goto(page, "indown", relay_url("indown"), budget.ms("navigate"))
+        _wait_for_selector(page, 'input#link', budget.ms("navigate"), cancel)
+        # Close potential popup
+        page.keyboard.press("Escape")
+        
+        page.fill('input#link', original_url, timeout=budget.ms("submit"))
+        page.click('button[type="submit"]', timeout=budget.ms("submit"))
+        
+        try: _wait_for_selector(page, '#result', budget.ms("result"), cancel)
+        except: return None, "Indown: Timeout"
+        
+        budget.ms("extract")
+        slides = _parse_indown(page.content())
+        if slides: return slides, None
+        return None, f"Indown: No slides. Found {len(slides)} potential links."
+    
+    try: return get_pool().run(routed("indown", _visit), cancel=cancel)
     except Exception as e: return None, f"Indown Error: {e}"
 
-def download_via_savefree(original_url, shortcode, target_dir, img_index=1):
+def download_via_indown(shortcode, target_dir, img_index, original_url, cancel=None):
+    slides, error = resolve_via_indown(original_url, cancel)
+    return _download_slide(slides, error, shortcode, target_dir, img_index, "Indown", cancel)
+
+def resolve_via_savefree(original_url, target_dir="downloads", cancel=None):
     """Method 3: SaveFree (Backup Form)"""
-    from playwright.sync_api import sync_playwright
     
-    try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(
-                headless=True,
-                args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-blink-features=AutomationControlled']
-            )
-            context = browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
-            )
-            page = context.new_page()
-            
-            try:
-                page.goto("https://savefree.app/en", timeout=30000)
-                time.sleep(2)
-                
-                page.fill('input#input-url', original_url)
-                page.click('#btn-submit')
-                
-                try: page.wait_for_selector('.download-items', timeout=15000)
-                except: 
-                    # Try clicking again?
-                    page.screenshot(path=os.path.join(target_dir, "debug_savefree_fail.png"))
-                    return None, "SaveFree: Timeout"
-                
-                html = page.content()
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                slides = []
-                items = soup.select('.download-item')
-                for item in items:
-                    a = item.select_one('a.download-btn')
-                    if a: slides.append(a.get('href'))
-                
-                if slides and len(slides) >= img_index:
-                    return _download_file(slides[img_index-1], target_dir, shortcode, img_index, "SaveFree")
-                    
-                return None, "SaveFree: No content found"
-            finally:
-                browser.close()
-    except Exception as e:
-        return None, f"SaveFree Error: {e}"
+    def _visit(page):
+        budget = StageBudget(cancel=cancel)
+        _check(cancel)
+        _goto(page, "savefree", relay_url("savefree"), budget.ms("navigate"))
+        _wait_for_selector(page, 'input#input-url', budget.ms("navigate"), cancel)
+        
+        page.fill('input#input-url', original_url, timeout=budget.ms("submit"))
+        page.click('#btn-submit', timeout=budget.ms("submit"))
+        
+        try: _wait_for_selector(page, '.download-items', budget.ms("result"), cancel)
+        except: 
+            # Try clicking again?
+            page.screenshot(path=os.path.join(target_dir, "debug_savefree_fail.png"))
+            return None, "SaveFree: Timeout"
+        
+        budget.ms("extract")
+        slides = _parse_savefree(page.content())
+        if slides: return slides, None
+        return None, "SaveFree: No content found"
+    
+    try: return get_pool().run(routed("savefree", _visit), cancel=cancel)
+    except Exception as e: return None, f"SaveFree Error: {e}"
 
-def download_via_imginn(shortcode, target_dir, img_index=1):
+def download_via_savefree(original_url, shortcode, target_dir, img_index=1, cancel=None):
+    slides, error = resolve_via_savefree(original_url, target_dir, cancel)
+    return _download_slide(slides, error, shortcode, target_dir, img_index, "SaveFree", cancel)
+
+def resolve_via_imginn(shortcode, target_dir="downloads", cancel=None):
     """Method 4: Imginn (Direct)"""
-    url = f"https://imginn.com/p/{shortcode}/"
+    url = relay_url("imginn", shortcode=shortcode)
     
-    html, title, error = fetch_rendered_html(url, target_dir)
+    html, title, error = fetch_rendered_html(url, target_dir, timeout=int(RELAY_SLA * 1000), cancel=cancel,
+                                             ready_selector='.downloads a.btn-primary, img.img-fluid', relay="imginn")
     if not html: return None, f"Imginn Browser Error: {error}"
     
-    soup = BeautifulSoup(html, 'html.parser')
-    slides = []
-    
-    downloads = soup.select('.downloads a.btn-primary')
-    if downloads:
-        slides = [a.get('href') for a in downloads if a.get('href')]
-    
-    if not slides:
-        imgs = soup.select('img.img-fluid')
-        slides = [img.get('src') for img in imgs if img.get('src')]
-
-    if slides and len(slides) >= img_index:
-        img_url = slides[img_index-1]
-        if img_url.startswith("//"): img_url = "https:" + img_url
-        return _download_file(img_url, target_dir, shortcode, img_index, "Imginn")
-        
+    slides = _parse_imginn(html)
+    if slides: return ["https:" + s if s.startswith("//") else s for s in slides], None
     return None, f"Imginn: Content not found. Title: '{title}'"
 
+def download_via_imginn(shortcode, target_dir, img_index=1, cancel=None):
+    slides, error = resolve_via_imginn(shortcode, target_dir, cancel)
+    return _download_slide(slides, error, shortcode, target_dir, img_index, "Imginn", cancel)
+
+def _clean_slide_url(url):
+    clean_url = _clean_instagram_url(url)
+    if clean_url.startswith("http://"): return clean_url  # Local stand-in CDNs
+    clean_url = clean_url.replace("https://", "").replace("//", "")
+    return f"https://{clean_url}"
+
 def _download_file(url, target_dir, shortcode, img_index, source_name):
-    import requests
     try:
         # Clean URL
-        clean_url = _clean_instagram_url(url)
-        clean_url = clean_url.replace("https://", "").replace("//", "")
-        clean_url = f"https://{clean_url}"
-
-        # Standard headers
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
+        clean_url = _clean_slide_url(url)
         
         path = os.path.join(os.path.join(target_dir, shortcode), f"{shortcode}_slide{img_index}.jpg")
-        _ensure_dir(os.path.dirname(path))
-
-        res = requests.get(clean_url, headers=headers, timeout=20)
-        if res.status_code == 200:
-            with open(path, "wb") as f: f.write(res.content)
-            return path, f"Relay ({source_name})"
-        else:
-            return None, f"HTTP {res.status_code} on Clean download"
+        
+        # Pooled keep-alive session, streamed to a .part file and renamed atomically
+        path, error = fetch_to_file(clean_url, path)
+        if error: return None, error
+        return path, f"Relay ({source_name})"
     except Exception as e:
         return None, f"Download Error: {e}"
 
 
-def download_instagram_image(url, target_dir="downloads", img_index=1):
-    m = re.search(r'instagram\.com/(?:[^/]+/)?(?:p|reel)/([^/?#]+)', url)
-    if not m: return None, "Invalid URL"
-    shortcode = m.group(1)
-    _ensure_dir(target_dir)
-    _clean_dir(os.path.join(target_dir, shortcode))
-    
-    methods = [
-        (lambda: download_via_sssinstagram(url, shortcode, target_dir, img_index), "SSSInstagram (Form)"),
-        (lambda: download_via_fastdl(url, shortcode, target_dir, img_index), "FastDL (Debug)"),
-        (lambda: download_via_indown(shortcode, target_dir, img_index, url), "Indown (Relaxed)"),
-    ]
-    
+# --- RELAY STRATEGIES ---
+# "race" runs the top K relays at once; "sequential" tries one at a time (low-memory hosts).
+RELAY_STRATEGY = os.environ.get("PIXELOFF_RELAY_STRATEGY", "race")
+RACE_WIDTH = int(os.environ.get("PIXELOFF_RACE_WIDTH", "2"))
+REQUEST_DEADLINE = float(os.environ.get("PIXELOFF_REQUEST_DEADLINE", "60"))
+
+# Relay id -> display name. Reserves start at the back and move up only by scoring well.
+RELAY_NAMES = {
+    "sssinstagram": "SSSInstagram (Form)",
+    "fastdl": "FastDL (Debug)",
+    "indown": "Indown (Relaxed)",
+    "savefree": "SaveFree (Backup)",
+    "imginn": "Imginn (Direct)",
+}
+RESERVE_RELAYS = ("savefree", "imginn")
+
+def _record_attempt(scoreboard, key, started, path, status, cancelled=False):
+    """
+    Scoreboard and rate-scheduler bookkeeping for one finished relay attempt
+    (shared by the thread and asyncio engines). Returns the failure class, or
+    None when the attempt counts as an answer (a file, or "index out of range").
+    """
+    elapsed = time.monotonic() - started
+    if path or _is_out_of_range(status):
+        if path: scoreboard.record(key, True, elapsed)
+        get_scheduler().success(key)
+        return None
+    failure = "timeout" if cancelled else classify_failure(status)
+    scoreboard.record(key, False, elapsed, failure)
+    return failure
+
+def _scored(scoreboard, key, func):
+    """
+    Wraps a relay attempt so its outcome, latency and failure class land on the
+    scoreboard. The rate scheduler paces visits per relay first; a relay that
+    is cooling down after a 429 is skipped without a visit (and without a score).
+    """
+    def _attempt(token):
+        with span("relay", relay=key) as s:
+            ready, reason = get_scheduler().wait(key, cancel=token)
+            if not ready:
+                s.set(rate_limited=True)
+                return None, f"Rate limited: {reason}"
+            started = time.monotonic()
+            path, status = func(token)
+            if not path and token.superseded and not _is_out_of_range(status):
+                s.set(superseded=True)
+            elif _record_attempt(scoreboard, key, started, path, status, cancelled=token.cancelled):
+                s.fail(status)
+            elif not path:
+                s.set(out_of_range=True)
+            return path, status
+    return _attempt
+
+def _run_sequential(methods, deadline):
     errors = []
     for func, name in methods:
-        path, status = func()
-        if path: return os.path.abspath(path), status, errors
+        token = RelayCancel(deadline)
+        if token.cancelled:
+            errors.append(f"[{name}] Skipped: request deadline reached")
+            continue
+        path, status = func(token)
+        if path or _is_out_of_range(status): return path, status, errors
         if status: errors.append(f"[{name}] {status}")
+    return None, None, errors
+
+
+class RelayRace:
+    """
+    Race bookkeeping shared by the thread engine here and the asyncio engine in
+    async_downloader: which relays start next (keeping `width` in flight), the
+    request deadline, which answer ends the race (a file or "index out of
+    range") and the per-relay error lines. Engines only supply a start(func)
+    that returns a handle (future/task) and feed finished handles to settle().
+    """
+
+    def __init__(self, methods, width, deadline):
+        self.pending = list(methods)
+        self.width = max(1, int(width))
+        self.deadline = deadline
+        self.running = {}  # handle -> (name, started)
+        self.errors = []
+
+    def launch(self, start):
+        while self.pending and len(self.running) < self.width:
+            func, name = self.pending.pop(0)
+            self.running[start(func)] = (name, time.monotonic())
+
+    def left(self):
+        return self.deadline - time.monotonic()
+
+    def settle(self, handle, path, status):
+        """Records a finished attempt; True when it ends the race (the rest should be cancelled)."""
+        name, _ = self.running.pop(handle)
+        if path or _is_out_of_range(status):
+            for other_name, other_started in self.running.values():
+                self.errors.append(f"[{other_name}] Cancelled after {time.monotonic() - other_started:.1f}s: {name} answered first")
+            return True
+        if status: self.errors.append(f"[{name}] {status}")
+        return False
+
+    def expire(self):
+        """Deadline reached: error lines for the relays still running or never started."""
+        for name, started in self.running.values():
+            self.errors.append(f"[{name}] Cancelled after {time.monotonic() - started:.1f}s: request deadline reached")
+        for func, name in self.pending:
+            self.errors.append(f"[{name}] Skipped: request deadline reached")
+
+
+def _run_race(methods, width, deadline):
+    """Keeps `width` relays in flight; first valid image wins and the rest are cancelled."""
+    race = RelayRace(methods, width, deadline)
+    tokens = {}  # future -> RelayCancel
+    executor = ThreadPoolExecutor(max_workers=race.width, thread_name_prefix="pixeloff-relay")
+
+    def _start(func):
+        token = RelayCancel(deadline)
+        future = executor.submit(bind(func), token)
+        tokens[future] = token
+        return future
+
+    try:
+        race.launch(_start)
+        while race.running:
+            left = race.left()
+            if left <= 0: break
+            done, _ = wait(list(race.running), timeout=left, return_when=FIRST_COMPLETED)
+            for future in done:
+                try: path, status = future.result()
+                except Exception as e: path, status = None, f"Error: {e}"
+                if race.settle(future, path, status):
+                    # Cancel the losers so their pages close right away
+                    for other in race.running: tokens[other].cancel()
+                    return path, status, race.errors
+            race.launch(_start)
+
+        # Deadline hit with relays still running
+        for future in race.running: tokens[future].cancel()
+        race.expire()
+        return None, None, race.errors
+    finally:
+        executor.shutdown(wait=False)
+
+def _ordered_relays(keys):
+    """
+    Relay keys in scoreboard order; relays with an open circuit breaker are
+    left out (unless all are). Relays in a 429 cooldown are kept but sorted
+    last (they report "Rate limited" without a visit).
+    """
+    scheduler = get_scheduler()
+    return sorted(get_scoreboard().order(list(keys), reserves=RESERVE_RELAYS), key=lambda key: scheduler.cooldown(key) > 0)
+
+def _relay_order(relays):
+    """(scored attempt, display name) pairs for _run_relays, in _ordered_relays order."""
+    scoreboard = get_scoreboard()
+    return [(_scored(scoreboard, key, relays[key]), RELAY_NAMES[key]) for key in _ordered_relays(relays)]
+
+def _run_relays(methods, strategy, race_width, deadline):
+    strategy = strategy or RELAY_STRATEGY
+    end = time.monotonic() + (deadline or REQUEST_DEADLINE)
+    if strategy == "race":
+        return _run_race(methods, race_width or RACE_WIDTH, end)
+    return _run_sequential(methods, end)
+
+@traced("download")
+def download_instagram_image(url, target_dir="downloads", img_index=1, strategy=None, race_width=None, deadline=None, refresh=False):
+    """
+    Resolves and downloads one slide of an Instagram post through the relay chain.
+    strategy: "race" (default, PIXELOFF_RELAY_STRATEGY) or "sequential".
+    deadline: overall seconds for the whole request (PIXELOFF_REQUEST_DEADLINE).
+    refresh: skip the download cache and fetch again.
+    Returns (path, status, errors); on failure path is None and status joins the errors.
+    """
+    shortcode = _extract_shortcode(url)
+    if not shortcode: return None, "Invalid URL", []
+    annotate(shortcode=shortcode, slide=img_index)
+    _ensure_dir(target_dir)
     
+    # ⚡ Cache hit: no browser involved
+    cache = get_download_cache(target_dir)
+    if refresh:
+        cache.invalidate(shortcode, img_index)
+        _forget_slides(shortcode)
+    cached = cache.get(shortcode, img_index)
+    if cached:
+        annotate(source="cache")
+        return cached["path"], f"Cache: {cached['relay']}", []
+    
+    # ⚡ Slide list already resolved for this post: go straight to the CDN
+    slides, source_name = _recall_slides(shortcode)
+    if slides and len(slides) < img_index:
+        annotate(source="memo", out_of_range=True)
+        return None, _out_of_range(img_index, slides, source_name), []
+    if slides:
+        path, status = _download_file(slides[img_index-1], target_dir, shortcode, img_index, source_name)
+        if path:
+            annotate(source="memo", relay=source_name)
+            cache.put(shortcode, img_index, path, status)
+            return os.path.abspath(path), status, []
+        _forget_slides(shortcode)  # Links expired; resolve again below
+    
+    relays = {
+        "sssinstagram": lambda token: download_via_sssinstagram(url, shortcode, target_dir, img_index, cancel=token),
+        "fastdl": lambda token: download_via_fastdl(url, shortcode, target_dir, img_index, cancel=token),
+        "indown": lambda token: download_via_indown(shortcode, target_dir, img_index, url, cancel=token),
+        "savefree": lambda token: download_via_savefree(url, shortcode, target_dir, img_index, cancel=token),
+        "imginn": lambda token: download_via_imginn(shortcode, target_dir, img_index, cancel=token),
+    }
+    path, status, errors = _run_relays(_relay_order(relays), strategy, race_width, deadline)
+    annotate(source="relays", status=status, attempts=len(errors) + (1 if path else 0))
+    
+    if path:
+        cache.put(shortcode, img_index, path, status)
+        return os.path.abspath(path), status, errors
+    if _is_out_of_range(status): return None, status, errors
     return None, " | ".join(errors), errors
+
+@traced("resolve_slides")
+def resolve_slides(url, target_dir="downloads", strategy=None, race_width=None, deadline=None, refresh=False):
+    """
+    Returns (slides, source_name, errors): the post's ordered slide URL list,
+    from the memo when fresh, otherwise from one relay visit.
+    """
+    shortcode = _extract_shortcode(url)
+    if not shortcode: return None, "Invalid URL", []
+    if refresh: _forget_slides(shortcode)
+    slides, source_name = _recall_slides(shortcode)
+    if slides: return slides, source_name, []
+    _ensure_dir(target_dir)
+    
+    def _resolver(resolve, source_name):
+        def _resolve(token):
+            slides, error = resolve(token)
+            return (slides, source_name) if slides else (None, error)
+        return _resolve
+    
+    relays = {
+        "sssinstagram": _resolver(lambda token: resolve_via_sssinstagram(url, token), "SSSInstagram"),
+        "fastdl": _resolver(lambda token: resolve_via_fastdl(url, token), "FastDL"),
+        "indown": _resolver(lambda token: resolve_via_indown(url, token), "Indown"),
+        "savefree": _resolver(lambda token: resolve_via_savefree(url, target_dir, token), "SaveFree"),
+        "imginn": _resolver(lambda token: resolve_via_imginn(shortcode, target_dir, token), "Imginn"),
+    }
+    slides, source_name, errors = _run_relays(_relay_order(relays), strategy, race_width, deadline)
+    if not slides: return None, " | ".join(errors), errors
+    _remember_slides(shortcode, slides, source_name)
+    return slides, source_name, errors
+
+@traced("download", in_memory=True)
+def fetch_instagram_image(url, img_index=1, target_dir="downloads", strategy=None, race_width=None, deadline=None, refresh=False):
+    """
+    In-memory variant of download_instagram_image: resolves the slide and
+    reads it straight from the CDN without writing it to disk (a slide
+    already in the download cache is read from there).
+    Returns (bytes, status, errors); on failure bytes is None.
+    """
+    shortcode = _extract_shortcode(url)
+    if not shortcode: return None, "Invalid URL", []
+    if not refresh:
+        cached = get_download_cache(target_dir).get(shortcode, img_index)
+        if cached:
+            with open(cached["path"], "rb") as f:
+                return f.read(), f"Cache: {cached['relay']}", []
+
+    slides, source_name, errors = resolve_slides(url, target_dir, strategy, race_width, deadline, refresh)
+    if not slides: return None, source_name, errors
+    if img_index > len(slides):
+        return None, _out_of_range(img_index, slides, source_name), errors
+    data, error = fetch_bytes(_clean_slide_url(slides[img_index-1]))
+    if error:
+        _forget_slides(shortcode)  # Links may have expired
+        return None, error, errors + [error]
+    return data, f"Relay ({source_name})", errors
+
+@traced("download_all_slides")
+def download_all_slides(url, target_dir="downloads", strategy=None, race_width=None, deadline=None, refresh=False):
+    """
+    Downloads every slide of a post with a single relay visit.
+    Returns (results, errors) where results is [(path, status), ...] in slide order.
+    """
+    shortcode = _extract_shortcode(url)
+    if not shortcode: return [], ["Invalid URL"]
+    cache = get_download_cache(target_dir)
+    if refresh: cache.invalidate(shortcode)
+    
+    slides, source_name, errors = resolve_slides(url, target_dir, strategy, race_width, deadline, refresh)
+    if not slides: return [], errors
+    
+    # Cached slides come back immediately; the rest download in parallel
+    results = [None] * len(slides)
+    transfers = {}
+    for img_index, slide_url in enumerate(slides, start=1):
+        cached = cache.get(shortcode, img_index)
+        if cached:
+            results[img_index-1] = (cached["path"], f"Cache: {cached['relay']}")
+        else:
+            transfers[img_index] = get_executor().submit(bind(_download_file), slide_url, target_dir, shortcode, img_index, source_name)
+    
+    for img_index, future in transfers.items():
+        path, status = future.result()
+        if path:
+            cache.put(shortcode, img_index, path, status)
+            path = os.path.abspath(path)
+        results[img_index-1] = (path, status)
+    return results, errors
@@ -0,0 +1,215 @@
+import os
+import re
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from download_cache import file_sha256
+from tracing import span
+
+# Instaloader names post files <YYYY-MM-DD_HH-MM-SS>_UTC[_<slide>].<ext>
+POST_FILE = re.compile(r"^(?P<stamp>\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}_UTC)(?:_(?P<slide>\d+))?\.(?P<ext>[A-Za-z0-9]+)$")
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "webp"}
+MANIFEST_NAME = "ingest_manifest.json"
+# Manifest is rewritten after this many finished images (and at the end)
+SAVE_EVERY = 25
+
+
+class PostImage:
+    """One image of an archived post, with the caption from its <stamp>_UTC.txt (None if absent)."""
+
+    __slots__ = ("path", "rel_path", "shortcode", "timestamp", "slide", "caption")
+
+    def __init__(self, path, rel_path, shortcode, timestamp, slide, caption):
+        self.path = path
+        self.rel_path = rel_path
+        self.shortcode = shortcode
+        self.timestamp = timestamp
+        self.slide = slide
+        self.caption = caption
+
+
+def scan(root, exclude=None):
+    """
+    Walks root for Instaloader post files: <shortcode>/<stamp>_UTC[_N].jpg next
+    to <stamp>_UTC.txt. The directory name is taken as the shortcode. Videos,
+    metadata and the `exclude` directory (our outputs) are ignored.
+    Returns (images, skipped count).
+    """
+    exclude = os.path.abspath(exclude) if exclude else None
+    images, skipped = [], 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames
+                             if not d.startswith(".") and os.path.abspath(os.path.join(dirpath, d)) != exclude)
+        captions = {}
+        for name in filenames:
+            m = POST_FILE.match(name)
+            if m and m.group("ext") == "txt" and not m.group("slide"):
+                caption_path = os.path.join(dirpath, name)
+                try:
+                    with open(caption_path, "r", encoding="utf-8", errors="replace") as f:
+                        captions[m.group("stamp")] = f.read().strip()
+                except OSError as e:
+                    # One bad caption must not stop the run: its images are ingested without it
+                    print(f"[Ingest] ⚠️ Skipping unreadable caption {caption_path}: {e}")
+
+        for name in sorted(filenames):
+            m = POST_FILE.match(name)
+            if not m or m.group("ext") == "txt": continue
+            if m.group("ext").lower() not in IMAGE_EXTENSIONS:
+                skipped += 1  # .mp4, .json.xz, ...
+                continue
+            path = os.path.join(dirpath, name)
+            images.append(PostImage(
+                path=path,
+                rel_path=os.path.relpath(path, root),
+                shortcode=os.path.basename(dirpath),
+                timestamp=m.group("stamp"),
+                slide=int(m.group("slide") or 1),
+                caption=captions.get(m.group("stamp")),
+            ))
+    return images, skipped
+
+
+class IngestManifest:
+    """
+    JSON manifest of ingested images keyed by path relative to the archive
+    root. An entry holds the content hash, the options used and the output, so
+    a re-run only processes new or changed images. Size + mtime match skips
+    re-hashing; a touched but identical file is recognised by its hash.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[Ingest] ⚠️ Manifest {path} is unreadable ({e}); starting a fresh one")
+            return
+        images = data.get("images") if isinstance(data, dict) else None
+        if not isinstance(images, dict):
+            print(f"[Ingest] ⚠️ Manifest {path} has no image table; starting a fresh one")
+            return
+        # Drop malformed entries only: those images are simply processed again
+        self.entries = {rel_path: entry for rel_path, entry in images.items()
+                        if isinstance(entry, dict) and isinstance(entry.get("sha256"), (str, type(None)))}
+        if len(self.entries) < len(images):
+            print(f"[Ingest] ⚠️ Ignoring {len(images) - len(self.entries)} malformed manifest entries in {path}")
+
+    def content_hash(self, image):
+        """sha256 of the image, reusing the recorded one while size and mtime are unchanged."""
+        stat = os.stat(image.path)
+        with self._lock:
+            entry = self.entries.get(image.rel_path)
+        if entry and entry.get("sha256") and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            return entry["sha256"], stat
+        return file_sha256(image.path), stat
+
+    def is_current(self, image, sha256, options):
+        with self._lock:
+            entry = self.entries.get(image.rel_path)
+        return (bool(entry) and not entry.get("error") and entry.get("sha256") == sha256
+                and entry.get("options") == options and entry.get("output") and os.path.exists(entry["output"]))
+
+    def record(self, image, sha256, stat, options, output, error):
+        with self._lock:
+            self.entries[image.rel_path] = {
+                "shortcode": image.shortcode,
+                "timestamp": image.timestamp,
+                "slide": image.slide,
+                "caption": image.caption,
+                "sha256": sha256,
+                "size": stat.st_size if stat else None,
+                "mtime_ns": stat.st_mtime_ns if stat else None,
+                "options": options,
+                "output": output,
+                "error": error,
+                "processed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+
+    def refresh(self, image, stat):
+        """Keeps caption, size and mtime current for images that are not reprocessed (no re-hash next time)."""
+        with self._lock:
+            entry = self.entries.get(image.rel_path)
+            if entry: entry.update(caption=image.caption, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({"version": 1, "images": self.entries}, ensure_ascii=False, indent=1)
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+
+def _output_path(output_dir, image, mask_only):
+    stem = os.path.splitext(image.rel_path)[0]
+    return os.path.join(output_dir, stem + ("_mask.png" if mask_only else "_nobg.png"))
+
+
+def ingest(root, output_dir=None, workers=2, model_name="isnet-general-use", max_side=None, mask_only=False,
+           manifest_path=None, force=False):
+    """
+    Background removal for every image in an Instaloader archive tree, on
+    `workers` threads (each hands off to the removal process pool when
+    PIXELOFF_REMOVAL_WORKERS is set). Outputs mirror the archive layout under
+    output_dir (default <root>/_nobg). Returns (processed, failed, unchanged).
+    """
+    from processor import remove_background
+
+    output_dir = output_dir or os.path.join(root, "_nobg")
+    manifest = IngestManifest(manifest_path or os.path.join(output_dir, MANIFEST_NAME))
+    options = {"model": model_name, "max_side": max_side, "mask_only": bool(mask_only)}
+
+    images, skipped = scan(root, exclude=output_dir)
+    print(f"[Ingest] {len(images)} image(s) in {len({img.shortcode for img in images})} post(s) under {root}"
+          + (f", {skipped} non-image file(s) skipped" if skipped else ""))
+
+    def _process(image):
+        # Hashing runs on the workers too: a first run over thousands of posts is I/O-bound here
+        try:
+            sha256, stat = manifest.content_hash(image)
+        except OSError as e:
+            # Vanished or unreadable since scan(): a failed image, not a failed run
+            try: stat = os.stat(image.path)
+            except OSError: stat = None
+            error = f"Could not read image: {e}"
+            manifest.record(image, None, stat, options, None, error)
+            return image, None, error, False
+        if not force and manifest.is_current(image, sha256, options):
+            manifest.refresh(image, stat)
+            return image, None, None, True
+        output = _output_path(output_dir, image, mask_only)
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with span("ingest.image", shortcode=image.shortcode, slide=image.slide):
+            try:
+                path, error = remove_background(image.path, output, model_name=model_name, use_cache=False,
+                                                max_side=max_side, mask_only=mask_only)
+            except Exception as e:
+                path, error = None, str(e)
+        manifest.record(image, sha256, stat, options, path, error)
+        return image, path, error, False
+
+    processed = failed = unchanged = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="pixeloff-ingest") as executor:
+            for future in as_completed([executor.submit(_process, image) for image in images]):
+                image, path, error, current = future.result()
+                if current:
+                    unchanged += 1
+                    continue
+                processed += 1
+                if error: failed += 1
+                print(f"[Ingest] {processed + unchanged}/{len(images)} {image.rel_path} -> {'❌ ' + str(error) if error else '✅ ' + path}")
+                if processed % SAVE_EVERY == 0: manifest.save()
+    finally:
+        manifest.save()
+    if unchanged: print(f"[Ingest] {unchanged} image(s) unchanged since the last run")
+    return processed, failed, unchanged
@@ -0,0 +1,230 @@
+import os
+import time
+import atexit
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import span, bind
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class Job:
+    """One background job. Progress is a list of short messages; result is set when state is DONE."""
+
+    def __init__(self, key, kind):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.kind = kind
+        self.state = QUEUED
+        self.stage = "Queued"
+        self.progress = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.subscribers = 1  # Requests coalesced onto this job
+        self._done = threading.Event()
+
+    def report(self, stage):
+        """Records a progress step (shown to every caller polling this job)."""
+        self.stage = stage
+        self.progress.append(f"{time.time() - self.created:6.1f}s  {stage}")
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, RUNNING)
+
+    def wait(self, timeout=None):
+        """Blocks until the job finishes (or timeout); returns True if it finished."""
+        return self._done.wait(timeout)
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "stage": self.stage,
+            "progress": list(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "subscribers": self.subscribers,
+            "created": self.created,
+            "elapsed_s": round((self.finished or time.time()) - self.created, 2),
+        }
+
+
+class JobExecutor:
+    """
+    Process-wide background executor shared by every Streamlit session.
+    submit() returns a Job right away; callers poll it by id. Identical
+    requests (same key) submitted while one is queued or running join that
+    job instead of starting another (singleflight). Jobs that drive browsers
+    take one of `browser_slots` first, capping concurrent browser work for
+    the whole process. The last `history` jobs stay queryable after finishing.
+    """
+
+    def __init__(self, workers=4, browser_slots=2, history=200):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="pixeloff-job")
+        self.browser_slots = max(1, int(browser_slots))
+        self._browser = threading.BoundedSemaphore(self.browser_slots)
+        self.history = max(1, int(history))
+        self._jobs = OrderedDict()  # id -> Job, oldest first
+        self._inflight = {}  # key -> Job
+        self._lock = threading.Lock()
+        self.coalesced = 0
+        self.browser_jobs = 0
+
+    def submit(self, key, fn, kind="job"):
+        """Runs fn(job) in the background, or returns the in-flight job with the same key."""
+        with self._lock:
+            job = self._inflight.get(key)
+            if job is not None:
+                job.subscribers += 1
+                self.coalesced += 1
+                return job
+            job = Job(key, kind)
+            self._inflight[key] = job
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(bind(self._run), job, fn)
+        return job
+
+    def _run(self, job, fn):
+        job.state, job.started = RUNNING, time.time()
+        try:
+            with span("job", kind=job.kind, job_id=job.id):
+                job.result = fn(job)
+            job.state = DONE
+            job.report("Done")
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+            job.state = FAILED
+            job.report(f"Failed: {job.error}")
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                if self._inflight.get(job.key) is job:
+                    self._inflight.pop(job.key)
+            job._done.set()
+
+    def browser_slot(self, job):
+        """Context manager for the browser-bound part of a job (waits for a free slot)."""
+        return _BrowserSlot(self, job)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        while len(self._jobs) > self.history:
+            oldest = next((job_id for job_id, job in self._jobs.items() if not job.active), None)
+            if oldest is None: break
+            self._jobs.pop(oldest)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+            return {
+                "queued": sum(job.state == QUEUED for job in jobs),
+                "running": sum(job.state == RUNNING for job in jobs),
+                "finished": sum(not job.active for job in jobs),
+                "coalesced": self.coalesced,
+                "browser_slots": self.browser_slots,
+                "browser_jobs": self.browser_jobs,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _BrowserSlot:
+    def __init__(self, executor, job):
+        self.executor = executor
+        self.job = job
+
+    def __enter__(self):
+        if not self.executor._browser.acquire(blocking=False):
+            self.job.report("Waiting for a free browser slot...")
+            with span("job.browser_wait", job_id=self.job.id):
+                self.executor._browser.acquire()
+        with self.executor._lock:
+            self.executor.browser_jobs += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self.executor._lock:
+            self.executor.browser_jobs -= 1
+        self.executor._browser.release()
+        return False
+
+
+def _pipeline_job(executor, url, img_index, model_name, target_dir):
+    def _run(job):
+        from downloader import download_instagram_image, _extract_shortcode
+        from download_cache import get_download_cache
+
+        job.report("Checking the download cache...")
+        # Use the hit itself: asking again could miss after an eviction and reach relays without a slot
+        cached = get_download_cache(target_dir).get(_extract_shortcode(url), img_index)
+        if cached:
+            image_path, source, logs = cached["path"], f"Cache: {cached['relay']}", []
+        else:
+            with executor.browser_slot(job):
+                job.report("Browsing public viewers (SnapInsta/SaveFree/Picuki)...")
+                image_path, source, logs = download_instagram_image(url, target_dir=target_dir, img_index=img_index)
+        if not image_path:
+            return {"image_path": None, "source": None, "logs": logs, "error": source or "Unknown error"}
+
+        job.report(f"Downloaded via {source}. Removing background...")
+        from processor import remove_background
+        output_path, error = remove_background(image_path, model_name=model_name)
+        return {"image_path": image_path, "source": source, "logs": logs, "output_path": output_path,
+                "error": f"Background removal failed: {error}" if error else None}
+    return _run
+
+def submit_pipeline(url, img_index=1, model_name="isnet-general-use", target_dir="downloads"):
+    """
+    Download + background removal as a background job. Concurrent requests for
+    the same (shortcode, img_index, model, target_dir) share one job. Returns the Job;
+    its result is {"image_path", "source", "logs", "output_path", "error"}.
+    """
+    from downloader import _extract_shortcode
+
+    shortcode = _extract_shortcode(url)
+    if not shortcode:
+        raise ValueError("Invalid URL")
+    executor = get_executor()
+    return executor.submit(("pipeline", shortcode, int(img_index), model_name, os.path.abspath(target_dir)),
+                           _pipeline_job(executor, url, int(img_index), model_name, target_dir), kind="pipeline")
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Process-wide executor: PIXELOFF_JOB_WORKERS threads, PIXELOFF_MAX_BROWSER_JOBS browser slots."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = JobExecutor(
+                workers=int(os.environ.get("PIXELOFF_JOB_WORKERS", "4")),
+                browser_slots=int(os.environ.get("PIXELOFF_MAX_BROWSER_JOBS", os.environ.get("PIXELOFF_BROWSER_POOL_SIZE", "2"))),
+                history=int(os.environ.get("PIXELOFF_JOB_HISTORY", "200")),
+            )
+        return _executor
+
+def get_job(job_id):
+    return get_executor().get(job_id)
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
+
+atexit.register(shutdown_executor)
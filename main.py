@@ -6,18 +6,54 @@ from processor import remove_background
 
 def main():
     parser = argparse.ArgumentParser(description="Download Instagram photo and remove background.")
-    parser.add_argument("url", help="Instagram Post URL")
+    parser.add_argument("url", nargs="?", help="Instagram Post URL")
+    parser.add_argument("--batch", metavar="FILE", help="Process URLs from FILE (one per line, '-' for stdin)")
+    parser.add_argument("--output", default="results.jsonl", help="Batch results file (JSON Lines)")
+    parser.add_argument("--download-workers", type=int, default=2, help="Concurrent downloads in batch mode")
+    parser.add_argument("--removal-workers", type=int, default=1, help="Concurrent background removals in batch/ingest mode")
+    parser.add_argument("--queue-size", type=int, default=4, help="Downloaded images waiting for removal before downloads pause")
+    parser.add_argument("--no-resume", action="store_true", help="Process every URL even if it already has a result")
+    parser.add_argument("--retry-failed", action="store_true", help="When resuming, retry URLs whose result was an error")
+    parser.add_argument("--max-side", type=int, help="Cap the copy the model sees at this many pixels per side; the output keeps full resolution (low-memory mode)")
+    parser.add_argument("--mask-only", action="store_true", help="Save only the alpha mask (low-memory mode)")
+    parser.add_argument("--ingest", metavar="DIR", help="Remove backgrounds across an Instaloader archive (<shortcode>/<stamp>_UTC.*)")
+    parser.add_argument("--ingest-output", metavar="DIR", help="Where ingested results go (default <DIR>/_nobg)")
+    parser.add_argument("--force", action="store_true", help="Ingest every image even if the manifest says it is unchanged")
     args = parser.parse_args()
+
+    if args.batch:
+        from pipeline import run_batch
+        processed, failed, skipped = run_batch(
+            args.batch, args.output,
+            resume=not args.no_resume, retry_failed=args.retry_failed,
+            download_workers=args.download_workers, removal_workers=args.removal_workers,
+            queue_size=args.queue_size, max_side=args.max_side, mask_only=args.mask_only,
+        )
+        print(f"\nBatch finished: {processed} processed ({failed} failed), {skipped} skipped. Results: {args.output}")
+        sys.exit(1 if failed else 0)
+
+    if args.ingest:
+        from ingest import ingest
+        processed, failed, unchanged = ingest(
+            args.ingest, output_dir=args.ingest_output, workers=args.removal_workers,
+            max_side=args.max_side, mask_only=args.mask_only, force=args.force,
+        )
+        print(f"\nIngest finished: {processed} processed ({failed} failed), {unchanged} unchanged.")
+        sys.exit(1 if failed else 0)
+
+    if not args.url:
+        parser.error("a URL, --batch FILE or --ingest DIR is required")
     
     url = args.url
     print(f"Starting tool for URL: {url}")
     
     # Step 1: Download
     print("\n--- Step 1: Downloading from Instagram ---")
-    image_path, caption = download_instagram_image(url)
+    image_path, caption = download_instagram_image(url)[:2]
     
     if not image_path:
-        print("Failed to download image. Exiting.")
+        print(f"Failed to download image: {caption}")
+        print("Exiting.")
         sys.exit(1)
         
     print(f"Image downloaded to: {image_path}")
@@ -27,16 +63,16 @@ def main():
     except UnicodeEncodeError:
         print(caption.encode('utf-8', errors='ignore').decode('utf-8', errors='ignore'))
     print("--------------------")
-    
+
     # Step 2: Remove Background
     print("\n--- Step 2: Removing Background ---")
-    final_path = remove_background(image_path)
+    final_path, error = remove_background(image_path, max_side=args.max_side, mask_only=args.mask_only)
     
     if final_path:
         print("\nSUCCESS!")
         print(f"Your processed image is ready at:\n{final_path}")
     else:
-        print("Failed to remove background.")
+        print(f"Failed to remove background: {error}")
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,298 @@
+import os
+import sys
+import time
+import hashlib
+import tarfile
+import zipfile
+import argparse
+import threading
+
+from tracing import span
+
+# Files rembg looks for, with the md5 sums it verifies downloads against
+MODEL_FILES = {
+    "isnet-general-use": ("isnet-general-use.onnx", "fc16ebd8b0c10d971d3513d564d01e29"),
+    "u2net_human_seg": ("u2net_human_seg.onnx", "c09ddc2e0104f800e3e1bb4652583d1f"),
+}
+
+# Serialises provisioning and cache clears (both touch the model files)
+_files_lock = threading.RLock()
+
+
+def model_home():
+    """Where rembg finds already-downloaded models (U2NET_HOME, default ~/.u2net)."""
+    return os.path.expanduser(os.environ.get("U2NET_HOME", os.path.join(os.environ.get("XDG_DATA_HOME", "~"), ".u2net")))
+
+def model_path(model_name, home=None):
+    return os.path.join(home or model_home(), MODEL_FILES[model_name][0])
+
+def configured_models():
+    """PIXELOFF_WARMUP_MODELS (comma-separated, "off" disables), default isnet-general-use."""
+    value = os.environ.get("PIXELOFF_WARMUP_MODELS", "isnet-general-use")
+    if value.strip().lower() in ("", "0", "off", "false", "none"):
+        return []
+    return [m.strip() for m in value.split(",") if m.strip()]
+
+def _md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def verify_model(model_name, home=None):
+    """Returns (ok, detail) for the installed copy of model_name."""
+    path = model_path(model_name, home)
+    if not os.path.exists(path):
+        return False, "Missing"
+    actual = _md5(path)
+    if actual != MODEL_FILES[model_name][1]:
+        return False, f"Checksum mismatch (md5 {actual})"
+    return True, f"OK ({os.path.getsize(path) / 2**20:.0f} MB)"
+
+
+def _open_from_mirror(mirror, filename):
+    """
+    Opens filename from a mirror: a directory (searched recursively) or a
+    .zip / .tar(.gz) bundle. Returns (readable file, closer) or (None, None).
+    """
+    if os.path.isdir(mirror):
+        for root, _, files in os.walk(mirror):
+            if filename in files:
+                f = open(os.path.join(root, filename), "rb")
+                return f, f.close
+        return None, None
+
+    if zipfile.is_zipfile(mirror):
+        bundle = zipfile.ZipFile(mirror)
+        for name in bundle.namelist():
+            if os.path.basename(name) == filename:
+                return bundle.open(name), bundle.close
+        bundle.close()
+        return None, None
+
+    if tarfile.is_tarfile(mirror):
+        bundle = tarfile.open(mirror)
+        for member in bundle.getmembers():
+            if member.isfile() and os.path.basename(member.name) == filename:
+                return bundle.extractfile(member), bundle.close
+        bundle.close()
+        return None, None
+
+    raise ValueError(f"Mirror is neither a directory nor a zip/tar bundle: {mirror}")
+
+def provision_model(model_name, mirror, home=None, force=False):
+    """
+    Installs model_name from a local mirror directory or bundle into the model
+    home, verifying the md5 while copying. The file is moved into place only
+    when the checksum matches. Returns (path, error).
+    """
+    if model_name not in MODEL_FILES:
+        return None, f"Unknown model: {model_name}"
+    filename, expected = MODEL_FILES[model_name]
+    home = home or model_home()
+    target = os.path.join(home, filename)
+
+    with _files_lock, span("model.provision", model=model_name) as s:
+        if not force and os.path.exists(target) and _md5(target) == expected:
+            s.set(source="installed")
+            return target, None
+
+        try:
+            source, close = _open_from_mirror(mirror, filename)
+        except (OSError, ValueError, zipfile.BadZipFile, tarfile.TarError) as e:
+            s.fail(e)
+            return None, str(e)
+        if source is None:
+            s.fail("not found")
+            return None, f"{filename} not found in {mirror}"
+
+        os.makedirs(home, exist_ok=True)
+        partial = f"{target}.{os.getpid()}.part"
+        digest = hashlib.md5()
+        size = 0
+        try:
+            with open(partial, "wb") as out:
+                for chunk in iter(lambda: source.read(1 << 20), b""):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+        except OSError as e:
+            s.fail(e)
+            return None, f"Copy failed: {e}"
+        finally:
+            close()
+            if digest.hexdigest() != expected and os.path.exists(partial):
+                os.remove(partial)
+
+        s.set(source="mirror", bytes=size)
+        if digest.hexdigest() != expected:
+            s.fail("checksum mismatch")
+            return None, f"Checksum mismatch for {filename} (md5 {digest.hexdigest()}, expected {expected})"
+        os.replace(partial, target)
+        print(f"[Models] Installed {filename} from {mirror} ({size / 2**20:.0f} MB)")
+        return target, None
+
+def provision(mirror, models=None, home=None, force=False):
+    """Provisions several models; returns {model: (path, error)}."""
+    return {name: provision_model(name, mirror, home, force) for name in (models or configured_models())}
+
+
+class ModelWarmup:
+    """
+    Background model preparation for a fresh process: installs missing models
+    from PIXELOFF_MODEL_MIRROR (if set), loads each session into the shared
+    session cache and runs one tiny inference so the first real request pays
+    neither download, session creation nor ONNX warm-up.
+    """
+
+    def __init__(self, models=None, mirror=None):
+        self.models = list(models) if models is not None else configured_models()
+        self.mirror = mirror if mirror is not None else os.environ.get("PIXELOFF_MODEL_MIRROR")
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = {name: {"state": "pending", "detail": "", "ms": None} for name in self.models}
+
+    def start(self, force=False):
+        """Starts the warm-up thread unless it is running or already ran (force re-runs it). Returns self."""
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+            if self.models and not running and (force or self._thread is None):
+                self._thread = threading.Thread(target=self._run, name="pixeloff-warmup", daemon=True)
+                self._thread.start()
+        return self
+
+    @property
+    def running(self):
+        with self._lock:
+            return self._thread is not None and self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        """Blocks until the warm-up thread finishes (or timeout); returns status()."""
+        thread = self._thread
+        if thread is not None: thread.join(timeout)
+        return self.status()
+
+    def status(self):
+        with self._lock:
+            return {name: dict(state) for name, state in self._status.items()}
+
+    def _set(self, model_name, state, detail="", ms=None):
+        with self._lock:
+            self._status[model_name] = {"state": state, "detail": detail, "ms": ms}
+
+    def _run(self):
+        from processor_pool import pool_enabled
+
+        for model_name in self.models:
+            started = time.perf_counter()
+            try:
+                if self.mirror and model_name in MODEL_FILES and not os.path.exists(model_path(model_name)):
+                    self._set(model_name, "provisioning")
+                    _, error = provision_model(model_name, self.mirror)
+                    if error:
+                        print(f"[Models] Mirror provisioning failed for {model_name}: {error}")
+
+                if pool_enabled():
+                    # Pool workers load their own sessions at spawn; the parent only needs the files
+                    self._set(model_name, "ready", "files only (removal pool)", round((time.perf_counter() - started) * 1000))
+                    continue
+
+                self._set(model_name, "loading")
+                with span("model.warmup", model=model_name):
+                    from PIL import Image
+                    from session_cache import get_session
+                    from processor import remove_background_bytes
+
+                    session = get_session(model_name)
+                    _, error = remove_background_bytes(Image.new("RGB", (64, 64), (128, 128, 128)),
+                                                       model_name, mask_only=True, session=session)
+                if error:
+                    raise RuntimeError(error)
+                self._set(model_name, "warm", "", round((time.perf_counter() - started) * 1000))
+            except Exception as e:
+                self._set(model_name, "failed", str(e).splitlines()[0][:300] if str(e) else type(e).__name__,
+                          round((time.perf_counter() - started) * 1000))
+        print("[Models] Warm-up finished: " + ", ".join(f"{name} {s['state']}" for name, s in self.status().items()))
+
+
+def clear_model_cache(delete_files=False):
+    """
+    Safe cache clear: drops the in-process sessions (loads still running are
+    not cached), recycles the removal pool so its workers reload, and, only
+    with delete_files, removes the downloaded model files. Requests already
+    running keep their session and finish. Returns a summary dict.
+    """
+    global _warmup
+    from session_cache import get_session_cache
+    from processor_pool import recycle_removal_pool
+
+    with _files_lock:
+        report = {
+            "sessions_dropped": get_session_cache().discard(),
+            "pool_recycled": recycle_removal_pool(),
+            "files_deleted": [],
+        }
+        if delete_files:
+            for filename, _ in MODEL_FILES.values():
+                path = os.path.join(model_home(), filename)
+                try:
+                    os.remove(path)
+                    report["files_deleted"].append(filename)
+                except FileNotFoundError:
+                    pass
+        with _warmup_lock:
+            # The next get_warmup().start() prepares the models again
+            _warmup = None
+    print(f"[Models] Cache cleared: {report}")
+    return report
+
+
+_warmup = None
+_warmup_lock = threading.Lock()
+
+def get_warmup():
+    """Process-wide warm-up for PIXELOFF_WARMUP_MODELS; call .start() once at startup."""
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = ModelWarmup()
+        return _warmup
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Provision, verify and warm up PixelOff's background removal models.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    prov = sub.add_parser("provision", help="Install models from a local mirror directory or .zip/.tar bundle")
+    prov.add_argument("--mirror", default=os.environ.get("PIXELOFF_MODEL_MIRROR"), help="Mirror directory or bundle (default PIXELOFF_MODEL_MIRROR)")
+    prov.add_argument("--force", action="store_true", help="Reinstall even if a verified copy exists")
+    for p in (prov, sub.add_parser("verify", help="Check installed models against their checksums"),
+              sub.add_parser("warmup", help="Load each model and run one dummy inference")):
+        p.add_argument("--models", default=",".join(configured_models()) or "isnet-general-use", help="Comma-separated model names")
+        p.add_argument("--home", help="Model directory (default U2NET_HOME or ~/.u2net)")
+    args = parser.parse_args()
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    if args.home:
+        os.environ["U2NET_HOME"] = args.home
+
+    failed = False
+    if args.command == "provision":
+        if not args.mirror:
+            parser.error("--mirror (or PIXELOFF_MODEL_MIRROR) is required")
+        for name, (path, error) in provision(args.mirror, models, force=args.force).items():
+            print(f"{'✅' if not error else '❌'} {name}: {path or error}")
+            failed |= bool(error)
+    elif args.command == "verify":
+        for name in models:
+            ok, detail = verify_model(name) if name in MODEL_FILES else (False, "Unknown model")
+            print(f"{'✅' if ok else '❌'} {name}: {detail}")
+            failed |= not ok
+    else:
+        for name, state in ModelWarmup(models).start().wait().items():
+            print(f"{'✅' if state['state'] in ('warm', 'ready') else '❌'} {name}: {state['state']} {state['detail']} ({state['ms']}ms)")
+            failed |= state["state"] == "failed"
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+
+from downloader import download_instagram_image, fetch_instagram_image, _extract_shortcode
+from processor import remove_background, remove_background_bytes, OUTPUT_FORMATS
+
+_DONE = object()
+
+
+def read_urls(source):
+    """URLs from a file path, or stdin when source is "-". Blank lines and # comments are skipped."""
+    stream = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    try:
+        return [line.strip() for line in stream if line.strip() and not line.strip().startswith("#")]
+    finally:
+        if stream is not sys.stdin: stream.close()
+
+def load_finished(output_path, retry_failed=False):
+    """URLs that already have a result line in output_path (failed ones too, unless retry_failed)."""
+    finished = set()
+    if not os.path.exists(output_path): return finished
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try: record = json.loads(line)
+            except ValueError: continue  # Truncated last line of an interrupted run
+            if retry_failed and record.get("error"): continue
+            finished.add(record.get("url"))
+    return finished
+
+
+class BatchPipeline:
+    """
+    Download and background removal as two concurrent stages joined by a
+    bounded queue, so relay I/O overlaps with ONNX inference. Each stage has
+    its own worker count; results are appended to a JSON Lines file as they finish.
+    max_side / mask_only select the low-memory removal mode (as on the command line).
+    """
+
+    def __init__(self, output_path, download_workers=2, removal_workers=1, queue_size=4,
+                 target_dir="downloads", img_index=1, model_name="isnet-general-use", max_side=None, mask_only=False):
+        self.output_path = output_path
+        self.download_workers = max(1, int(download_workers))
+        self.removal_workers = max(1, int(removal_workers))
+        self.target_dir = target_dir
+        self.img_index = img_index
+        self.model_name = model_name
+        self.max_side = max_side
+        self.mask_only = bool(mask_only)
+        self._urls = queue.Queue()
+        self._downloaded = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._write_lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        self.write_errors = 0
+
+    def _write(self, record):
+        """Appends a result line. A write error is counted and reported, never raised (it would kill the stage)."""
+        with self._write_lock:
+            self.written += 1
+            if record["error"]: self.failed += 1
+            try:
+                with open(self.output_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except (OSError, TypeError, ValueError) as e:
+                if not record["error"]: self.failed += 1
+                self.write_errors += 1
+                print(f"[Batch] ⚠️ Could not write the result for {record['url']} to {self.output_path}: {e}")
+        status = "❌ " + record["error"] if record["error"] else "✅ " + str(record["paths"].get("nobg") or record["paths"].get("mask"))
+        print(f"[Batch] {record['url']} -> {status}")
+
+    def _lost(self, url, error):
+        """A URL whose stage crashed: counted as failed so run() still finishes and reports it."""
+        with self._write_lock:
+            self.written += 1
+            self.failed += 1
+        print(f"[Batch] {url} -> ❌ Internal error: {error}")
+
+    def _download_stage(self):
+        while True:
+            url = self._urls.get()
+            if url is _DONE: return
+            try:
+                self._download(url)
+            except Exception as e:
+                self._lost(url, e)
+
+    def _download(self, url):
+        record = {
+            "url": url, "shortcode": _extract_shortcode(url), "paths": {},
+            "relay": None, "timings": {}, "error": None,
+        }
+        started = time.monotonic()
+        try:
+            result = download_instagram_image(url, target_dir=self.target_dir, img_index=self.img_index)
+            image_path, status = result[0], result[1]
+        except Exception as e:
+            image_path, status = None, f"Critical Error: {e}"
+        record["timings"]["download"] = round(time.monotonic() - started, 3)
+
+        if not image_path:
+            record["error"] = status or "Download failed"
+            self._write(record)
+            return
+        record["paths"]["image"] = image_path
+        record["relay"] = status
+        # Blocks when the removal stage falls behind (backpressure)
+        self._downloaded.put((record, time.monotonic()))
+
+    def _removal_stage(self):
+        # Every item is taken off the queue whatever happens to it, so downloaders never block forever
+        while True:
+            item = self._downloaded.get()
+            if item is _DONE: return
+            try:
+                self._remove(*item)
+            except Exception as e:
+                self._lost(item[0]["url"], e)
+
+    def _remove(self, record, queued_at):
+        started = time.monotonic()
+        record["timings"]["queue_wait"] = round(started - queued_at, 3)
+        try:
+            output_path, error = remove_background(record["paths"]["image"], model_name=self.model_name,
+                                                   max_side=self.max_side, mask_only=self.mask_only)
+        except Exception as e:
+            output_path, error = None, str(e)
+        record["timings"]["remove_background"] = round(time.monotonic() - started, 3)
+        if output_path: record["paths"]["mask" if self.mask_only else "nobg"] = output_path
+        else: record["error"] = f"Background removal failed: {error}"
+        self._write(record)
+
+    def run(self, urls):
+        downloaders = [threading.Thread(target=self._download_stage, name=f"batch-download-{i}") for i in range(self.download_workers)]
+        removers = [threading.Thread(target=self._removal_stage, name=f"batch-remove-{i}") for i in range(self.removal_workers)]
+        for t in downloaders + removers: t.start()
+
+        for url in urls: self._urls.put(url)
+        for _ in downloaders: self._urls.put(_DONE)
+        for t in downloaders: t.join()
+        for _ in removers: self._downloaded.put(_DONE)
+        for t in removers: t.join()
+        return self.written, self.failed
+
+
+def process_in_memory(url, img_index=1, model_name="isnet-general-use", output_format="png", crop=False,
+                      max_side=None, save_to=None):
+    """
+    Download -> background removal -> encoding with the image passed as bytes
+    between stages. Nothing is written unless save_to is given (a directory;
+    the file is named <shortcode>_slide<N>_nobg.<ext>).
+    Returns (data, mime type, status, error); status is the download status.
+    """
+    data, status, _ = fetch_instagram_image(url, img_index=img_index)
+    if data is None:
+        return None, None, None, status or "Download failed"
+
+    result, error = remove_background_bytes(data, model_name=model_name, output_format=output_format,
+                                            crop=crop, max_side=max_side)
+    if error:
+        return None, None, status, f"Background removal failed: {error}"
+    mime, extension = OUTPUT_FORMATS[output_format]
+
+    if save_to:
+        os.makedirs(save_to, exist_ok=True)
+        path = os.path.join(save_to, f"{_extract_shortcode(url)}_slide{img_index}_nobg{extension}")
+        with open(path, "wb") as f:
+            f.write(result)
+        print(f"Saved: {path}")
+    return result, mime, status, None
+
+
+def run_batch(source, output_path="results.jsonl", resume=True, retry_failed=False, **options):
+    """Runs a batch from a URL file (or "-" for stdin). Returns (processed, failed, skipped)."""
+    urls = list(dict.fromkeys(read_urls(source)))  # de-duplicate, keep order
+    finished = load_finished(output_path, retry_failed) if resume else set()
+    todo = [url for url in urls if url not in finished]
+    skipped = len(urls) - len(todo)
+    if skipped: print(f"[Batch] Resuming: skipping {skipped} URL(s) already in {output_path}")
+
+    pipeline = BatchPipeline(output_path, **options)
+    written, failed = pipeline.run(todo)
+    if pipeline.write_errors:
+        print(f"[Batch] ⚠️ {pipeline.write_errors} result(s) could not be written to {output_path}; re-running will process them again")
+    return written, failed, skipped
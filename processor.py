@@ -1,25 +1,70 @@
 from PIL import Image
+import io
 import os
+import numpy as np
 
-def remove_background(input_path, output_path=None, model_name="isnet-general-use"):
+from tracing import span, traced, annotate
+
+def _default_output_path(input_path, suffix="_nobg"):
+    file_name = os.path.basename(input_path)
+    name, ext = os.path.splitext(file_name)
+    new_name = f"{name}{suffix}.png"
+    directory = os.path.dirname(input_path)
+    return os.path.join(directory, new_name)
+
+@traced("remove_background")
+def remove_background(input_path, output_path=None, model_name="isnet-general-use", session=None, use_pool=None, timeout=None,
+                      use_cache=True, max_side=None, mask_only=False):
     """
     Removes the background from the image at input_path.
     Saves the result to output_path.
     model_name: "isnet-general-use" (default, high quality) or "u2net_human_seg" (human focus).
+    session: run on this rembg session instead of the cached one.
+    use_pool: dispatch to the worker process pool (default: on when PIXELOFF_REMOVAL_WORKERS > 0);
+    timeout bounds the wait for a pooled job.
+    use_cache: return the stored result when this image/model was already processed.
+    max_side / mask_only: use the low-resolution mask mode (see remove_background_lowres),
+    also selected by PIXELOFF_REMOVAL_MODE=lowres. max_side caps only the copy the
+    model sees; the cutout keeps the input's full resolution.
     """
+    options = {}
+    if max_side or mask_only or os.environ.get("PIXELOFF_REMOVAL_MODE", "").lower() == "lowres":
+        options = {"lowres": True, "max_side": max_side, "mask_only": bool(mask_only)}
+    if output_path is None:
+        output_path = _default_output_path(input_path, "_mask" if mask_only else "_nobg")
+    annotate(model=model_name, **options)
+
+    cache = key = None
+    if use_cache:
+        from result_cache import get_result_cache
+        cache = get_result_cache()
+        key = cache.key(input_path, model_name, **options)
+        if cache.lookup(key, output_path):
+            print(f"Background removal cache hit: {output_path}")
+            annotate(cache="hit")
+            return output_path, None
+
+    from processor_pool import pool_enabled, get_removal_pool
+    if use_pool or (use_pool is None and session is None and pool_enabled()):
+        print(f"Dispatching to removal pool: {input_path} ({model_name})")
+        annotate(pooled=True)
+        result = get_removal_pool().remove(os.path.abspath(input_path), os.path.abspath(output_path), model_name, timeout, **options)
+    elif options:
+        result = remove_background_lowres(input_path, output_path, model_name, max_side=max_side, mask_only=mask_only, session=session)[:2]
+    else:
+        result = _remove_with_rembg(input_path, output_path, model_name, session)
+
+    if cache is not None and result[0]:
+        cache.store(key, result[0])
+    return result
+
+def _remove_with_rembg(input_path, output_path, model_name, session=None):
     # Lazy import to prevent app startup lag/timeout
     try:
         from rembg import remove, new_session
     except ImportError as e:
         return None, f"Library Error: {e}"
 
-    if output_path is None:
-        file_name = os.path.basename(input_path)
-        name, ext = os.path.splitext(file_name)
-        new_name = f"{name}_nobg.png"
-        directory = os.path.dirname(input_path)
-        output_path = os.path.join(directory, new_name)
-
     print(f"Processing image: {input_path}")
     print(f"Removing background... Using model: {model_name}")
 
@@ -28,8 +73,10 @@ def remove_background(input_path, output_path=None, model_name="isnet-general-us
             input_image = i.read()
             
         # Use cached session to prevent reloading model
-        session = _get_rembg_session(model_name)
-        output_image = remove(input_image, session=session)
+        if session is None:
+            session = _get_rembg_session(model_name)
+        with span("inference", model=model_name, engine="rembg", bytes=len(input_image)):
+            output_image = remove(input_image, session=session)
         
         with open(output_path, 'wb') as o:
             o.write(output_image)
@@ -45,10 +92,328 @@ def remove_background(input_path, output_path=None, model_name="isnet-general-us
         print(f"Error removing background: {e}")
         return None, str(e)
 
-import streamlit as st
+# --- BATCH INFERENCE ---
+# rembg's preprocessing for the models we serve: (mean, std, model input size)
+MODEL_SPECS = {
+    "isnet-general-use": ((0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (1024, 1024)),
+    "u2net_human_seg": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+}
+
+def _load_rgb(item):
+    from PIL import ImageOps
+    img = item if isinstance(item, Image.Image) else Image.open(item)
+    return ImageOps.exif_transpose(img).convert("RGB")
+
+def _preprocess(images, mean, std, size):
+    """Resizes and normalizes images into one (N, 3, H, W) float32 tensor."""
+    batch = np.stack([np.asarray(img if img.size == size else img.resize(size, Image.LANCZOS), dtype=np.float32) for img in images])
+    peak = np.maximum(batch.max(axis=(1, 2, 3), keepdims=True), 1e-6)
+    batch = (batch / peak - np.asarray(mean, dtype=np.float32)) / np.asarray(std, dtype=np.float32)
+    return np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+
+def _run_model(session, tensor):
+    """One forward pass per batch; models exported with a fixed batch size run in chunks of it."""
+    model_input = session.inner_session.get_inputs()[0]
+    fixed = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+    if not fixed or fixed >= len(tensor):
+        return session.inner_session.run(None, {model_input.name: tensor})[0]
+    return np.concatenate([
+        session.inner_session.run(None, {model_input.name: tensor[i:i + fixed]})[0]
+        for i in range(0, len(tensor), fixed)
+    ])
+
+def _masks_from_predictions(preds):
+    """Per-image min-max normalization of the first output channel, as uint8 masks."""
+    preds = preds[:, 0, :, :]
+    lo = preds.min(axis=(1, 2), keepdims=True)
+    hi = preds.max(axis=(1, 2), keepdims=True)
+    return ((preds - lo) / np.maximum(hi - lo, 1e-6) * 255).astype(np.uint8)
+
+def _cutout(img, mask):
+    """Same result as rembg's naive cutout: RGB scaled by alpha, alpha = mask."""
+    alpha = np.asarray(Image.fromarray(mask, mode="L").resize(img.size, Image.LANCZOS))
+    rgb = np.asarray(img)
+    out = np.empty(rgb.shape[:2] + (4,), dtype=np.uint8)
+    out[..., :3] = (rgb.astype(np.uint16) * alpha[..., None] + 127) // 255
+    out[..., 3] = alpha
+    return Image.fromarray(out, mode="RGBA")
+
+@traced("inference", engine="batch")
+def _infer_batch(session, images, model_name):
+    annotate(model=model_name, batch=len(images))
+    mean, std, size = MODEL_SPECS[model_name]
+    masks = _masks_from_predictions(_run_model(session, _preprocess(images, mean, std, size)))
+    return [_cutout(img, mask) for img, mask in zip(images, masks)]
+
+def remove_background_batch(paths_or_images, model_name="isnet-general-use", batch_size=4):
+    """
+    Removes backgrounds from many images with one ONNX forward pass per batch.
+    Paths are saved next to the input as *_nobg.png and come back as paths;
+    PIL images come back as RGBA images.
+    Returns [(result, error), ...] in input order.
+    """
+    items = list(paths_or_images)
+    try:
+        from rembg import remove
+    except ImportError as e:
+        return [(None, f"Library Error: {e}") for _ in items]
+
+    results = [None] * len(items)
+    batch_size = max(1, int(batch_size))
+
+    # Paths processed before with this model are served from the result cache
+    from result_cache import get_result_cache
+    cache = get_result_cache()
+    keys = {}
+    for index, item in enumerate(items):
+        if isinstance(item, Image.Image): continue
+        keys[index] = cache.key(item, model_name)
+        output_path = _default_output_path(item)
+        if cache.lookup(keys[index], output_path):
+            results[index] = (output_path, None)
+    pending = [index for index, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+
+    session = _get_rembg_session(model_name)
+    print(f"Removing background from {len(pending)} image(s) in batches of {batch_size}... Using model: {model_name}")
+
+    def _infer(images):
+        if model_name in MODEL_SPECS:
+            return _infer_batch(session, images, model_name)
+        # No known preprocessing for this model: fall back to rembg per image
+        return [remove(img, session=session) for img in images]
+
+    for start in range(0, len(pending), batch_size):
+        loaded = []
+        for index in pending[start:start + batch_size]:
+            try:
+                loaded.append((index, _load_rgb(items[index])))
+            except Exception as e:
+                results[index] = (None, f"Load Error: {e}")
+        if not loaded:
+            continue
+
+        try:
+            cutouts = _infer([img for _, img in loaded])
+        except Exception as e:
+            # Isolate the failing image(s) instead of failing the whole batch
+            print(f"Batch inference failed ({e}); retrying images one by one")
+            cutouts = []
+            for index, img in loaded:
+                try: cutouts.append(_infer([img])[0])
+                except Exception as single_error: cutouts.append(single_error)
+
+        for (index, _), cutout in zip(loaded, cutouts):
+            if isinstance(cutout, Exception):
+                results[index] = (None, str(cutout))
+            elif isinstance(items[index], Image.Image):
+                results[index] = (cutout, None)
+            else:
+                output_path = _default_output_path(items[index])
+                try:
+                    cutout.save(output_path)
+                    cache.store(keys.get(index), output_path)
+                    results[index] = (output_path, None)
+                except Exception as e:
+                    results[index] = (None, f"Save Error: {e}")
+    return results
 
-@st.cache_resource(show_spinner=False)
 def _get_rembg_session(model_name):
-    # Lazy import inside cached function
-    from rembg import new_session
-    return new_session(model_name)
+    # Shared, memory-bounded session cache (no Streamlit dependency)
+    from session_cache import get_session
+    return get_session(model_name)
+
+# --- LOW-RESOLUTION MASK MODE ---
+COMPOSITE_ROWS = 256
+
+def _rss_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except Exception:
+        return None
+
+@traced("decode")
+def _open_image(source):
+    """
+    Decodes source (a path, a file-like object or a PIL image) at full
+    resolution, upright. Images with transparency stay RGBA so their alpha
+    survives into the cutout; everything else is RGB.
+    """
+    from PIL import ImageOps
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    img = ImageOps.exif_transpose(img)
+    transparent = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+    mode = "RGBA" if transparent else "RGB"
+    return img if img.mode == mode else img.convert(mode)
+
+def _working_copy(img, max_side=None):
+    """RGB copy for the model, no larger than max_side per side (the original is left as is)."""
+    if max_side and max(img.size) > max_side:
+        scale = max_side / max(img.size)
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        img = img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+@traced("inference", engine="mask")
+def _predict_mask(session, img, model_name, max_side=None):
+    """
+    Runs the model on a working copy of img (capped at max_side, then resized
+    to the model input); returns the mask upscaled to img.size as an "L" image.
+    """
+    annotate(model=model_name, pixels=img.width * img.height)
+    mean, std, size = MODEL_SPECS[model_name]
+    working = _working_copy(img, max_side).resize(size, Image.LANCZOS)
+    mask = _masks_from_predictions(_run_model(session, _preprocess([working], mean, std, size)))[0]
+    return Image.fromarray(mask, mode="L").resize(img.size, Image.LANCZOS)
+
+@traced("composite")
+def _composite(img, alpha):
+    """
+    Full-resolution RGBA output with RGB scaled by alpha (rembg's naive
+    cutout), filled band by band so only COMPOSITE_ROWS rows of intermediates
+    exist at a time. An RGBA source's own alpha is multiplied in.
+    """
+    height, width = alpha.shape
+    out = np.empty((height, width, 4), dtype=np.uint8)
+    for top in range(0, height, COMPOSITE_ROWS):
+        bottom = min(top + COMPOSITE_ROWS, height)
+        pixels = np.asarray(img.crop((0, top, width, bottom)), dtype=np.uint16)
+        band_alpha = alpha[top:bottom].astype(np.uint16)
+        if img.mode == "RGBA":
+            band_alpha = (band_alpha * pixels[..., 3] + 127) // 255
+        rgb = pixels[..., :3]
+        rgb *= band_alpha[..., None]
+        rgb += 127
+        rgb //= 255
+        out[top:bottom, :, :3] = rgb
+        out[top:bottom, :, 3] = band_alpha
+    return Image.fromarray(out, mode="RGBA")
+
+def remove_background_lowres(input_path, output_path=None, model_name="isnet-general-use", max_side=None, mask_only=False, session=None):
+    """
+    Memory-lean background removal: decode once, run the model on a small
+    working copy (at most max_side per side) and keep only the single-channel
+    mask, then composite it onto the original full-resolution pixels. With
+    mask_only the mask itself is saved. Returns (output_path, error, report) where report lists buffer
+    sizes and the RSS growth sampled after each stage, in MB.
+    """
+    if model_name not in MODEL_SPECS:
+        return None, f"Low-resolution mode does not support model: {model_name}", {}
+    if output_path is None:
+        output_path = _default_output_path(input_path, "_mask" if mask_only else "_nobg")
+
+    report = {"rss_start_mb": _rss_mb()}
+    peak = [report["rss_start_mb"]]
+    def _sample():
+        rss = _rss_mb()
+        if rss is not None: peak.append(rss)
+
+    print(f"Processing image (low-res mask mode): {input_path}")
+    try:
+        img = _open_image(input_path)
+        width, height = img.size
+        _, _, size = MODEL_SPECS[model_name]
+        report.update({
+            "size": [width, height],
+            "decoded_mb": round(width * height * len(img.getbands()) / 2**20, 1),
+            "model_input_mb": round(size[0] * size[1] * 3 * 4 / 2**20, 1),
+            "mask_mb": round(width * height / 2**20, 1),
+        })
+        _sample()
+
+        if session is None:
+            session = _get_rembg_session(model_name)
+        mask = _predict_mask(session, img, model_name, max_side)
+        _sample()
+
+        if mask_only:
+            with span("encode", format="png"):
+                mask.save(output_path)
+        else:
+            alpha = np.asarray(mask)
+            del mask
+            result = _composite(img, alpha)
+            report["output_mb"] = round(width * height * 4 / 2**20, 1)
+            del img, alpha
+            _sample()
+            with span("encode", format="png"):
+                result.save(output_path)
+            del result
+        _sample()
+    except Exception as e:
+        print(f"Error removing background: {e}")
+        return None, str(e), report
+
+    if None not in peak:
+        report["peak_rss_delta_mb"] = round(max(peak) - peak[0], 1)
+    print(f"Background removed. Saved to: {output_path} | memory: {report}")
+    return output_path, None, report
+
+# --- IN-MEMORY API AND OUTPUT ENCODINGS ---
+PNG_COMPRESS_LEVEL = int(os.environ.get("PIXELOFF_PNG_COMPRESS_LEVEL", "6"))
+# format -> (mime type, file extension)
+OUTPUT_FORMATS = {
+    "png": ("image/png", ".png"),
+    "webp": ("image/webp", ".webp"),
+}
+
+def crop_to_alpha(img, padding=2):
+    """Crops to the bounding box of the visible pixels (the mask itself for "L" images)."""
+    alpha = img.getchannel("A") if "A" in img.getbands() else img
+    bbox = alpha.getbbox()
+    if not bbox: return img
+    left, top, right, bottom = bbox
+    return img.crop((max(0, left - padding), max(0, top - padding),
+                     min(img.width, right + padding), min(img.height, bottom + padding)))
+
+def encode_image(img, output_format="png", crop=False):
+    """
+    Encodes a result image. "webp" is lossless WebP (typically ~20% smaller than
+    PNG for cutouts); "png" uses PIXELOFF_PNG_COMPRESS_LEVEL. crop trims the
+    transparent border first. Returns (bytes, mime type).
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    with span("encode", format=output_format, crop=bool(crop)) as s:
+        if crop:
+            img = crop_to_alpha(img)
+        buffer = io.BytesIO()
+        if output_format == "webp":
+            # exact=False lets the encoder rewrite the colour of fully transparent pixels
+            img.save(buffer, "WEBP", lossless=True, quality=80, method=4, exact=False)
+        else:
+            img.save(buffer, "PNG", compress_level=PNG_COMPRESS_LEVEL)
+        s.set(bytes=buffer.tell())
+        return buffer.getvalue(), OUTPUT_FORMATS[output_format][0]
+
+def encode_file(path, output_format="png", crop=False):
+    """Re-encodes a saved result (e.g. *_nobg.png) for download. Returns (bytes, mime type)."""
+    with Image.open(path) as img:
+        img.load()
+        return encode_image(img, output_format, crop)
+
+def remove_background_bytes(data, model_name="isnet-general-use", output_format="png", crop=False,
+                            max_side=None, mask_only=False, session=None):
+    """
+    In-memory background removal: data is image bytes, a file-like object or a
+    PIL image, and nothing touches disk. Returns (encoded bytes, error).
+    """
+    try:
+        source = io.BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+        img = _open_image(source)
+        if session is None:
+            session = _get_rembg_session(model_name)
+
+        if model_name in MODEL_SPECS:
+            mask = _predict_mask(session, img, model_name, max_side)
+            result = mask if mask_only else _composite(img, np.asarray(mask))
+        else:
+            from rembg import remove
+            result = remove(img, session=session, only_mask=mask_only)
+        del img
+        return encode_image(result, output_format, crop)[0], None
+    except Exception as e:
+        print(f"Error removing background: {e}")
+        return None, str(e)
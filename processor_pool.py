@@ -0,0 +1,172 @@
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from tracing import span
+
+# --- Worker process side ---
+_worker_sessions = {}
+
+def _make_session(model_name, intra_threads, inter_threads):
+    """
+    Builds the rembg session through its session class so our SessionOptions
+    reach onnxruntime: new_session() creates its own options and only reads
+    OMP_NUM_THREADS, which is too late to set once onnxruntime is loaded.
+    """
+    import onnxruntime as ort
+    from rembg.sessions import sessions_class
+
+    session_class = next((sc for sc in sessions_class if sc.name() == model_name), None)
+    if session_class is None:
+        raise ValueError(f"No rembg session class for model '{model_name}'")
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = intra_threads
+    opts.inter_op_num_threads = inter_threads
+    return session_class(model_name, opts)
+
+def _init_worker(model_names, intra_threads, inter_threads):
+    """Runs once per spawned worker: load every configured model with tuned thread counts."""
+    os.environ["PIXELOFF_REMOVAL_WORKER"] = "1"
+    for model_name in model_names:
+        _worker_sessions[model_name] = _make_session(model_name, intra_threads, inter_threads)
+    print(f"[RemovalPool] Worker {os.getpid()} ready: {', '.join(model_names)} "
+          f"(intra-op {intra_threads}, inter-op {inter_threads})")
+
+def _worker_remove(input_path, output_path, model_name, intra_threads, inter_threads, options=None):
+    from processor import remove_background, remove_background_lowres
+
+    session = _worker_sessions.get(model_name)
+    if session is None:
+        session = _worker_sessions[model_name] = _make_session(model_name, intra_threads, inter_threads)
+    if options:
+        return remove_background_lowres(input_path, output_path, model_name, session=session,
+                                        max_side=options.get("max_side"), mask_only=options.get("mask_only", False))[:2]
+    return remove_background(input_path, output_path, model_name=model_name, session=session,
+                             use_pool=False, use_cache=False)
+
+
+# --- Parent process side ---
+class RemovalPool:
+    """
+    Process pool for background removal. Each worker loads its ONNX sessions
+    once at spawn, with intra-op threads set to its share of the cores, so
+    concurrent jobs stop fighting over cores and the GIL. Jobs are passed as
+    file paths. At most `max_pending` jobs are in flight; submit() waits up to
+    `queue_timeout` for a slot (backpressure).
+    """
+
+    def __init__(self, workers=2, model_names=("isnet-general-use",), intra_op_threads=None,
+                 inter_op_threads=1, max_pending=None, queue_timeout=30, job_timeout=120):
+        self.workers = max(1, int(workers))
+        self.model_names = tuple(model_names)
+        self.intra_op_threads = int(intra_op_threads or max(1, (os.cpu_count() or 1) // self.workers))
+        self.inter_op_threads = max(1, int(inter_op_threads))
+        self.queue_timeout = queue_timeout
+        self.job_timeout = job_timeout
+        self._slots = threading.BoundedSemaphore(int(max_pending or self.workers * 2))
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            # spawn: forking a process that already runs ONNX/Playwright threads is unsafe
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_names, self.intra_op_threads, self.inter_op_threads),
+        )
+        self.submitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def submit(self, input_path, output_path, model_name, **options):
+        """Returns a Future of (output_path, error), or raises TimeoutError if the pool stays full."""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.rejected += 1
+            raise TimeoutError(f"Removal pool busy: {self.workers} workers, no free slot in {self.queue_timeout}s")
+        try:
+            future = self._executor.submit(_worker_remove, input_path, output_path, model_name,
+                                           self.intra_op_threads, self.inter_op_threads, options)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot frees when the job really ends, so a timed-out job keeps counting against the pool
+        future.add_done_callback(lambda _: self._slots.release())
+        self.submitted += 1
+        return future
+
+    def remove(self, input_path, output_path, model_name, timeout=None, **options):
+        """Blocking submit + wait with a per-job timeout. Returns (output_path, error)."""
+        with span("removal.pool", model=model_name, workers=self.workers) as s:
+            output_path, error = self._remove(input_path, output_path, model_name, timeout, options)
+            if error: s.fail(error)
+            return output_path, error
+
+    def _remove(self, input_path, output_path, model_name, timeout, options):
+        try:
+            future = self.submit(input_path, output_path, model_name, **options)
+        except TimeoutError as e:
+            return None, str(e)
+        timeout = timeout or self.job_timeout
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            return None, f"Background removal timed out after {timeout}s"
+        except Exception as e:
+            return None, f"Worker Error: {e}"
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+    def shutdown(self, cancel_pending=True):
+        self._executor.shutdown(wait=False, cancel_futures=cancel_pending)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_removal_pool():
+    """Process-wide pool sized by PIXELOFF_REMOVAL_WORKERS, preloading PIXELOFF_REMOVAL_MODELS."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            models = os.environ.get("PIXELOFF_REMOVAL_MODELS", "isnet-general-use")
+            _pool = RemovalPool(
+                workers=int(os.environ.get("PIXELOFF_REMOVAL_WORKERS", "2")),
+                model_names=[m.strip() for m in models.split(",") if m.strip()],
+                job_timeout=float(os.environ.get("PIXELOFF_REMOVAL_TIMEOUT", "120")),
+            )
+        return _pool
+
+def pool_enabled():
+    """True when PIXELOFF_REMOVAL_WORKERS asks for a pool and we are not a pool worker ourselves."""
+    if os.environ.get("PIXELOFF_REMOVAL_WORKER"): return False
+    return int(os.environ.get("PIXELOFF_REMOVAL_WORKERS", "0")) > 0
+
+def shutdown_removal_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+def recycle_removal_pool():
+    """
+    Detaches the pool so the next job spawns fresh workers (which reload their
+    models); jobs already queued on the old workers still finish. Returns True
+    if there was a pool.
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_pending=False)
+    return pool is not None
+
+atexit.register(shutdown_removal_pool)
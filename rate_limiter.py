@@ -0,0 +1,170 @@
+import os
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+# Responses that mean "slow down" rather than "broken"
+RATE_LIMIT_STATUSES = (429, 503)
+
+# Longest Retry-After we take literally (a relay asking for a day is treated as "an hour")
+MAX_RETRY_AFTER = 3600
+
+
+def parse_retry_after(value, now=None):
+    """Retry-After header (delta-seconds or HTTP-date) -> seconds to wait, or None."""
+    if not value: return None
+    value = str(value).strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - (now or time.time())
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return None
+    return min(MAX_RETRY_AFTER, max(0.0, seconds))
+
+def backoff_delay(strikes, base, cap):
+    """Exponential backoff with "equal jitter": half of base * 2^(strikes-1) fixed, half random."""
+    delay = min(cap, base * 2 ** max(0, strikes - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class TokenBucket:
+    """`rate` tokens per second, up to `burst` saved. reserve() never blocks; it says how long to wait."""
+
+    def __init__(self, rate, burst):
+        self.rate = max(0.001, float(rate))
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """Takes a token (going into debt if needed) and returns seconds until it is really available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class RateScheduler:
+    """
+    Shared pacing for everything the download path sends out: one token
+    bucket per relay (browser visits) and per CDN host (file transfers), and
+    a cooldown per key after a 429/503. The cooldown honours Retry-After when
+    the server sends one, otherwise it grows with jittered exponential backoff
+    on repeated strikes; a success clears it. cooldowns() is what the UI reads.
+    """
+
+    def __init__(self, relay_rate=None, relay_burst=None, cdn_rate=None, cdn_burst=None,
+                 backoff_base=None, backoff_max=None):
+        env = os.environ.get
+        self.limits = {
+            "relay": (float(relay_rate or env("PIXELOFF_RELAY_RATE", "0.5")), float(relay_burst or env("PIXELOFF_RELAY_BURST", "3"))),
+            "cdn": (float(cdn_rate or env("PIXELOFF_CDN_RATE", "8")), float(cdn_burst or env("PIXELOFF_CDN_BURST", "16"))),
+        }
+        self.backoff_base = float(backoff_base or env("PIXELOFF_BACKOFF_BASE", "5"))
+        self.backoff_max = float(backoff_max or env("PIXELOFF_BACKOFF_MAX", "300"))
+        self._keys = {}  # key -> {"kind", "bucket", "strikes", "until", "reason", "retry_after", "penalties"}
+        self._lock = threading.Lock()
+
+    def _entry(self, key, kind):
+        entry = self._keys.get(key)
+        if entry is None:
+            entry = self._keys[key] = {"kind": kind, "bucket": TokenBucket(*self.limits[kind]),
+                                       "strikes": 0, "until": 0.0, "reason": None, "retry_after": None, "penalties": 0}
+        return entry
+
+    def cooldown(self, key):
+        """Seconds left in key's cooldown (0 if none)."""
+        with self._lock:
+            entry = self._keys.get(key)
+            return max(0.0, entry["until"] - time.monotonic()) if entry else 0.0
+
+    def reserve(self, key, kind="relay", max_cooldown=0):
+        """
+        Non-blocking: seconds the caller must sleep before sending to key, or
+        None if key is cooling down for longer than max_cooldown (skip it).
+        """
+        with self._lock:
+            entry = self._entry(key, kind)
+            cooling = entry["until"] - time.monotonic()
+            if cooling > max_cooldown:
+                return None
+            return max(cooling, 0.0) + entry["bucket"].reserve()
+
+    def wait(self, key, kind="relay", cancel=None, max_cooldown=0):
+        """
+        Blocking reserve(): sleeps until key may be used. Returns (True, None),
+        or (False, reason) when key is cooling down or cancel fires first.
+        """
+        delay = self.reserve(key, kind, max_cooldown)
+        if delay is None:
+            return False, f"{key} cooling down for {self.cooldown(key):.0f}s ({self._reason(key)})"
+        end = time.monotonic() + delay
+        while True:
+            left = end - time.monotonic()
+            if left <= 0: return True, None
+            if cancel is not None and cancel.cancelled:
+                return False, f"Cancelled while pacing requests to {key}"
+            time.sleep(min(0.25, left))
+
+    def _reason(self, key):
+        with self._lock:
+            entry = self._keys.get(key)
+            return entry["reason"] if entry else None
+
+    def penalize(self, key, status=429, retry_after=None, kind="relay"):
+        """Records a 429/503 from key and starts (or extends) its cooldown. Returns its length in seconds."""
+        with self._lock:
+            entry = self._entry(key, kind)
+            entry["strikes"] += 1
+            entry["penalties"] += 1
+            delay = retry_after if retry_after is not None else backoff_delay(entry["strikes"], self.backoff_base, self.backoff_max)
+            entry["until"] = max(entry["until"], time.monotonic() + delay)
+            entry["reason"] = f"HTTP {status}"
+            entry["retry_after"] = retry_after
+        print(f"[RateLimit] {key}: HTTP {status}, cooling down {delay:.0f}s"
+              + (" (Retry-After)" if retry_after is not None else f" (strike {entry['strikes']})"))
+        return delay
+
+    def success(self, key):
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry:
+                entry["strikes"] = 0
+                entry["until"] = 0.0
+
+    def cooldowns(self):
+        """Active cooldowns: {key: {kind, remaining_s, until (epoch seconds), reason, strikes}}."""
+        now, wall = time.monotonic(), time.time()
+        with self._lock:
+            return {
+                key: {
+                    "kind": entry["kind"],
+                    "remaining_s": round(entry["until"] - now, 1),
+                    "until": wall + entry["until"] - now,
+                    "reason": entry["reason"],
+                    "retry_after": entry["retry_after"],
+                    "strikes": entry["strikes"],
+                }
+                for key, entry in self._keys.items() if entry["until"] > now
+            }
+
+    def stats(self):
+        with self._lock:
+            return {key: {"kind": e["kind"], "penalties": e["penalties"], "tokens": round(e["bucket"].tokens, 2)}
+                    for key, e in self._keys.items()}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Process-wide scheduler (PIXELOFF_RELAY_RATE/_BURST, PIXELOFF_CDN_RATE/_BURST, PIXELOFF_BACKOFF_BASE/_MAX)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RateScheduler()
+        return _scheduler
@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import importlib
+import importlib.util
+import threading
+import subprocess
+from contextlib import contextmanager
+
+READINESS_TTL = float(os.environ.get("PIXELOFF_READINESS_TTL", "300"))
+
+
+def _check_modules(*names):
+    """Importable without importing (find_spec is cheap; importing rembg is not)."""
+    missing = [name for name in names if importlib.util.find_spec(name) is None]
+    return not missing, "OK" if not missing else f"Missing: {', '.join(missing)}"
+
+def _check_chromium():
+    """Opens a page on the shared browser pool; doubles as its warm-up."""
+    from browser_pool import get_pool
+    get_pool().run(lambda page: page.evaluate("1 + 1"), timeout=60)
+    return True, "Launched"
+
+def _install_chromium():
+    print("[Readiness] Installing Chromium...")
+    cmd = [sys.executable, "-m", "playwright", "install", "chromium"]
+    res = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+    return res.returncode == 0, (res.stderr or res.stdout).strip()[-300:]
+
+
+class ReadinessProbe:
+    """
+    Dependency checks (rembg/onnxruntime, Playwright, a real Chromium launch)
+    run on a background thread so the UI renders immediately. The result is
+    cached for `ttl` seconds; refresh() starts a new probe only when stale.
+    A missing Chromium is installed in the background (PIXELOFF_AUTO_INSTALL=0 disables).
+    """
+
+    def __init__(self, ttl=None, auto_install=None):
+        self.ttl = READINESS_TTL if ttl is None else ttl
+        if auto_install is None:
+            auto_install = os.environ.get("PIXELOFF_AUTO_INSTALL", "1").lower() not in ("0", "off", "false")
+        self.auto_install = auto_install
+        self._lock = threading.Lock()
+        self._thread = None
+        self._result = None
+        self._done = threading.Event()
+
+    def refresh(self, force=False):
+        """Starts a background probe if the cached result is missing or older than ttl. Returns self."""
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+            stale = self._result is None or time.time() - self._result["checked_at"] > self.ttl
+            if not running and (force or stale):
+                if self._result is None: self._done.clear()
+                self._thread = threading.Thread(target=self._run, name="pixeloff-readiness", daemon=True)
+                self._thread.start()
+        return self
+
+    def result(self, wait=0):
+        """Latest result dict (None until the first probe finishes). wait: seconds to block for it."""
+        if wait: self._done.wait(wait)
+        with self._lock:
+            return None if self._result is None else dict(self._result)
+
+    @property
+    def running(self):
+        with self._lock:
+            return self._thread is not None and self._thread.is_alive()
+
+    def _timed(self, check):
+        started = time.perf_counter()
+        try:
+            ok, detail = check()
+        except Exception as e:
+            ok, detail = False, str(e).splitlines()[0][:300]
+        return {"ok": ok, "detail": detail, "ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    def _run(self):
+        started = time.perf_counter()
+        checks = {
+            "rembg/onnx": self._timed(lambda: _check_modules("rembg", "onnxruntime")),
+            "Playwright": self._timed(lambda: _check_modules("playwright")),
+        }
+        if checks["Playwright"]["ok"]:
+            checks["Chromium"] = self._timed(_check_chromium)
+            if not checks["Chromium"]["ok"] and self.auto_install and "Executable doesn't exist" in checks["Chromium"]["detail"]:
+                checks["Chromium Install"] = self._timed(_install_chromium)
+                if checks["Chromium Install"]["ok"]:
+                    checks["Chromium"] = self._timed(_check_chromium)
+
+        result = {
+            "ready": all(c["ok"] for name, c in checks.items() if name != "Chromium Install"),
+            "checks": checks,
+            "checked_at": time.time(),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        print(f"[Readiness] {'ready' if result['ready'] else 'NOT ready'} in {result['duration_ms']}ms: "
+              + ", ".join(f"{name} {'ok' if c['ok'] else 'failed'}" for name, c in checks.items()))
+        with self._lock:
+            self._result = result
+        self._done.set()
+
+
+class StartupReport:
+    """Startup phases and deferred import timings for the app's first run."""
+
+    def __init__(self):
+        self.phases = {}
+        self.imports = {}
+        self.first_paint_s = None
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.setdefault(name, round((time.perf_counter() - started) * 1000, 1))
+
+    def timed_import(self, name):
+        """import_module that records how long the first import took."""
+        started = time.perf_counter()
+        already = name in sys.modules
+        module = importlib.import_module(name)
+        if not already:
+            self.imports[name] = round((time.perf_counter() - started) * 1000, 1)
+        return module
+
+    def mark_first_paint(self):
+        """Seconds from process start to the end of the first script run (recorded once)."""
+        if self.first_paint_s is None:
+            try:
+                import psutil
+                self.first_paint_s = round(time.time() - psutil.Process().create_time(), 2)
+            except Exception:
+                self.first_paint_s = -1
+
+    def as_dict(self):
+        return {
+            "time_to_first_paint_s": self.first_paint_s,
+            "phases_ms": dict(self.phases),
+            "imports_ms": dict(self.imports),
+        }
+
+
+_probe = None
+_report = StartupReport()
+_probe_lock = threading.Lock()
+
+def get_probe():
+    global _probe
+    with _probe_lock:
+        if _probe is None:
+            _probe = ReadinessProbe()
+        return _probe
+
+def get_startup_report():
+    return _report
@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import time
+import atexit
+import threading
+
+# Priors for a relay we know nothing about (Beta(1,1) success, 15s per attempt)
+PRIOR_SUCCESS = 1.0
+PRIOR_FAILURE = 1.0
+PRIOR_LATENCY = 15.0
+
+def classify_failure(status):
+    """Maps a relay status string to a failure class: timeout, no_slides, http_<code>, cancelled, out_of_range or error."""
+    text = (status or "").lower()
+    # The relay answered fine, the post just has fewer slides than asked for
+    if "index out of range" in text: return "out_of_range"
+    m = re.search(r'http (\d{3})', text)
+    if m: return f"http_{m.group(1)}"
+    if "timeout" in text or "timed out" in text: return "timeout"
+    if "cancelled" in text: return "cancelled"
+    if "no slides" in text or "no content" in text or "not found" in text: return "no_slides"
+    return "error"
+
+
+class RelayScoreboard:
+    """
+    Small on-disk scoreboard of relay outcomes with exponential decay.
+
+    Each relay keeps decayed success/failure weights and latency sums, so old
+    results fade with `half_life` seconds. Relays are ordered by expected
+    time-to-success; `failure_threshold` consecutive failures open a circuit
+    breaker for `cooldown` seconds. Changes reach disk at most every
+    `save_interval` seconds (and on flush() / exit), off the fetch path's lock.
+    """
+
+    def __init__(self, path=None, half_life=3600, failure_threshold=3, cooldown=300, save_interval=None):
+        self.path = path or os.environ.get("PIXELOFF_SCOREBOARD", os.path.join("downloads", "relay_scoreboard.json"))
+        self.half_life = float(half_life)
+        self.failure_threshold = int(failure_threshold)
+        self.cooldown = float(cooldown)
+        self.save_interval = float(save_interval if save_interval is not None else os.environ.get("PIXELOFF_SCOREBOARD_SAVE_INTERVAL", "30"))
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._relays = self._load()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _take_snapshot(self, force=False):
+        """Under self._lock: the JSON to write if a save is due (dirty and interval passed, or forced), else None."""
+        now = time.monotonic()
+        if not self._dirty or (not force and now - self._saved_at < self.save_interval):
+            return None
+        self._dirty = False
+        self._saved_at = now
+        return json.dumps(self._relays, indent=1)
+
+    def _write(self, data):
+        with self._save_lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"[Scoreboard] Could not save {self.path}: {e}")
+
+    def flush(self):
+        """Writes unsaved changes now."""
+        with self._lock:
+            data = self._take_snapshot(force=True)
+        if data is not None: self._write(data)
+
+    def _entry(self, name, now):
+        entry = self._relays.setdefault(name, {
+            "successes": 0.0, "failures": 0.0,
+            "success_time": 0.0, "failure_time": 0.0,
+            "streak": 0, "open_until": 0.0,
+            "failure_classes": {}, "last_failure": None, "updated": now,
+        })
+        # Decay every weight by the time since the last update
+        factor = 0.5 ** (max(0.0, now - entry["updated"]) / self.half_life)
+        for key in ("successes", "failures", "success_time", "failure_time"):
+            entry[key] *= factor
+        for cls in entry["failure_classes"]:
+            entry["failure_classes"][cls] *= factor
+        entry["updated"] = now
+        return entry
+
+    def record(self, name, ok, latency, failure=None):
+        """Records one attempt. `failure` is a class from classify_failure()."""
+        if failure in ("cancelled", "out_of_range"): return
+        now = time.time()
+        with self._lock:
+            entry = self._entry(name, now)
+            if ok:
+                entry["successes"] += 1
+                entry["success_time"] += latency
+                entry["streak"] = 0
+                entry["open_until"] = 0.0
+            else:
+                entry["failures"] += 1
+                entry["failure_time"] += latency
+                entry["streak"] += 1
+                cls = failure or "error"
+                entry["failure_classes"][cls] = entry["failure_classes"].get(cls, 0.0) + 1
+                entry["last_failure"] = cls
+                if entry["streak"] >= self.failure_threshold:
+                    entry["open_until"] = now + self.cooldown
+            self._dirty = True
+            data = self._take_snapshot()
+        if data is not None: self._write(data)
+
+    def expected_time(self, name, prior_success=PRIOR_SUCCESS):
+        """Expected seconds until a success when retrying this relay: E[attempt time] / P(success)."""
+        with self._lock:
+            return self._expected(self._entry(name, time.time()), prior_success)
+
+    @staticmethod
+    def _expected(entry, prior_success=PRIOR_SUCCESS):
+        s = entry["successes"] + prior_success
+        f = entry["failures"] + PRIOR_FAILURE
+        p = s / (s + f)
+        success_latency = (entry["success_time"] + PRIOR_LATENCY * prior_success) / s
+        failure_latency = (entry["failure_time"] + PRIOR_LATENCY * PRIOR_FAILURE) / f
+        return (p * success_latency + (1 - p) * failure_latency) / p
+
+    def is_open(self, name):
+        """True while the relay's circuit breaker is open (cooling down)."""
+        with self._lock:
+            entry = self._relays.get(name)
+            return bool(entry) and entry["open_until"] > time.time()
+
+    def order(self, names, reserves=()):
+        """
+        Sorts relays by expected time-to-success, skipping open circuits.
+        Reserve relays start with a pessimistic prior and move up only by scoring well.
+        If every relay is cooling down, all of them are returned so the request still runs.
+        """
+        def _score(name):
+            return self.expected_time(name, prior_success=0.25 if name in reserves else PRIOR_SUCCESS)
+
+        ranked = sorted(names, key=_score)
+        closed = [name for name in ranked if not self.is_open(name)]
+        return closed or ranked
+
+    def snapshot(self):
+        """Scores for display/diagnostics."""
+        now = time.time()
+        rows = {}
+        with self._lock:
+            entries = {name: dict(self._entry(name, now)) for name in list(self._relays)}
+        for name, entry in entries.items():
+            rows[name] = {
+                "expected_s": round(self._expected(entry), 2),
+                "successes": round(entry["successes"], 2),
+                "failures": round(entry["failures"], 2),
+                "last_failure": entry["last_failure"],
+                "cooldown_s": max(0, int(entry["open_until"] - now)),
+            }
+        return rows
+
+
+_scoreboard = None
+_scoreboard_lock = threading.Lock()
+
+def get_scoreboard():
+    global _scoreboard
+    with _scoreboard_lock:
+        if _scoreboard is None:
+            _scoreboard = RelayScoreboard()
+        return _scoreboard
+
+def flush_scoreboard():
+    with _scoreboard_lock:
+        scoreboard = _scoreboard
+    if scoreboard is not None:
+        scoreboard.flush()
+
+atexit.register(flush_scoreboard)
@@ -0,0 +1,154 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+from download_cache import file_sha256
+
+
+class ResultCache:
+    """
+    Cache of background-removal results keyed by (input content hash, model,
+    options). Two tiers:
+      - memory: LRU of encoded results, bounded by max_bytes
+      - disk: the *_nobg.png output itself, with a `<output>.key` sidecar
+        recording the key it was produced from
+    A rerun on the same image is a lookup instead of an ONNX inference.
+    """
+
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("PIXELOFF_RESULT_CACHE_MB", "64")) * 2**20)
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()  # key -> (output_path, data)
+        self._hashes = {}  # (abs path, mtime, size) -> sha256, so reruns don't rehash
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _content_hash(self, input_path):
+        st = os.stat(input_path)
+        stamp = (os.path.abspath(input_path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            digest = self._hashes.get(stamp)
+        if digest is None:
+            digest = file_sha256(input_path)
+            with self._lock:
+                if len(self._hashes) > 4096: self._hashes.clear()
+                self._hashes[stamp] = digest
+        return digest
+
+    def key(self, input_path, model_name, **options):
+        """Cache key for this input/model/options, or None if the input can't be read."""
+        try:
+            content = self._content_hash(input_path)
+        except OSError:
+            return None
+        spec = json.dumps({"model": model_name, "options": options}, sort_keys=True)
+        return hashlib.sha256(f"{content}|{spec}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _sidecar(output_path):
+        return output_path + ".key"
+
+    @classmethod
+    def _disk_key(cls, output_path):
+        try:
+            with open(cls._sidecar(output_path), "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    @classmethod
+    def _disk_valid(cls, key, output_path):
+        return os.path.isfile(output_path) and os.path.getsize(output_path) > 0 and cls._disk_key(output_path) == key
+
+    def lookup(self, key, output_path):
+        """Returns output_path holding the cached result, or None on a miss."""
+        if key is None: return None
+        if self._disk_valid(key, output_path):
+            with self._lock:
+                self.disk_hits += 1
+                if key in self._memory: self._memory.move_to_end(key)
+            return output_path
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None: self._memory.move_to_end(key)
+        if entry is not None:
+            cached_path, data = entry
+            try:
+                # Same content, different destination (or the output was deleted)
+                if data is not None:
+                    with open(output_path, "wb") as f: f.write(data)
+                elif self._disk_valid(key, cached_path):
+                    shutil.copyfile(cached_path, output_path)
+                else:
+                    entry = None
+                if entry is not None:
+                    self._write_sidecar(key, output_path)
+                    with self._lock: self.memory_hits += 1
+                    return output_path
+            except OSError:
+                pass
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    @classmethod
+    def _write_sidecar(cls, key, output_path):
+        with open(cls._sidecar(output_path), "w", encoding="utf-8") as f:
+            f.write(key)
+
+    def store(self, key, output_path):
+        """Records a freshly produced result in both tiers."""
+        if key is None: return
+        try:
+            self._write_sidecar(key, output_path)
+            size = os.path.getsize(output_path)
+            data = None
+            # Large results keep only their path and are served from the disk tier
+            if size <= self.max_bytes // 4:
+                with open(output_path, "rb") as f: data = f.read()
+        except OSError as e:
+            print(f"[ResultCache] Could not store result: {e}")
+            return
+        with self._lock:
+            self._memory[key] = (output_path, data)
+            self._memory.move_to_end(key)
+            self._evict()
+
+    def _memory_bytes(self):
+        return sum(len(data) for _, data in self._memory.values() if data is not None)
+
+    def _evict(self):
+        while self._memory_bytes() > self.max_bytes:
+            oldest = next(iter(self._memory))
+            self._memory.pop(oldest)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._memory),
+                "bytes": self._memory_bytes(),
+                "max_bytes": self.max_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """Process-wide result cache, memory tier sized by PIXELOFF_RESULT_CACHE_MB (default 64)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
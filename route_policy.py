@@ -0,0 +1,176 @@
+import os
+import threading
+from urllib.parse import urlparse
+
+# Nothing here is needed to submit a relay form and read the result links
+BLOCKED_RESOURCE_TYPES = ("image", "media", "font")
+
+BLOCKED_DOMAINS = (
+    "googletagmanager.com", "google-analytics.com", "analytics.google.com",
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com", "adservice.google.com",
+    "connect.facebook.net", "hotjar.com", "clarity.ms", "mc.yandex.ru", "yandex.ru",
+    "amazon-adsystem.com", "adnxs.com", "criteo.com", "criteo.net", "taboola.com", "outbrain.com",
+    "pubmatic.com", "rubiconproject.com", "scorecardresearch.com", "quantserve.com",
+    "cloudflareinsights.com", "propellerads.com", "popads.net", "onclickads.net", "disqus.com",
+)
+
+# Scripts the forms really need (captcha/anti-bot challenges) always pass.
+# Entries are "host" or "host/path-prefix"; a host also covers its subdomains.
+COMMON_ALLOW = ("challenges.cloudflare.com", "www.google.com/recaptcha", "www.gstatic.com/recaptcha")
+RELAY_ALLOWLISTS = {
+    "sssinstagram": ("sssinstagram.com",),
+    "fastdl": ("fastdl.app",),
+    "indown": ("indown.io",),
+    "savefree": ("savefree.app",),
+    "imginn": ("imginn.com",),
+}
+
+# Rough transfer sizes used to estimate what an aborted request would have cost
+TYPICAL_BYTES = {"image": 40_000, "media": 500_000, "font": 30_000, "script": 60_000, "stylesheet": 20_000}
+DEFAULT_BYTES = 10_000
+
+
+def _host_matches(host, domain):
+    return host == domain or host.endswith("." + domain)
+
+def _allowed(parsed, pattern):
+    """Matches an allowlist entry against the URL's host (and path prefix), never the query string."""
+    domain, _, prefix = pattern.partition("/")
+    return _host_matches(parsed.hostname or "", domain) and (parsed.path or "/").startswith("/" + prefix)
+
+def _env_list(name, default):
+    value = os.environ.get(name)
+    if value is None: return tuple(default)
+    return tuple(v.strip() for v in value.split(",") if v.strip())
+
+
+class RouteStats:
+    """Counters for one page: what was blocked, what it would have cost, what was loaded."""
+
+    def __init__(self):
+        self.blocked = 0
+        self.allowed = 0
+        self.blocked_by_type = {}
+        self.est_bytes_saved = 0
+        self.bytes_loaded = 0
+
+    def as_dict(self):
+        return {
+            "blocked": self.blocked,
+            "allowed": self.allowed,
+            "blocked_by_type": dict(self.blocked_by_type),
+            "est_bytes_saved": self.est_bytes_saved,
+            "bytes_loaded": self.bytes_loaded,
+        }
+
+
+class RoutePolicy:
+    """
+    page.route policy: aborts requests by resource type and domain blocklist,
+    except URLs matching the allowlist. Configure with PIXELOFF_BLOCK_RESOURCES,
+    PIXELOFF_BLOCK_DOMAINS (extra domains) or PIXELOFF_ROUTE_POLICY=off.
+    """
+
+    def __init__(self, blocked_types=None, blocked_domains=None, allow=()):
+        self.blocked_types = frozenset(blocked_types if blocked_types is not None else _env_list("PIXELOFF_BLOCK_RESOURCES", BLOCKED_RESOURCE_TYPES))
+        self.blocked_domains = tuple(blocked_domains if blocked_domains is not None else BLOCKED_DOMAINS + _env_list("PIXELOFF_BLOCK_DOMAINS", ()))
+        self.allow = tuple(allow) + COMMON_ALLOW
+
+    def should_block(self, url, resource_type):
+        parsed = urlparse(url)
+        if any(_allowed(parsed, pattern) for pattern in self.allow):
+            # Allowlisted hosts still skip pure media; their scripts and documents pass
+            return resource_type in self.blocked_types and resource_type != "script"
+        if resource_type in self.blocked_types:
+            return True
+        host = parsed.hostname or ""
+        return any(_host_matches(host, domain) for domain in self.blocked_domains)
+
+    def _decide(self, request, stats):
+        resource_type = request.resource_type
+        if self.should_block(request.url, resource_type):
+            stats.blocked += 1
+            stats.blocked_by_type[resource_type] = stats.blocked_by_type.get(resource_type, 0) + 1
+            stats.est_bytes_saved += TYPICAL_BYTES.get(resource_type, DEFAULT_BYTES)
+            return False
+        stats.allowed += 1
+        return True
+
+    @staticmethod
+    def _count_response(response, stats):
+        try: stats.bytes_loaded += int(response.headers.get("content-length", 0))
+        except Exception: pass
+
+    def install(self, page):
+        """Installs the policy on a sync Playwright page; returns its live RouteStats."""
+        stats = RouteStats()
+
+        def _handle(route):
+            if self._decide(route.request, stats): route.continue_()
+            else: route.abort()
+
+        page.route("**/*", _handle)
+        page.on("response", lambda response: self._count_response(response, stats))
+        return stats
+
+    async def install_async(self, page):
+        """Async counterpart of install()."""
+        stats = RouteStats()
+
+        async def _handle(route):
+            if self._decide(route.request, stats): await route.continue_()
+            else: await route.abort()
+
+        await page.route("**/*", _handle)
+        page.on("response", lambda response: self._count_response(response, stats))
+        return stats
+
+
+def policy_for(relay):
+    return RoutePolicy(allow=RELAY_ALLOWLISTS.get(relay, ()))
+
+def _enabled():
+    return os.environ.get("PIXELOFF_ROUTE_POLICY", "on").lower() not in ("0", "off", "false")
+
+
+# --- Per-fetch reporting ---
+_totals = {}
+_totals_lock = threading.Lock()
+
+def _report(relay, stats):
+    summary = stats.as_dict()
+    with _totals_lock:
+        total = _totals.setdefault(relay, {"fetches": 0, "blocked": 0, "est_bytes_saved": 0, "bytes_loaded": 0})
+        total["fetches"] += 1
+        total["blocked"] += stats.blocked
+        total["est_bytes_saved"] += stats.est_bytes_saved
+        total["bytes_loaded"] += stats.bytes_loaded
+        total["last"] = summary
+    print(f"[Route] {relay}: blocked {stats.blocked} requests (~{stats.est_bytes_saved / 2**20:.1f} MB saved), loaded {stats.bytes_loaded / 2**20:.1f} MB")
+
+def route_stats():
+    """Aggregated savings per relay since process start (last fetch under 'last')."""
+    with _totals_lock:
+        return {relay: dict(total) for relay, total in _totals.items()}
+
+def routed(relay, fn):
+    """Wraps a sync fn(page) so the relay's route policy is installed first and reported after."""
+    def _run(page):
+        if not _enabled(): return fn(page)
+        stats = policy_for(relay).install(page)
+        try:
+            return fn(page)
+        finally:
+            _report(relay, stats)
+    return _run
+
+def routed_async(relay, fn):
+    """Async counterpart of routed()."""
+    async def _run(page):
+        if not _enabled(): return await fn(page)
+        stats = await policy_for(relay).install_async(page)
+        try:
+            return await fn(page)
+        finally:
+            _report(relay, stats)
+    return _run
@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from tracing import span
+
+# Resident size assumed for a session when it cannot be measured (ONNX weights + arena)
+DEFAULT_SESSION_MB = 400
+
+
+def _rss_bytes():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return None
+
+
+class SessionCache:
+    """
+    LRU cache of rembg/ONNX sessions under a memory ceiling. Each model is
+    created once even when several threads ask for it at the same time
+    (single-flight). Before a model loads, least recently used sessions are
+    dropped until its estimated size fits (see estimate()), so the old and
+    new sessions are never resident together over max_bytes; the estimate is
+    corrected after the load. The most recent session is always kept, even
+    if it alone exceeds the ceiling.
+    """
+
+    def __init__(self, max_bytes=None, loader=None):
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("PIXELOFF_SESSION_CACHE_MB", "1024")) * 2**20)
+        self.max_bytes = max_bytes
+        self._loader = loader or self._new_session
+        self._sessions = OrderedDict()  # model_name -> (session, size_bytes)
+        self._loading = {}  # model_name -> Event set when the load finishes
+        self._reserved = {}  # model_name -> estimated bytes of a load in progress
+        self._measured = {}  # model_name -> bytes the last load of it took
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped by discard(); loads started before it are not cached
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = {}
+
+    @staticmethod
+    def _new_session(model_name):
+        from rembg import new_session
+        return new_session(model_name)
+
+    def get(self, model_name):
+        """Returns the session for model_name, loading it on first use."""
+        while True:
+            with self._lock:
+                if model_name in self._sessions:
+                    self._sessions.move_to_end(model_name)
+                    self.hits += 1
+                    return self._sessions[model_name][0]
+                pending = self._loading.get(model_name)
+                if pending is None:
+                    pending = self._loading[model_name] = threading.Event()
+                    generation = self._generation
+                    self.misses += 1
+                    # Make room first: evicting only after the load would briefly hold old + new
+                    self._reserved[model_name] = self.estimate(model_name)
+                    self._evict(keep=None)
+                    break
+            # Another thread is loading this model: wait for it, then re-check
+            pending.wait()
+
+        try:
+            session, size = self._load(model_name)
+            with self._lock:
+                self._reserved.pop(model_name, None)  # The measured size replaces the estimate
+                # A discard() during the load means the files may be gone: hand it out once, don't keep it
+                if generation == self._generation:
+                    self._sessions[model_name] = (session, size)
+                    self._evict(keep=model_name)
+            return session
+        finally:
+            with self._lock:
+                self._reserved.pop(model_name, None)
+                if self._loading.get(model_name) is pending:
+                    self._loading.pop(model_name)
+            pending.set()
+
+    def _load(self, model_name):
+        print(f"[SessionCache] Loading model: {model_name}")
+        with span("model.load", model=model_name) as s:
+            rss_before = _rss_bytes()
+            started = time.monotonic()
+            session = self._loader(model_name)
+            self.load_seconds[model_name] = round(time.monotonic() - started, 3)
+            rss_after = _rss_bytes()
+
+            # RSS growth is only a rough figure (other threads allocate too), so never go below a floor
+            size = DEFAULT_SESSION_MB * 2**20
+            if rss_before is not None and rss_after is not None and rss_after > rss_before:
+                size = max(rss_after - rss_before, 50 * 2**20)
+            s.set(bytes=size)
+        self._measured[model_name] = size
+        print(f"[SessionCache] {model_name} ready in {self.load_seconds[model_name]}s (~{size / 2**20:.0f} MB)")
+        return session, size
+
+    def estimate(self, model_name):
+        """
+        Bytes a session of model_name is expected to take: what its last load
+        measured, else twice its .onnx file (weights + runtime arena), else
+        DEFAULT_SESSION_MB.
+        """
+        if model_name in self._measured:
+            return self._measured[model_name]
+        try:
+            from models import model_path
+            return 2 * os.path.getsize(model_path(model_name))
+        except (KeyError, OSError):
+            return DEFAULT_SESSION_MB * 2**20
+
+    def _evict(self, keep):
+        """Drops LRU sessions (never `keep`) while resident + loading sessions exceed max_bytes."""
+        while self._total_bytes() + sum(self._reserved.values()) > self.max_bytes:
+            oldest = next((name for name in self._sessions if name != keep), None)
+            if oldest is None: break
+            self._sessions.pop(oldest)
+            self.evictions += 1
+            print(f"[SessionCache] Evicted {oldest} (memory ceiling {self.max_bytes / 2**20:.0f} MB)")
+
+    def _total_bytes(self):
+        return sum(size for _, size in self._sessions.values())
+
+    def discard(self, model_name=None):
+        """
+        Drops one model's session, or all of them. In-flight inferences keep
+        their reference; loads still running are handed to their callers but
+        not cached. Returns the dropped model names.
+        """
+        with self._lock:
+            self._generation += 1
+            dropped = [name for name in self._sessions if model_name is None or name == model_name]
+            for name in dropped:
+                self._sessions.pop(name)
+            if model_name is None: self._loading.clear()
+            else: self._loading.pop(model_name, None)
+            return dropped
+
+    def stats(self):
+        with self._lock:
+            return {
+                "models": list(self._sessions),
+                "bytes": self._total_bytes(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "load_seconds": dict(self.load_seconds),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_session_cache():
+    """Process-wide session cache, ceiling from PIXELOFF_SESSION_CACHE_MB (default 1024)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SessionCache()
+        return _cache
+
+def get_session(model_name):
+    return get_session_cache().get(model_name)
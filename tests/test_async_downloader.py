@@ -0,0 +1,77 @@
+import asyncio
+
+import playwright.async_api
+
+from async_downloader import AsyncBrowserPool
+
+
+class _Context:
+    def __init__(self, browser):
+        self.browser = browser
+
+    async def new_page(self):
+        return self
+
+    async def close(self):
+        self.browser.open -= 1
+
+
+class _Browser:
+    def __init__(self, log):
+        self.open = 0
+        self.contexts = 0
+        self.closed = False
+        log.append(self)
+
+    def is_connected(self):
+        return not self.closed
+
+    async def new_context(self, **options):
+        assert not self.closed
+        self.open += 1
+        self.contexts += 1
+        self.peak = max(getattr(self, "peak", 0), self.open)
+        return _Context(self)
+
+    async def close(self):
+        assert self.open == 0, "browser closed with contexts still open"
+        self.closed = True
+
+
+class _Playwright:
+    def __init__(self, log):
+        self.chromium = self
+        self.log = log
+
+    async def launch(self, **options):
+        return _Browser(self.log)
+
+    async def start(self):
+        return self
+
+    async def stop(self):
+        pass
+
+
+def test_contexts_per_browser_and_recycling_under_load(monkeypatch):
+    launched = []
+    monkeypatch.setattr(playwright.async_api, "async_playwright", lambda: _Playwright(launched))
+
+    async def _main():
+        pool = AsyncBrowserPool(browsers=2, contexts_per_browser=2, max_uses=3)
+
+        async def _job(page):
+            await asyncio.sleep(0.01)
+            return page.browser
+
+        try:
+            await asyncio.gather(*[pool.run(_job) for _ in range(24)])
+            return pool.stats()
+        finally:
+            await pool.close()
+
+    stats = asyncio.run(_main())
+
+    assert all(browser.peak <= 2 for browser in launched)
+    assert all(browser.contexts <= 3 for browser in launched)
+    assert stats["recycles"] > 0 and stats["launches"] == len(launched) >= 8
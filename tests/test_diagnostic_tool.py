@@ -0,0 +1,25 @@
+import time
+
+from diagnostic_tool import SystemDiagnostics, browser_health
+
+
+def test_browser_check_timeout_is_reported_as_failure(monkeypatch):
+    monkeypatch.setattr(SystemDiagnostics, "check_browser", lambda self: time.sleep(2) or {"Launch Test": "✅ Success!"})
+    monkeypatch.setattr(SystemDiagnostics, "check_network", lambda self: {})
+
+    started = time.monotonic()
+    results = SystemDiagnostics(deadline=0.3).run_all()
+
+    assert time.monotonic() - started < 1.5
+    assert "Timed out" in results["Browser Check"]["Error"]
+    ok, detail = browser_health(results)
+    assert not ok
+    assert "Timed out" in detail
+
+
+def test_browser_health():
+    assert browser_health({"Browser Check": {"Launch Test": "✅ Success! Title: x (10ms)"}})[0]
+    assert not browser_health({"Browser Check": {"Launch Test": "❌ Failed: boom"}})[0]
+    assert not browser_health({"Browser Check": {"Ref": "✅ Chromium found: chromium-1"}})[0]
+    assert not browser_health({"Browser Check": {"Error": "crashed"}})[0]
+    assert not browser_health({})[0]
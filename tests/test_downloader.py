@@ -0,0 +1,42 @@
+import time
+
+from downloader import OUT_OF_RANGE, _run_race, _run_sequential
+
+
+def _relay(delay, result):
+    def _attempt(token):
+        end = time.monotonic() + delay
+        while time.monotonic() < end and not token.cancelled:
+            time.sleep(0.01)
+        return result if not token.cancelled else (None, "Cancelled")
+    return _attempt
+
+
+def test_race_returns_first_file_and_cancels_the_rest():
+    methods = [(_relay(1.0, ("slow.jpg", "Slow")), "Slow"), (_relay(0.05, ("fast.jpg", "Fast")), "Fast")]
+    path, status, errors = _run_race(methods, 2, time.monotonic() + 5)
+    assert (path, status) == ("fast.jpg", "Fast")
+    assert errors and errors[0].startswith("[Slow] Cancelled") and "Fast answered first" in errors[0]
+
+
+def test_out_of_range_ends_the_race_without_trying_other_relays():
+    calls = []
+    def _short(token):
+        calls.append("short")
+        return None, f"{OUT_OF_RANGE}: slide 3 requested, post has 1 (A)"
+    def _other(token):
+        calls.append("other")
+        return "x.jpg", "B"
+    for engine in (lambda m: _run_race(m, 1, time.monotonic() + 5), lambda m: _run_sequential(m, time.monotonic() + 5)):
+        calls.clear()
+        path, status, _ = engine([(_short, "A"), (_other, "B")])
+        assert path is None and status.startswith(OUT_OF_RANGE)
+        assert calls == ["short"]
+
+
+def test_deadline_reports_running_and_skipped_relays():
+    methods = [(_relay(2.0, (None, "late")), name) for name in ("A", "B", "C")]
+    path, status, errors = _run_race(methods, 2, time.monotonic() + 0.2)
+    assert path is None and status is None
+    assert any(e.startswith("[A] Cancelled") for e in errors)
+    assert "[C] Skipped: request deadline reached" in errors
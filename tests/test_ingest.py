@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+
+import ingest
+
+STAMP = "2025-01-01_10-00-00_UTC"
+
+
+@pytest.fixture
+def archive(tmp_path):
+    for shortcode in ("AAA", "BBB"):
+        post = tmp_path / shortcode
+        post.mkdir()
+        (post / f"{STAMP}_1.jpg").write_bytes(b"1" + shortcode.encode())
+        (post / f"{STAMP}_2.jpg").write_bytes(b"2" + shortcode.encode())
+        (post / f"{STAMP}.mp4").write_bytes(b"video")
+    (tmp_path / "AAA" / f"{STAMP}.txt").write_text("caption AAA", encoding="utf-8")
+    return tmp_path
+
+
+@pytest.fixture
+def removals(monkeypatch):
+    import processor
+
+    calls = []
+    def _remove(input_path, output_path=None, **options):
+        calls.append(input_path)
+        with open(output_path, "wb") as f:
+            f.write(b"png")
+        return output_path, None
+    monkeypatch.setattr(processor, "remove_background", _remove)
+    return calls
+
+
+def test_scan_pairs_slides_with_captions(archive):
+    images, skipped = ingest.scan(str(archive))
+    assert skipped == 2
+    assert [(img.shortcode, img.slide, img.caption) for img in images] == [
+        ("AAA", 1, "caption AAA"), ("AAA", 2, "caption AAA"), ("BBB", 1, None), ("BBB", 2, None)]
+
+
+def test_unreadable_caption_is_skipped(archive, capsys):
+    # A dangling symlink: listed like a file, fails to open
+    os.symlink(str(archive / "missing.txt"), str(archive / "BBB" / f"{STAMP}.txt"))
+    images, _ = ingest.scan(str(archive))
+    assert [img.caption for img in images if img.shortcode == "BBB"] == [None, None]
+    assert [img.caption for img in images if img.shortcode == "AAA"] == ["caption AAA"] * 2
+    assert "unreadable caption" in capsys.readouterr().out
+
+
+def test_rerun_processes_only_changed_images(archive, removals):
+    assert ingest.ingest(str(archive)) == (4, 0, 0)
+    removals.clear()
+    assert ingest.ingest(str(archive)) == (0, 0, 4)
+    assert removals == []
+
+    (archive / "BBB" / f"{STAMP}_2.jpg").write_bytes(b"changed")
+    assert ingest.ingest(str(archive)) == (1, 0, 3)
+    assert removals == [str(archive / "BBB" / f"{STAMP}_2.jpg")]
+
+
+@pytest.mark.parametrize("content", ["{not json", "[1, 2]", '{"images": {"AAA/x.jpg": "oops"}}'])
+def test_corrupt_manifest_starts_fresh(archive, removals, content):
+    manifest = archive / "_nobg" / ingest.MANIFEST_NAME
+    manifest.parent.mkdir()
+    manifest.write_text(content, encoding="utf-8")
+    assert ingest.ingest(str(archive)) == (4, 0, 0)
+    assert len(json.loads(manifest.read_text(encoding="utf-8"))["images"]) == 4
@@ -0,0 +1,21 @@
+import jobs
+
+
+class _Executor:
+    def __init__(self):
+        self.keys = []
+
+    def submit(self, key, fn, kind="job"):
+        self.keys.append(key)
+        return key
+
+
+def test_pipeline_key_includes_target_dir(monkeypatch, tmp_path):
+    executor = _Executor()
+    monkeypatch.setattr(jobs, "get_executor", lambda: executor)
+    url = "https://www.instagram.com/p/ABC123/"
+    jobs.submit_pipeline(url, target_dir=str(tmp_path / "a"))
+    jobs.submit_pipeline(url, target_dir=str(tmp_path / "b"))
+    jobs.submit_pipeline(url, target_dir=str(tmp_path / "a" / ".." / "a"))
+    assert executor.keys[0] != executor.keys[1]
+    assert executor.keys[0] == executor.keys[2]
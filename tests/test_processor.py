@@ -0,0 +1,68 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+import processor
+
+
+class _Input:
+    name = "input"
+    shape = [1, 3, 1024, 1024]
+
+
+class _InnerSession:
+    """Predicts "foreground" for the left half of whatever it is given."""
+
+    def get_inputs(self):
+        return [_Input()]
+
+    def run(self, outputs, feed):
+        batch, _, height, width = feed["input"].shape
+        preds = np.zeros((batch, 1, height, width), dtype=np.float32)
+        preds[..., : width // 2] = 1.0
+        return [preds]
+
+
+class _Session:
+    inner_session = _InnerSession()
+
+
+def _source(path, mode="RGB", size=(1200, 800)):
+    img = Image.new(mode, size, (200, 100, 50) + ((255,) if mode == "RGBA" else ()))
+    if mode == "RGBA":
+        # Top quarter already transparent in the source
+        img.paste((200, 100, 50, 0), (0, 0, size[0], size[1] // 4))
+    img.save(path)
+    return img
+
+
+def test_max_side_caps_only_the_model_copy(tmp_path):
+    _source(tmp_path / "in.png")
+    output, error, report = processor.remove_background_lowres(
+        str(tmp_path / "in.png"), str(tmp_path / "out.png"), max_side=300, session=_Session())
+
+    assert error is None
+    with Image.open(output) as result:
+        assert result.size == (1200, 800)
+        alpha = np.asarray(result.getchannel("A"))
+    assert alpha[400, 100] == 255 and alpha[400, 1100] == 0
+
+
+def test_working_copy_is_capped():
+    img = Image.new("RGBA", (1200, 800))
+    working = processor._working_copy(img, max_side=300)
+    assert working.size == (300, 200) and working.mode == "RGB"
+    assert img.size == (1200, 800)
+
+
+def test_source_alpha_is_kept(tmp_path):
+    _source(tmp_path / "in.png", mode="RGBA")
+    data, error = processor.remove_background_bytes((tmp_path / "in.png").read_bytes(), max_side=300, session=_Session())
+
+    assert error is None
+    with Image.open(io.BytesIO(data)) as result:
+        assert result.size == (1200, 800)
+        alpha = np.asarray(result.getchannel("A"))
+    assert alpha[50, 100] == 0  # transparent in the source, foreground for the model
+    assert alpha[400, 100] == 255
@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("rembg")
+import rembg.sessions.base as rembg_base
+
+import processor_pool
+
+
+class _RecordingInferenceSession:
+    def __init__(self, path, sess_options=None, providers=None, **kwargs):
+        self.sess_options = sess_options
+
+    def get_session_options(self):
+        return self.sess_options
+
+
+def test_worker_session_uses_requested_thread_counts(monkeypatch):
+    from rembg.sessions import sessions_class
+
+    session_class = next(sc for sc in sessions_class if sc.name() == "isnet-general-use")
+    # No model download: the real session class runs, only onnxruntime's loader is replaced
+    monkeypatch.setattr(session_class, "download_models", classmethod(lambda cls, *a, **k: "model.onnx"))
+    monkeypatch.setattr(rembg_base.ort, "InferenceSession", _RecordingInferenceSession)
+
+    session = processor_pool._make_session("isnet-general-use", intra_threads=3, inter_threads=2)
+
+    opts = session.inner_session.get_session_options()
+    assert opts.intra_op_num_threads == 3
+    assert opts.inter_op_num_threads == 2
+
+
+def test_unknown_model_is_an_error():
+    with pytest.raises(ValueError):
+        processor_pool._make_session("no-such-model", 1, 1)
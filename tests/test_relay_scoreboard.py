@@ -0,0 +1,46 @@
+import json
+import threading
+
+from relay_scoreboard import RelayScoreboard
+
+
+def test_records_are_saved_at_most_once_per_interval(tmp_path, monkeypatch):
+    board = RelayScoreboard(path=str(tmp_path / "board.json"), save_interval=3600)
+    writes = []
+    real_write = board._write
+    monkeypatch.setattr(board, "_write", lambda data: writes.append(data) or real_write(data))
+
+    for _ in range(50):
+        board.record("fastdl", True, 1.0)
+    assert writes == []
+
+    board.flush()
+    assert len(writes) == 1
+    assert json.loads((tmp_path / "board.json").read_text())["fastdl"]["successes"] > 49
+    board.flush()
+    assert len(writes) == 1  # Nothing changed since
+
+
+def test_zero_interval_saves_every_change(tmp_path):
+    board = RelayScoreboard(path=str(tmp_path / "board.json"), save_interval=0)
+    board.record("indown", False, 2.0, "timeout")
+    assert json.loads((tmp_path / "board.json").read_text())["indown"]["last_failure"] == "timeout"
+
+
+def test_snapshot_while_recording(tmp_path):
+    board = RelayScoreboard(path=str(tmp_path / "board.json"), save_interval=3600)
+    stop = threading.Event()
+
+    def _record():
+        while not stop.is_set():
+            board.record("relay-%d" % threading.get_ident(), False, 0.1, "error")
+
+    threads = [threading.Thread(target=_record) for _ in range(4)]
+    for t in threads: t.start()
+    try:
+        for _ in range(200):
+            board.snapshot()  # used to iterate the live dicts without the lock
+    finally:
+        stop.set()
+        for t in threads: t.join()
+    assert len(board.snapshot()) == 4
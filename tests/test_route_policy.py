@@ -0,0 +1,26 @@
+from route_policy import RoutePolicy, policy_for
+
+
+def test_allowlisted_name_in_query_does_not_unblock_a_tracker():
+    policy = policy_for("sssinstagram")
+    assert policy.should_block("https://www.googletagmanager.com/gtm.js?ref=sssinstagram.com", "script")
+    assert policy.should_block("https://ads.doubleclick.net/sssinstagram.com/pixel", "xhr")
+
+
+def test_allowlisted_hosts_and_subdomains_pass():
+    policy = policy_for("sssinstagram")
+    assert not policy.should_block("https://sssinstagram.com/en", "document")
+    assert not policy.should_block("https://api.sssinstagram.com/request", "xhr")
+    assert policy.should_block("https://sssinstagram.com/logo.png", "image")
+
+
+def test_lookalike_host_is_not_allowlisted():
+    policy = RoutePolicy(blocked_domains=("evil-sssinstagram.com",), allow=("sssinstagram.com",))
+    assert policy.should_block("https://evil-sssinstagram.com/tag.js", "script")
+
+
+def test_path_scoped_allow_entries():
+    policy = policy_for("fastdl")
+    assert not policy.should_block("https://www.google.com/recaptcha/api.js", "script")
+    assert policy.should_block("https://www.google.com/recaptcha/logo.png", "image")
+    assert policy.should_block("https://www.googletagmanager.com/gtm.js?u=www.google.com/recaptcha", "script")
@@ -0,0 +1,45 @@
+from session_cache import SessionCache
+
+MB = 2**20
+
+
+def test_old_sessions_are_evicted_before_the_new_one_loads(monkeypatch):
+    cache = SessionCache(max_bytes=500 * MB, loader=lambda name: object())
+    resident_during_load = []
+    real_load = cache._load
+
+    def _load(model_name):
+        resident_during_load.append(list(cache._sessions))
+        session, _ = real_load(model_name)
+        return session, 300 * MB
+
+    monkeypatch.setattr(cache, "_load", _load)
+    monkeypatch.setattr(cache, "estimate", lambda name: 300 * MB)
+
+    cache.get("a")
+    cache.get("b")  # 300 + 300 > 500: "a" must go before "b" loads
+
+    assert resident_during_load == [[], []]
+    assert cache.stats()["models"] == ["b"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_sessions_that_fit_stay(monkeypatch):
+    cache = SessionCache(max_bytes=1000 * MB, loader=lambda name: object())
+    monkeypatch.setattr(cache, "estimate", lambda name: 300 * MB)
+    monkeypatch.setattr(SessionCache, "_load", lambda self, name: (object(), 300 * MB))
+
+    cache.get("a")
+    cache.get("b")
+    first = cache.get("a")
+
+    assert cache.stats()["models"] == ["b", "a"]
+    assert cache.get("a") is first
+    assert cache.stats()["evictions"] == 0
+
+
+def test_estimate_uses_the_last_measured_size(monkeypatch):
+    cache = SessionCache(max_bytes=1000 * MB, loader=lambda name: object())
+    cache._measured["u2net_human_seg"] = 123 * MB
+    assert cache.estimate("u2net_human_seg") == 123 * MB
+    assert cache.estimate("not-a-model") > 0
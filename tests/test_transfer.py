@@ -0,0 +1,36 @@
+import transfer
+
+
+class _ShortResponse:
+    status_code = 200
+    headers = {"Content-Length": "10"}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, size):
+        yield b"12345"
+
+
+class _Session:
+    def get(self, url, **kwargs):
+        return _ShortResponse()
+
+
+def test_short_reads_pause_before_retrying(tmp_path, monkeypatch):
+    pauses = []
+    monkeypatch.setattr(transfer, "get_session", lambda: _Session())
+    monkeypatch.setattr(transfer, "_pace", lambda host: None)
+    monkeypatch.setattr(transfer, "_retry_pause", lambda attempt, retries: pauses.append(attempt))
+
+    data, error = transfer._fetch_bytes("https://cdn.example/a.jpg", None, 5, retries=2)
+    assert data is None and "interrupted" in error
+    assert pauses == [0, 1, 2]
+
+    pauses.clear()
+    path, error = transfer._fetch_to_file("https://cdn.example/b.jpg", str(tmp_path / "b.jpg"), None, 5, 2)
+    assert path is None and "interrupted" in error
+    assert pauses == [0, 1, 2]
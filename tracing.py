@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import itertools
+import threading
+import functools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# Histogram buckets for span durations (ms)
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+_current = contextvars.ContextVar("pixeloff_span", default=None)
+_ids = itertools.count(1)
+
+
+class Span:
+    """One timed stage. attrs carry relay, shortcode, slide, model, bytes... as available."""
+
+    __slots__ = ("name", "span_id", "parent_id", "trace_id", "start", "duration_ms", "attrs", "error")
+
+    def __init__(self, name, parent, attrs):
+        self.name = name
+        self.span_id = f"{os.getpid():x}-{next(_ids):x}"
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.start = time.time()
+        self.duration_ms = None
+        self.attrs = attrs
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def fail(self, error):
+        self.error = str(error)
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": round(self.start, 6),
+            "duration_ms": self.duration_ms,
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    def set(self, **attrs): pass
+    def fail(self, error): pass
+
+_NOOP = _NoopSpan()
+
+
+class Tracer:
+    """
+    Collects finished spans: a bounded buffer of recent spans (PIXELOFF_TRACE_BUFFER)
+    plus running per-name histograms that never lose data. With PIXELOFF_TRACE_FILE
+    set, every span is also appended to that JSON Lines file.
+    """
+
+    def __init__(self, capacity=None, sink_path=None):
+        self.enabled = os.environ.get("PIXELOFF_TRACING", "on").lower() not in ("0", "off", "false")
+        self.sink_path = sink_path if sink_path is not None else os.environ.get("PIXELOFF_TRACE_FILE")
+        self._spans = deque(maxlen=int(capacity or os.environ.get("PIXELOFF_TRACE_BUFFER", "5000")))
+        self._histograms = {}  # name -> {"buckets": [...], "count", "sum_ms", "errors", "bytes"}
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            self._spans.append(span)
+            hist = self._histograms.get(span.name)
+            if hist is None:
+                hist = self._histograms[span.name] = {"buckets": [0] * len(BUCKETS_MS), "count": 0, "sum_ms": 0.0, "errors": 0, "bytes": 0}
+            for i, bound in enumerate(BUCKETS_MS):
+                if span.duration_ms <= bound:
+                    hist["buckets"][i] += 1
+                    break
+            hist["count"] += 1
+            hist["sum_ms"] += span.duration_ms
+            if span.error: hist["errors"] += 1
+            if isinstance(span.attrs.get("bytes"), int): hist["bytes"] += span.attrs["bytes"]
+            if self.sink_path:
+                try:
+                    with open(self.sink_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(span.as_dict(), default=str) + "\n")
+                except OSError:
+                    pass
+
+    def spans(self, name=None):
+        with self._lock:
+            return [s.as_dict() for s in self._spans if name is None or s.name == name]
+
+    def jsonl(self):
+        """Recent spans as JSON Lines text."""
+        return "".join(json.dumps(s, default=str) + "\n" for s in self.spans())
+
+    def export_jsonl(self, path):
+        """Writes recent spans to path; returns how many."""
+        spans = self.spans()
+        with open(path, "w", encoding="utf-8") as f:
+            for s in spans:
+                f.write(json.dumps(s, default=str) + "\n")
+        return len(spans)
+
+    def prometheus_text(self):
+        """Histogram snapshot in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = {name: dict(h, buckets=list(h["buckets"])) for name, h in self._histograms.items()}
+        lines = [
+            "# HELP pixeloff_span_duration_seconds Duration of traced download/processing stages.",
+            "# TYPE pixeloff_span_duration_seconds histogram",
+        ]
+        for name, hist in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS_MS, hist["buckets"]):
+                cumulative += count
+                lines.append(f'pixeloff_span_duration_seconds_bucket{{span="{name}",le="{bound / 1000:g}"}} {cumulative}')
+            lines.append(f'pixeloff_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {hist["count"]}')
+            lines.append(f'pixeloff_span_duration_seconds_sum{{span="{name}"}} {hist["sum_ms"] / 1000:.6f}')
+            lines.append(f'pixeloff_span_duration_seconds_count{{span="{name}"}} {hist["count"]}')
+        lines += ["# HELP pixeloff_span_errors_total Spans that ended with an error.", "# TYPE pixeloff_span_errors_total counter"]
+        lines += [f'pixeloff_span_errors_total{{span="{name}"}} {h["errors"]}' for name, h in sorted(histograms.items())]
+        lines += ["# HELP pixeloff_span_bytes_total Bytes reported by spans (transfers, encodings).", "# TYPE pixeloff_span_bytes_total counter"]
+        lines += [f'pixeloff_span_bytes_total{{span="{name}"}} {h["bytes"]}' for name, h in sorted(histograms.items()) if h["bytes"]]
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Per span name: count, errors, mean and p50/p95 (from recent spans)."""
+        with self._lock:
+            recent = {}
+            for s in self._spans:
+                recent.setdefault(s.name, []).append(s.duration_ms)
+            histograms = {name: dict(h) for name, h in self._histograms.items()}
+        rows = []
+        for name, hist in sorted(histograms.items()):
+            durations = sorted(recent.get(name, []))
+            pick = lambda pct: round(durations[min(len(durations) - 1, int(len(durations) * pct))], 1) if durations else None
+            rows.append({
+                "span": name,
+                "count": hist["count"],
+                "errors": hist["errors"],
+                "mean_ms": round(hist["sum_ms"] / hist["count"], 1),
+                "p50_ms": pick(0.5),
+                "p95_ms": pick(0.95),
+            })
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._histograms.clear()
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+def get_tracer():
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
+
+
+@contextmanager
+def span(name, **attrs):
+    """Times the block as a child of the current span. Yields the span (set()/fail() to annotate)."""
+    tracer = get_tracer()
+    if not tracer.enabled:
+        yield _NOOP
+        return
+    current = Span(name, _current.get(), attrs)
+    token = _current.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        if current.error is None: current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration_ms = round((time.perf_counter() - started) * 1000, 3)
+        _current.reset(token)
+        tracer.record(current)
+
+def annotate(**attrs):
+    """Adds attributes to the current span, if any."""
+    current = _current.get()
+    if current is not None: current.set(**attrs)
+
+def traced(name, **attrs):
+    """Decorator form of span()."""
+    def _decorate(fn):
+        @functools.wraps(fn)
+        def _wrapper(*args, **kwargs):
+            with span(name, **attrs):
+                return fn(*args, **kwargs)
+        return _wrapper
+    return _decorate
+
+def bind(fn):
+    """Carries the current span into another thread (executor jobs, browser worker threads)."""
+    context = contextvars.copy_context()
+    @functools.wraps(fn)
+    def _run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return _run
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import span
+from rate_limiter import get_scheduler, parse_retry_after, backoff_delay, RATE_LIMIT_STATUSES
+
+# Standard headers
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+
+CHUNK_SIZE = 64 * 1024
+TRANSFER_WORKERS = int(os.environ.get("PIXELOFF_TRANSFER_WORKERS", "4"))
+# A CDN cooldown up to this long is slept out inline; longer ones fail the transfer
+CDN_MAX_WAIT = float(os.environ.get("PIXELOFF_CDN_MAX_WAIT", "10"))
+
+_session = None
+_executor = None
+_init_lock = threading.Lock()
+# Striped per-path locks: a fixed set, so a long-running process doesn't keep one lock per file ever written
+PATH_LOCK_STRIPES = 64
+_path_locks = [threading.Lock() for _ in range(PATH_LOCK_STRIPES)]
+
+def get_session():
+    """
+    Process-wide requests.Session. urllib3 keeps one keep-alive pool per CDN
+    host, so TCP/TLS setup is paid once per host instead of once per slide.
+    """
+    global _session
+    with _init_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(4, TRANSFER_WORKERS * 2))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(DEFAULT_HEADERS)
+            _session = session
+        return _session
+
+def get_executor():
+    """Bounded thread pool shared by all parallel transfers."""
+    global _executor
+    with _init_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, TRANSFER_WORKERS), thread_name_prefix="pixeloff-transfer")
+        return _executor
+
+def _lock_for(path):
+    """Same path -> same lock; unrelated paths rarely share one (and then just take turns)."""
+    return _path_locks[hash(os.path.abspath(path)) % PATH_LOCK_STRIPES]
+
+def _read_part_meta(meta_path):
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _write_part_meta(meta_path, meta):
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+def _pace(host):
+    """Waits for the host's token bucket (and a short cooldown); returns an error string if it must not be hit now."""
+    ready, reason = get_scheduler().wait(host, kind="cdn", max_cooldown=CDN_MAX_WAIT)
+    return None if ready else f"Rate limited: {reason}"
+
+def _throttled(host, res):
+    """Starts the host's cooldown for a 429/503 response; returns the error string."""
+    delay = get_scheduler().penalize(host, res.status_code, parse_retry_after(res.headers.get("Retry-After")), kind="cdn")
+    return f"HTTP {res.status_code} on Clean download (cooling down {delay:.0f}s)"
+
+def _retry_pause(attempt, retries):
+    """Jittered exponential pause before retrying a failed connection (not after the last attempt)."""
+    if attempt < retries: time.sleep(backoff_delay(attempt + 1, 0.5, 4))
+
+def fetch_to_file(url, path, headers=None, timeout=20, retries=2):
+    with span("cdn.transfer", host=urlparse(url).hostname) as s:
+        path, error = _fetch_to_file(url, path, headers, timeout, retries)
+        if error: s.fail(error)
+        else: s.set(bytes=os.path.getsize(path))
+        return path, error
+
+def _fetch_to_file(url, path, headers, timeout, retries):
+    """
+    Streams url into path in CHUNK_SIZE pieces (memory stays flat) via
+    path + ".part" and an atomic rename. An interrupted transfer resumes
+    with an HTTP Range request, both on retry here and on a later call for
+    the same URL; If-Range makes the server resend the whole file if it changed.
+    Returns (path, None) or (None, error).
+    """
+    part_path = path + ".part"
+    meta_path = part_path + ".json"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    with _lock_for(path):
+        meta = _read_part_meta(meta_path)
+        if meta.get("url") != url:
+            # Leftover bytes belong to a different URL: start over
+            for stale in (part_path, meta_path):
+                try: os.unlink(stale)
+                except OSError: pass
+            meta = {"url": url}
+
+        host = urlparse(url).hostname
+        last_error = None
+        for attempt in range(retries + 1):
+            paced_error = _pace(host)
+            if paced_error: return None, paced_error
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            request_headers = dict(headers or {})
+            validator = meta.get("etag") or meta.get("last_modified")
+            if offset and validator:
+                request_headers["Range"] = f"bytes={offset}-"
+                request_headers["If-Range"] = validator
+            else:
+                offset = 0
+
+            try:
+                with get_session().get(url, headers=request_headers, timeout=timeout, stream=True) as res:
+                    if res.status_code == 416 and offset:
+                        # We already hold every byte
+                        break
+                    if res.status_code in RATE_LIMIT_STATUSES:
+                        # The next attempt's _pace() sleeps out a short cooldown
+                        last_error = _throttled(host, res)
+                        continue
+                    if res.status_code not in (200, 206):
+                        return None, f"HTTP {res.status_code} on Clean download"
+
+                    resumed = res.status_code == 206
+                    meta.update({
+                        "etag": res.headers.get("ETag"),
+                        "last_modified": res.headers.get("Last-Modified"),
+                    })
+                    _write_part_meta(meta_path, meta)
+
+                    expected = res.headers.get("Content-Length")
+                    expected = int(expected) + (offset if resumed else 0) if expected else None
+                    with open(part_path, "ab" if resumed else "wb") as f:
+                        for chunk in res.iter_content(CHUNK_SIZE):
+                            if chunk: f.write(chunk)
+
+                if expected is not None and os.path.getsize(part_path) < expected:
+                    last_error = f"Transfer interrupted at {os.path.getsize(part_path)}/{expected} bytes"
+                    _retry_pause(attempt, retries)
+                    continue
+                get_scheduler().success(host)
+                break
+            except Exception as e:
+                last_error = f"Download Error: {e}"
+                _retry_pause(attempt, retries)
+        else:
+            return None, last_error
+
+        os.replace(part_path, path)
+        try: os.unlink(meta_path)
+        except OSError: pass
+        return path, None
+
+def fetch_bytes(url, headers=None, timeout=20, retries=2):
+    """In-memory counterpart of fetch_to_file for small payloads. Returns (bytes, None) or (None, error)."""
+    with span("cdn.transfer", host=urlparse(url).hostname, in_memory=True) as s:
+        data, error = _fetch_bytes(url, headers, timeout, retries)
+        if error: s.fail(error)
+        else: s.set(bytes=len(data))
+        return data, error
+
+def _fetch_bytes(url, headers, timeout, retries):
+    host = urlparse(url).hostname
+    last_error = None
+    for attempt in range(retries + 1):
+        paced_error = _pace(host)
+        if paced_error: return None, paced_error
+        try:
+            with get_session().get(url, headers=headers or {}, timeout=timeout, stream=True) as res:
+                if res.status_code in RATE_LIMIT_STATUSES:
+                    last_error = _throttled(host, res)
+                    continue
+                if res.status_code != 200:
+                    return None, f"HTTP {res.status_code} on Clean download"
+                expected = res.headers.get("Content-Length")
+                data = b"".join(chunk for chunk in res.iter_content(CHUNK_SIZE) if chunk)
+            if expected and len(data) < int(expected):
+                last_error = f"Transfer interrupted at {len(data)}/{expected} bytes"
+                _retry_pause(attempt, retries)
+                continue
+            get_scheduler().success(host)
+            return data, None
+        except Exception as e:
+            last_error = f"Download Error: {e}"
+            _retry_pause(attempt, retries)
+    return None, last_error